@@ -1,10 +1,16 @@
+import asyncio
 from logging.config import fileConfig
 
-from sqlalchemy import engine_from_config
-from sqlalchemy import pool
+from sqlalchemy import pool, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import async_engine_from_config
 
 from alembic import context
 
+from app.config import settings
+from app.database import Base
+from app import models  # noqa: F401  (registers every table on Base.metadata)
+
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
 config = context.config
@@ -14,11 +20,15 @@ config = context.config
 if config.config_file_name is not None:
     fileConfig(config.config_file_name)
 
+# the app's DATABASE_URL wins over the placeholder in alembic.ini
+config.set_main_option("sqlalchemy.url", settings.DATABASE_URL.replace("%", "%%"))
+
 # add your model's MetaData object here
 # for 'autogenerate' support
-# from myapp import mymodel
-# target_metadata = mymodel.Base.metadata
-target_metadata = None
+target_metadata = Base.metadata
+
+# any fixed bigint; shared by every process running migrations
+MIGRATION_LOCK_KEY = 4_720_019_733
 
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
@@ -50,26 +60,42 @@ def run_migrations_offline() -> None:
         context.run_migrations()
 
 
-def run_migrations_online() -> None:
-    """Run migrations in 'online' mode.
+def do_run_migrations(connection: Connection) -> None:
+    context.configure(connection=connection, target_metadata=target_metadata)
+
+    with context.begin_transaction():
+        if connection.dialect.name == "postgresql":
+            # instances that deploy together migrate one at a time; the
+            # current revision is read after the lock is granted
+            connection.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+        context.run_migrations()
 
-    In this scenario we need to create an Engine
-    and associate a connection with the context.
+
+async def run_async_migrations() -> None:
+    """The app's URL uses an async driver (asyncpg), so migrate through
+    an async engine and hand the sync connection to Alembic.
 
     """
-    connectable = engine_from_config(
+    connectable = async_engine_from_config(
         config.get_section(config.config_ini_section, {}),
         prefix="sqlalchemy.",
         poolclass=pool.NullPool,
     )
 
-    with connectable.connect() as connection:
-        context.configure(
-            connection=connection, target_metadata=target_metadata
-        )
+    async with connectable.connect() as connection:
+        await connection.run_sync(do_run_migrations)
+
+    await connectable.dispose()
+
+
+def run_migrations_online() -> None:
+    """Run migrations in 'online' mode.
+
+    In this scenario we need to create an Engine
+    and associate a connection with the context.
 
-        with context.begin_transaction():
-            context.run_migrations()
+    """
+    asyncio.run(run_async_migrations())
 
 
 if context.is_offline_mode():
@@ -0,0 +1,152 @@
+"""baseline schema
+
+The tables as create_all built them before the app was versioned with
+Alembic. Databases created that way are stamped at this revision by
+`python -m app.migrate` instead of running it.
+
+Revision ID: 0000
+Revises:
+Create Date: 2026-10-18 08:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0000"
+down_revision: Union[str, Sequence[str], None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "users",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("username", sa.String(length=50), nullable=False),
+        sa.Column("email", sa.String(length=255), nullable=False),
+        sa.Column("password", sa.String(length=255), nullable=False),
+        sa.Column("role", sa.String(length=10), nullable=False),
+        sa.Column("name", sa.String(length=100), nullable=False),
+        sa.Column("department", sa.String(length=100), nullable=False),
+        sa.Column("joining_date", sa.String(), nullable=True),
+        sa.Column("current_project", sa.String(), nullable=True),
+        sa.Column("group_members", sa.String(), nullable=True),
+        sa.Column("skills", sa.String(), nullable=True),
+        sa.Column("experience", sa.String(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("email"),
+        sa.UniqueConstraint("username"),
+    )
+    op.create_index(op.f("ix_users_id"), "users", ["id"], unique=False)
+
+    op.create_table(
+        "security_keys",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("key", sa.String(length=100), nullable=False),
+        sa.Column("is_used", sa.Boolean(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("key"),
+    )
+    op.create_index(op.f("ix_security_keys_id"), "security_keys", ["id"], unique=False)
+
+    op.create_table(
+        "shoutouts",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("author_id", sa.Integer(), nullable=False),
+        sa.Column("message", sa.Text(), nullable=False),
+        sa.Column("image_url", sa.String(length=500), nullable=True),
+        sa.Column("department", sa.String(length=100), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.Column("is_reported", sa.Boolean(), nullable=True),
+        sa.Column("reactions", postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+        sa.ForeignKeyConstraint(["author_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(op.f("ix_shoutouts_id"), "shoutouts", ["id"], unique=False)
+
+    op.create_table(
+        "shoutout_tags",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("shoutout_id", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["shoutout_id"], ["shoutouts.id"]),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(op.f("ix_shoutout_tags_id"), "shoutout_tags", ["id"], unique=False)
+
+    op.create_table(
+        "shoutout_reactions",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("shoutout_id", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("emoji", sa.String(length=10), nullable=False),
+        sa.ForeignKeyConstraint(["shoutout_id"], ["shoutouts.id"]),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(op.f("ix_shoutout_reactions_id"), "shoutout_reactions", ["id"], unique=False)
+
+    op.create_table(
+        "shoutout_comments",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("shoutout_id", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("content", sa.Text(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(["shoutout_id"], ["shoutouts.id"]),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(op.f("ix_shoutout_comments_id"), "shoutout_comments", ["id"], unique=False)
+
+    op.create_table(
+        "notifications",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("message", sa.String(length=255), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("department", sa.String(length=100), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(op.f("ix_notifications_id"), "notifications", ["id"], unique=False)
+
+    op.create_table(
+        "employee_of_month",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("employee_id", sa.Integer(), nullable=False),
+        sa.Column("month_year", sa.Text(), nullable=True),
+        sa.Column("name", sa.String(length=255), nullable=False),
+        sa.Column("department", sa.String(length=255), nullable=True),
+        sa.Column("created_at", sa.DateTime(), server_default=sa.text("now()"), nullable=True),
+        sa.ForeignKeyConstraint(["employee_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(op.f("ix_employee_of_month_id"), "employee_of_month", ["id"], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f("ix_employee_of_month_id"), table_name="employee_of_month")
+    op.drop_table("employee_of_month")
+    op.drop_index(op.f("ix_notifications_id"), table_name="notifications")
+    op.drop_table("notifications")
+    op.drop_index(op.f("ix_shoutout_comments_id"), table_name="shoutout_comments")
+    op.drop_table("shoutout_comments")
+    op.drop_index(op.f("ix_shoutout_reactions_id"), table_name="shoutout_reactions")
+    op.drop_table("shoutout_reactions")
+    op.drop_index(op.f("ix_shoutout_tags_id"), table_name="shoutout_tags")
+    op.drop_table("shoutout_tags")
+    op.drop_index(op.f("ix_shoutouts_id"), table_name="shoutouts")
+    op.drop_table("shoutouts")
+    op.drop_index(op.f("ix_security_keys_id"), table_name="security_keys")
+    op.drop_table("security_keys")
+    op.drop_index(op.f("ix_users_id"), table_name="users")
+    op.drop_table("users")
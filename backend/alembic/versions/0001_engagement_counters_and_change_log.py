@@ -0,0 +1,73 @@
+"""engagement counters and shoutout change log
+
+The baseline's nullable shoutouts.reactions column becomes the
+reaction_counts map (backfilled, NOT NULL, default '{}'), shoutouts gain
+comments_count, and the change log behind delta sync is created.
+
+Revision ID: 0001
+Revises: 0000
+Create Date: 2026-10-18 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0001"
+down_revision: Union[str, Sequence[str], None] = "0000"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.alter_column("shoutouts", "reactions", server_default=sa.text("'{}'"))
+    op.execute("UPDATE shoutouts SET reactions = '{}' WHERE reactions IS NULL")
+    op.alter_column("shoutouts", "reactions", nullable=False)
+    op.add_column("shoutouts", sa.Column("comments_count", sa.Integer(), server_default=sa.text("0"), nullable=False))
+
+    # same rebuild as `python -m app.counters`
+    op.execute(
+        """
+        UPDATE shoutouts SET
+            reactions = COALESCE((
+                SELECT jsonb_object_agg(r.emoji, r.n)
+                FROM (
+                    SELECT emoji, count(*) AS n FROM shoutout_reactions
+                    WHERE shoutout_reactions.shoutout_id = shoutouts.id
+                    GROUP BY emoji
+                ) AS r
+            ), '{}'::jsonb),
+            comments_count = (
+                SELECT count(*) FROM shoutout_comments
+                WHERE shoutout_comments.shoutout_id = shoutouts.id
+            )
+        """
+    )
+
+    op.create_table(
+        "shoutout_changes",
+        sa.Column("id", sa.BigInteger(), autoincrement=True, nullable=False),
+        sa.Column("xid", sa.BigInteger(), nullable=True),
+        sa.Column("department", sa.String(length=100), nullable=False),
+        sa.Column("shoutout_id", sa.Integer(), nullable=False),
+        sa.Column("kind", sa.String(length=20), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_shoutout_changes_department_id", "shoutout_changes", ["department", "id"], unique=False)
+    op.create_index("ix_shoutout_changes_department_xid", "shoutout_changes", ["department", "xid"], unique=False)
+    op.create_index("ix_shoutout_changes_xid", "shoutout_changes", ["xid"], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_shoutout_changes_xid", table_name="shoutout_changes")
+    op.drop_index("ix_shoutout_changes_department_xid", table_name="shoutout_changes")
+    op.drop_index("ix_shoutout_changes_department_id", table_name="shoutout_changes")
+    op.drop_table("shoutout_changes")
+    op.drop_column("shoutouts", "comments_count")
+    op.alter_column("shoutouts", "reactions", nullable=True, server_default=None)
@@ -0,0 +1,79 @@
+"""secondary indexes for the hot query paths
+
+Feed pages and keyset cursors, the reported queue, tag / reaction /
+comment lookups by shoutout and by user, and employee of the month.
+Checked by tests/test_query_plans.py.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 09:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0002"
+down_revision: Union[str, Sequence[str], None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index("ix_users_department", "users", ["department"], if_not_exists=True)
+
+    op.create_index(
+        "ix_shoutouts_department_created_at", "shoutouts", ["department", "created_at", "id"], if_not_exists=True
+    )
+    op.create_index("ix_shoutouts_author_id_created_at", "shoutouts", ["author_id", "created_at"], if_not_exists=True)
+    op.create_index(
+        "ix_shoutouts_reported",
+        "shoutouts",
+        ["department", "created_at"],
+        postgresql_where=sa.text("is_reported"),
+        if_not_exists=True,
+    )
+
+    op.create_index("ix_shoutout_tags_shoutout_id", "shoutout_tags", ["shoutout_id"], if_not_exists=True)
+    op.create_index("ix_shoutout_tags_user_id", "shoutout_tags", ["user_id"], if_not_exists=True)
+
+    op.create_index(
+        "ix_shoutout_reactions_shoutout_id_user_id", "shoutout_reactions", ["shoutout_id", "user_id"], if_not_exists=True
+    )
+    op.create_index("ix_shoutout_reactions_user_id", "shoutout_reactions", ["user_id"], if_not_exists=True)
+
+    op.create_index(
+        "ix_shoutout_comments_shoutout_id_created_at",
+        "shoutout_comments",
+        ["shoutout_id", "created_at", "id"],
+        if_not_exists=True,
+    )
+    op.create_index(
+        "ix_shoutout_comments_user_id_created_at", "shoutout_comments", ["user_id", "created_at"], if_not_exists=True
+    )
+
+    op.create_index(
+        "ix_employee_of_month_department_created_at",
+        "employee_of_month",
+        ["department", "created_at"],
+        if_not_exists=True,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_employee_of_month_department_created_at", table_name="employee_of_month")
+    op.drop_index("ix_shoutout_comments_user_id_created_at", table_name="shoutout_comments")
+    op.drop_index("ix_shoutout_comments_shoutout_id_created_at", table_name="shoutout_comments")
+    op.drop_index("ix_shoutout_reactions_user_id", table_name="shoutout_reactions")
+    op.drop_index("ix_shoutout_reactions_shoutout_id_user_id", table_name="shoutout_reactions")
+    op.drop_index("ix_shoutout_tags_user_id", table_name="shoutout_tags")
+    op.drop_index("ix_shoutout_tags_shoutout_id", table_name="shoutout_tags")
+    op.drop_index("ix_shoutouts_reported", table_name="shoutouts")
+    op.drop_index("ix_shoutouts_author_id_created_at", table_name="shoutouts")
+    op.drop_index("ix_shoutouts_department_created_at", table_name="shoutouts")
+    op.drop_index("ix_users_department", table_name="users")
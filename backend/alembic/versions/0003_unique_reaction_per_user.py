@@ -0,0 +1,67 @@
+"""one reaction per user per shoutout
+
+Collapses duplicate (shoutout_id, user_id) reactions left by racing
+clicks, keeping the newest, and replaces the plain index with a unique
+constraint for the single-statement toggle to upsert against.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0003"
+down_revision: Union[str, Sequence[str], None] = "0002"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute(
+        """
+        CREATE TEMPORARY TABLE reaction_duplicates ON COMMIT DROP AS
+        SELECT id, shoutout_id FROM (
+            SELECT id, shoutout_id,
+                   row_number() OVER (PARTITION BY shoutout_id, user_id ORDER BY id DESC) AS rn
+            FROM shoutout_reactions
+        ) AS ranked
+        WHERE rn > 1
+        """
+    )
+    op.execute("DELETE FROM shoutout_reactions WHERE id IN (SELECT id FROM reaction_duplicates)")
+
+    # same rebuild as `python -m app.counters`, for the shoutouts that lost rows
+    op.execute(
+        """
+        UPDATE shoutouts SET
+            reactions = COALESCE((
+                SELECT jsonb_object_agg(r.emoji, r.n)
+                FROM (
+                    SELECT emoji, count(*) AS n FROM shoutout_reactions
+                    WHERE shoutout_reactions.shoutout_id = shoutouts.id
+                    GROUP BY emoji
+                ) AS r
+            ), '{}'::jsonb)
+        WHERE id IN (SELECT shoutout_id FROM reaction_duplicates)
+        """
+    )
+
+    op.drop_index("ix_shoutout_reactions_shoutout_id_user_id", table_name="shoutout_reactions", if_exists=True)
+    existing = sa.inspect(op.get_bind()).get_unique_constraints("shoutout_reactions")
+    if "uq_shoutout_reactions_shoutout_id_user_id" not in {c["name"] for c in existing}:
+        op.create_unique_constraint(
+            "uq_shoutout_reactions_shoutout_id_user_id", "shoutout_reactions", ["shoutout_id", "user_id"]
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint("uq_shoutout_reactions_shoutout_id_user_id", "shoutout_reactions", type_="unique")
+    op.create_index("ix_shoutout_reactions_shoutout_id_user_id", "shoutout_reactions", ["shoutout_id", "user_id"])
@@ -0,0 +1,37 @@
+"""login rate-limit buckets shared across workers
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0004"
+down_revision: Union[str, Sequence[str], None] = "0003"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "login_buckets",
+        sa.Column("key", sa.String(length=320), nullable=False),
+        sa.Column("tokens", sa.Float(), nullable=False),
+        sa.Column("capacity", sa.Float(), nullable=False),
+        sa.Column("refill_per_second", sa.Float(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), server_default=sa.text("now()"), nullable=False),
+        sa.PrimaryKeyConstraint("key"),
+        if_not_exists=True,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("login_buckets")
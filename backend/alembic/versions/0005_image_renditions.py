@@ -0,0 +1,30 @@
+"""image renditions on shoutouts
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0005"
+down_revision: Union[str, Sequence[str], None] = "0004"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # NULL until rendered; `python -m app.renditions` fills in existing images
+    op.add_column("shoutouts", sa.Column("image_renditions", postgresql.JSONB(astext_type=sa.Text()), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column("shoutouts", "image_renditions")
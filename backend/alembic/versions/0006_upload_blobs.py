@@ -0,0 +1,47 @@
+"""content-addressed upload blobs with reference counts
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0006"
+down_revision: Union[str, Sequence[str], None] = "0005"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # uploads from before this keep their random names and are never counted
+    op.create_table(
+        "upload_blobs",
+        sa.Column("digest", sa.String(length=64), nullable=False),
+        sa.Column("filename", sa.String(length=80), nullable=False),
+        sa.Column("size", sa.BigInteger(), nullable=False),
+        sa.Column("ref_count", sa.Integer(), nullable=False),
+        sa.Column("renditions", postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+        sa.Column("updated_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("digest"),
+    )
+    op.create_index(
+        "ix_upload_blobs_unreferenced",
+        "upload_blobs",
+        ["updated_at"],
+        unique=False,
+        postgresql_where=sa.text("ref_count <= 0"),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_upload_blobs_unreferenced", table_name="upload_blobs", postgresql_where=sa.text("ref_count <= 0"))
+    op.drop_table("upload_blobs")
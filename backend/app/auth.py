@@ -1,6 +1,11 @@
+import hashlib
+import time
+from dataclasses import dataclass
 from typing import Optional
 from datetime import datetime, timedelta
 
+from cachetools import TLRUCache, TTLCache
+
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -11,6 +16,7 @@ from passlib.context import CryptContext
 from .database import get_db
 from .models import User
 from .config import settings
+from .hashing import hashing_pool
 
 # ---------------------------
 # OAuth2 scheme
@@ -31,13 +37,23 @@ def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
 
+# Async handlers use these: the work runs on the bounded hashing pool and
+# raises a 503 when the pool is saturated.
+async def check_password(plain_password: str, hashed_password: str) -> bool:
+    return await hashing_pool.run(verify_password, plain_password, hashed_password)
+
+
+async def hash_password(password: str) -> str:
+    return await hashing_pool.run(get_password_hash, password)
+
+
 # ---------------------------
 # Authenticate user
 # ---------------------------
 async def authenticate_user(db: AsyncSession, email: str, password: str) -> Optional[User]:
     result = await db.execute(select(User).where(User.email == email))
     user = result.scalars().first()
-    if not user or not verify_password(password, user.password):
+    if not user or not await check_password(password, user.password):
         return None
     return user
 
@@ -59,32 +75,102 @@ def create_refresh_token(data: dict, expires_delta: Optional[timedelta] = None):
     return jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
 
 
+# ---------------------------
+# Token verification
+# ---------------------------
+# Wall-clock timer so entries expire exactly at the token's exp claim
+token_cache: TLRUCache = TLRUCache(
+    maxsize=settings.TOKEN_CACHE_SIZE,
+    ttu=lambda _key, claims, _now: claims["exp"],
+    timer=time.time,
+)
+
+
+def decode_token(token: str) -> dict:
+    """
+    Verify a JWT and return its claims; raises JWTError. Each token's
+    signature is checked once, then its claims are served from an LRU keyed
+    by the token's digest until the token expires.
+    """
+    key = hashlib.sha256(token.encode()).digest()
+    claims = token_cache.get(key)
+    if claims is None:
+        claims = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        if isinstance(claims.get("exp"), (int, float)):
+            token_cache[key] = claims
+    return claims
+
+
+# ---------------------------
+# Principal cache
+# ---------------------------
+@dataclass(frozen=True)
+class Principal:
+    """What request handlers need to know about the caller, without an ORM row."""
+    id: int
+    username: str
+    name: str
+    role: str
+    department: str
+    is_active: bool
+
+
+principal_cache: TTLCache = TTLCache(maxsize=settings.PRINCIPAL_CACHE_SIZE, ttl=settings.PRINCIPAL_CACHE_TTL_SECONDS)
+
+
+def invalidate_principal(user_id: int) -> None:
+    """
+    Call after changing or deleting a user so the next request re-reads the
+    row. Only this process's cache is cleared; other workers catch up within
+    PRINCIPAL_CACHE_TTL_SECONDS.
+    """
+    principal_cache.pop(user_id, None)
+
+
+async def load_principal(db: AsyncSession, user_id: int) -> Optional[Principal]:
+    principal = principal_cache.get(user_id)
+    if principal is None:
+        result = await db.execute(
+            select(User.id, User.username, User.name, User.role, User.department, User.is_active).where(
+                User.id == user_id
+            )
+        )
+        row = result.first()
+        if row is None:
+            return None
+        principal = Principal(**row._mapping)
+        principal_cache[user_id] = principal
+    return principal
+
+
 # ---------------------------
 # Get current user
 # ---------------------------
-async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)) -> User:
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)) -> Principal:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        payload = decode_token(token)
         user_id = int(payload.get("sub"))
     except JWTError:
         raise credentials_exception
 
-    result = await db.execute(select(User).where(User.id == user_id))
-    user = result.scalars().first()
+    # ✅ Served from the principal cache; the users table is read at most once per TTL
+    user = await load_principal(db, user_id)
     if not user:
         raise credentials_exception
+    if not user.is_active:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Account suspended")
     return user
 
 
 # ---------------------------
 # Get current admin (or superadmin)
 # ---------------------------
-async def get_current_admin_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)) -> User:
+async def get_current_admin_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)) -> Principal:
     """
     Returns current user if role is admin or superadmin.
     """
@@ -97,7 +183,7 @@ async def get_current_admin_user(token: str = Depends(oauth2_scheme), db: AsyncS
 # ---------------------------
 # Get only superadmin
 # ---------------------------
-async def get_current_superadmin(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)) -> User:
+async def get_current_superadmin(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)) -> Principal:
     """
     Returns current user if role is superadmin.
     """
@@ -0,0 +1,99 @@
+import asyncio
+import json
+from typing import Dict, Optional, Set
+
+from .config import settings
+
+
+# ---------------------------
+# Live feed broker
+# ---------------------------
+RESYNC = json.dumps({"type": "resync"})
+
+
+class Subscription:
+    """One connected stream client: a bounded queue of encoded events."""
+
+    def __init__(self, department: str, maxsize: int):
+        self.department = department
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.overflows = 0
+
+    def offer(self, payload: str) -> bool:
+        """
+        Enqueue without ever blocking the publisher. A consumer that has
+        fallen a full queue behind loses its backlog and gets a single
+        resync event instead, so its memory stays bounded.
+        """
+        try:
+            self.queue.put_nowait(payload)
+            return True
+        except asyncio.QueueFull:
+            self.overflows += 1
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC)
+            return False
+
+    async def next(self, timeout: float) -> Optional[str]:
+        """Wait for the next event; None means the heartbeat interval elapsed."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class FeedBroker:
+    """
+    In-process fan-out of compact feed events to per-department
+    subscribers. Each event is JSON-encoded once and the same string is
+    handed to every subscriber, so an idle connection costs one parked
+    coroutine and an empty queue.
+    """
+
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        self._subscribers: Dict[str, Set[Subscription]] = {}
+        self.published = 0
+        self.delivered = 0
+        self.overflows = 0
+
+    def subscribe(self, department: str) -> Subscription:
+        subscription = Subscription(department, self.queue_size)
+        self._subscribers.setdefault(department, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        subscribers = self._subscribers.get(subscription.department)
+        if subscribers is None:
+            return
+        subscribers.discard(subscription)
+        if not subscribers:
+            del self._subscribers[subscription.department]
+
+    def publish(self, department: Optional[str], event: dict) -> None:
+        """Send an event to one department, or to everyone when department is None."""
+        payload = json.dumps(event, default=str)
+        self.published += 1
+        if department is None:
+            targets = [s for subscribers in self._subscribers.values() for s in subscribers]
+        else:
+            targets = list(self._subscribers.get(department, ()))
+        for subscription in targets:
+            if subscription.offer(payload):
+                self.delivered += 1
+            else:
+                self.overflows += 1
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": sum(len(s) for s in self._subscribers.values()),
+            "departments": len(self._subscribers),
+            "published": self.published,
+            "delivered": self.delivered,
+            "overflows": self.overflows,
+            "queue_size": self.queue_size,
+        }
+
+
+broker = FeedBroker(queue_size=settings.STREAM_QUEUE_SIZE)
@@ -0,0 +1,109 @@
+"""
+Shoutout change log behind delta sync.
+
+Every write that changes what a feed shows records a ShoutOutChange row in
+its own transaction. Rows are tailed by commit position, not by id: a
+serial id is taken at INSERT, so a transaction holding id 10 can commit
+after one holding id 11, and a reader that had already moved past 11
+would never see 10. Positions are the writing transaction's id on
+Postgres (ids on SQLite, whose single writer keeps them in commit order;
+see portable.py), and readers stop at the committed horizon, below which
+nothing can still commit.
+
+A client's sync token is the horizon as of its last read;
+/auth/shoutouts/feed/changes replays the positions from there up to the
+current horizon. A change that was already visible above the horizon (its
+transaction committed while an older one was still running) is replayed
+once more on the next sync, so clients apply changes idempotently.
+
+Old rows are pruned with:
+
+    python -m app.changes
+"""
+import asyncio
+from datetime import datetime, timedelta
+
+from sqlalchemy import case, delete, func, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .config import settings
+from .models import ShoutOutChange
+from .portable import commit_position, committed_horizon
+
+CREATED = "created"
+REACTIONS = "reactions"
+COMMENTS = "comments"
+REPORTED = "reported"
+EDITED = "edited"
+DELETED = "deleted"
+RENDITIONS = "renditions"
+
+
+def record_change(db: AsyncSession, department: str, shoutout_id: int, kind: str) -> None:
+    """Stage a change row; it commits (or rolls back) with the caller's write."""
+    db.add(ShoutOutChange(department=department, shoutout_id=shoutout_id, kind=kind))
+
+
+# ---------------------------
+# Commit positions
+# ---------------------------
+# a change row's place in commit order
+position = commit_position(ShoutOutChange.xid, ShoutOutChange.id)
+
+
+def horizon():
+    """Every change positioned below this has committed (or never will)."""
+    return committed_horizon(select(func.coalesce(func.max(ShoutOutChange.id), 0) + 1).scalar_subquery())
+
+
+def sync_position(department: str):
+    """
+    Where a client reading the department now resumes: the horizon, or 0
+    while the department has logged nothing (its first changes then
+    replay from the start).
+    """
+    oldest = select(func.min(position)).where(ShoutOutChange.department == department).scalar_subquery()
+    return case((oldest.is_not(None), horizon()), else_=0)
+
+
+async def current_sync_position(db: AsyncSession, department: str) -> int:
+    return (await db.execute(select(sync_position(department)))).scalar()
+
+
+def build_changes_statement(department: str, since: int, until: int, limit: int):
+    """The department's changes positioned in [since, until), in commit order."""
+    return (
+        select(ShoutOutChange.id, ShoutOutChange.shoutout_id, ShoutOutChange.kind)
+        .where(ShoutOutChange.department == department, position >= since, position < until)
+        .order_by(position)
+        .limit(limit)
+    )
+
+
+async def prune_changes(db: AsyncSession, older_than: datetime) -> int:
+    """
+    Delete change rows older than the cutoff, always keeping each
+    department's newest rows so tokens issued since stay valid.
+    """
+    newest = select(ShoutOutChange.department, func.max(position)).group_by(ShoutOutChange.department)
+    result = await db.execute(
+        delete(ShoutOutChange).where(
+            ShoutOutChange.created_at < older_than,
+            tuple_(ShoutOutChange.department, position).not_in(newest),
+        )
+    )
+    await db.commit()
+    return result.rowcount
+
+
+async def main():
+    from .database import AsyncSessionLocal
+
+    cutoff = datetime.utcnow() - timedelta(days=settings.SYNC_RETENTION_DAYS)
+    async with AsyncSessionLocal() as db:
+        count = await prune_changes(db, cutoff)
+    print(f"Pruned {count} shoutout changes older than {cutoff.isoformat()}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
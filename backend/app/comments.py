@@ -0,0 +1,113 @@
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import schemas
+from .models import ShoutOutComment, User
+from .pagination import encode_cursor
+
+
+# ---------------------------
+# Comment pages
+# ---------------------------
+def _comment_select():
+    """The columns CommentOut needs, with the commenter's name."""
+    return (
+        select(
+            ShoutOutComment.id,
+            ShoutOutComment.shoutout_id,
+            ShoutOutComment.user_id,
+            ShoutOutComment.content,
+            ShoutOutComment.created_at,
+            User.name.label("author_name"),
+        )
+        .outerjoin(User, User.id == ShoutOutComment.user_id)
+    )
+
+
+def build_comments_statement(shoutout_id: int, page_size: int, after: Optional[Tuple[datetime, int]] = None):
+    """
+    One page of a shoutout's comments, oldest first, keyed on
+    (created_at, id). Fetches page_size + 1 rows so the caller can tell
+    whether there is a next page.
+    """
+    stmt = (
+        _comment_select()
+        .where(ShoutOutComment.shoutout_id == shoutout_id)
+        .order_by(ShoutOutComment.created_at, ShoutOutComment.id)
+        .limit(page_size + 1)
+    )
+    if after is not None:
+        stmt = stmt.where(tuple_(ShoutOutComment.created_at, ShoutOutComment.id) > tuple_(*after))
+    return stmt
+
+
+def build_comment_previews_statement(shoutout_ids: Sequence[int], per_shoutout: int):
+    """
+    The first per_shoutout + 1 comments of every shoutout in one query,
+    ranked with row_number() over each shoutout's comments.
+    """
+    ranked = (
+        _comment_select()
+        .add_columns(
+            func.row_number()
+            .over(
+                partition_by=ShoutOutComment.shoutout_id,
+                order_by=(ShoutOutComment.created_at, ShoutOutComment.id),
+            )
+            .label("rank")
+        )
+        .where(ShoutOutComment.shoutout_id.in_(list(shoutout_ids)))
+        .subquery()
+    )
+    return (
+        select(ranked)
+        .where(ranked.c.rank <= per_shoutout + 1)
+        .order_by(ranked.c.shoutout_id, ranked.c.rank)
+    )
+
+
+def _to_comment(row) -> schemas.CommentOut:
+    return schemas.CommentOut(
+        id=row.id,
+        shoutout_id=row.shoutout_id,
+        user_id=row.user_id,
+        author_name=row.author_name,
+        content=row.content,
+        created_at=row.created_at.isoformat() if row.created_at else None,
+    )
+
+
+def _to_page(rows, page_size: int) -> schemas.CommentPage:
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    next_cursor = None
+    if has_more and rows[-1].created_at:
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+    return schemas.CommentPage(items=[_to_comment(row) for row in rows], next_cursor=next_cursor)
+
+
+async def load_comment_page(
+    db: AsyncSession,
+    shoutout_id: int,
+    page_size: int,
+    after: Optional[Tuple[datetime, int]] = None,
+) -> schemas.CommentPage:
+    result = await db.execute(build_comments_statement(shoutout_id, page_size, after))
+    return _to_page(result.all(), page_size)
+
+
+async def load_comment_previews(
+    db: AsyncSession,
+    shoutout_ids: Sequence[int],
+    per_shoutout: int,
+) -> Dict[int, schemas.CommentPage]:
+    """First page of comments for many shoutouts in a single round trip."""
+    grouped: Dict[int, List] = {shoutout_id: [] for shoutout_id in shoutout_ids}
+    if shoutout_ids:
+        result = await db.execute(build_comment_previews_statement(shoutout_ids, per_shoutout))
+        for row in result.all():
+            grouped[row.shoutout_id].append(row)
+    return {shoutout_id: _to_page(rows, per_shoutout) for shoutout_id, rows in grouped.items()}
@@ -1,15 +1,149 @@
+from typing import Optional
+from pydantic import model_validator
 from pydantic_settings import BaseSettings
+from sqlalchemy.engine import make_url
 
 
 class Settings(BaseSettings):
-    DATABASE_URL: str
+    DATABASE_URL: str = ""  # required unless SQLITE_PATH is set
     SECRET_KEY: str
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
     REFRESH_TOKEN_EXPIRE_DAYS: int = 7  # <-- add this line
 
+    # Database engine and connection pool
+    DB_ECHO: bool = False  # log every statement; for local debugging only
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30.0  # seconds to wait for a connection before erroring
+    DB_POOL_RECYCLE: int = 1800  # seconds; replace connections older than this
+    # a SELECT 1 round trip on every checkout; DB_POOL_RECYCLE already retires
+    # connections before the usual idle timeouts. Turn on behind proxies or
+    # failover that drop idle connections early
+    DB_POOL_PRE_PING: bool = False
+
+    # SQLite instead of Postgres, for throwaway benchmarks and quick local runs:
+    # a file path, or ":memory:" (one shared connection). Overrides DATABASE_URL.
+    SQLITE_PATH: Optional[str] = None
+
+    # Read replica (unset: reads go to the primary)
+    DATABASE_REPLICA_URL: Optional[str] = None  # same pool settings as the primary
+
+    # Feed pagination
+    FEED_PAGE_SIZE: int = 100
+    FEED_MAX_PAGE_SIZE: int = 100
+    SYNC_MAX_CHANGES: int = 500  # beyond this a delta sync answers with reset
+    SYNC_RETENTION_DAYS: int = 7
+
+    # Comment pagination
+    COMMENTS_PAGE_SIZE: int = 20
+    COMMENTS_MAX_PAGE_SIZE: int = 100
+    COMMENTS_PREVIEW_SIZE: int = 3  # per shoutout in the batch endpoint
+
+    # Per-department feed cache (first page only)
+    FEED_CACHE_SIZE: int = 256
+    FEED_CACHE_TTL_SECONDS: float = 30.0
+    # reuse a department's feed version this long before querying it again;
+    # other workers' writes can show up this late (0: query every request)
+    FEED_VERSION_TTL_SECONDS: float = 1.0
+
+    # Live feed stream
+    STREAM_QUEUE_SIZE: int = 100
+    STREAM_HEARTBEAT_SECONDS: float = 25.0
+
+    # Authenticated principal cache (user id -> id/role/department/name).
+    # Invalidation on user edits/deletes reaches only the worker that made the
+    # change: other workers keep acting on the old role or department, or
+    # accepting a deleted user's token, for up to the TTL.
+    PRINCIPAL_CACHE_SIZE: int = 10_000
+    PRINCIPAL_CACHE_TTL_SECONDS: float = 60.0
+
+    # Verified JWTs (sha256 digest -> claims), each kept until its exp
+    TOKEN_CACHE_SIZE: int = 4096
+
+    # Login admission control (token buckets per email and per client IP)
+    LOGIN_EMAIL_BURST: int = 5
+    LOGIN_EMAIL_PER_MINUTE: float = 5.0
+    LOGIN_IP_BURST: int = 20
+    LOGIN_IP_PER_MINUTE: float = 30.0
+    LOGIN_LIMITER_SIZE: int = 50_000
+    LOGIN_LIMIT_SHARED: bool = False  # sync buckets across workers through Postgres (refused on SQLite)
+    LOGIN_LIMIT_SYNC_SECONDS: float = 1.0
+
+    # Password hashing pool (bcrypt runs off the event loop)
+    HASHING_WORKERS: int = 4
+    HASHING_MAX_QUEUE: int = 32  # waiting hashes beyond this get a 503
+
+    # Reaction write buffer (off: every reaction commits on its own; refused on SQLite)
+    REACTION_BUFFER_ENABLED: bool = False
+    REACTION_FLUSH_INTERVAL_MS: int = 200
+    REACTION_FLUSH_MAX_EVENTS: int = 500
+
+    # Image uploads
+    UPLOAD_DIR: Optional[str] = None  # default: <repo>/uploads
+    UPLOAD_MAX_BYTES: int = 10 * 1024 * 1024
+    UPLOAD_CHUNK_BYTES: int = 64 * 1024  # bounds per-upload memory while copying
+    UPLOAD_SWEEP_GRACE_SECONDS: int = 3600  # unreferenced files younger than this survive `python -m app.uploads`
+    # e.g. "/_uploads/": nginx serves /uploads bodies from an `internal` location aliasing UPLOAD_DIR
+    UPLOAD_ACCEL_REDIRECT_PREFIX: Optional[str] = None
+
+    # Where uploads are stored: "local" (UPLOAD_DIR, served by the app) or "s3"
+    # (any S3-compatible store; UPLOAD_DIR then only holds uploads in flight)
+    STORAGE_BACKEND: str = "local"
+    S3_BUCKET: Optional[str] = None
+    S3_ENDPOINT_URL: Optional[str] = None  # MinIO, R2, a moto server...; unset: AWS
+    S3_REGION: Optional[str] = None
+    S3_ACCESS_KEY_ID: Optional[str] = None  # unset: boto3's usual credential chain
+    S3_SECRET_ACCESS_KEY: Optional[str] = None
+    # where browsers fetch objects (a CDN, or the bucket itself); must allow anonymous
+    # GETs, e.g. through a bucket policy. Default: the bucket URL
+    S3_PUBLIC_URL: Optional[str] = None
+    S3_PRESIGN_EXPIRES_SECONDS: int = 300
+    # S3 rejects a presigned PUT whose body doesn't match the signed sha256; for
+    # compatibles that don't check (moto, some self-hosted stores) re-hash on claim
+    S3_VERIFY_UPLOADS: bool = False
+
+    # Image renditions (resized WebP copies, rendered on a process pool)
+    RENDITION_WORKERS: int = 2
+    RENDITION_MAX_QUEUE: int = 64  # images waiting beyond this are left for `python -m app.renditions`
+    RENDITION_WEBP_QUALITY: int = 80
+
+    # Per-request query accounting (Server-Timing header, /metrics/queries)
+    QUERY_ACCOUNTING_ENABLED: bool = False
+    # "off", "log" or "raise" when a request breaks the limits below. "raise" is
+    # for development: the 500 comes after the request's writes have committed
+    QUERY_STRICT_MODE: str = "off"
+    QUERY_MAX_PER_REQUEST: int = 20
+    QUERY_MAX_REPEATS: int = 5  # same statement text in one request: likely an N+1
+
     class Config:
         env_file = ".env"
 
+    @model_validator(mode="after")
+    def _resolve_database_url(self):
+        if self.SQLITE_PATH:
+            self.DATABASE_URL = f"sqlite+aiosqlite:///{self.SQLITE_PATH}"
+        elif not self.DATABASE_URL:
+            raise ValueError("DATABASE_URL is required unless SQLITE_PATH is set")
+        return self
+
+    @model_validator(mode="after")
+    def _check_postgres_features(self):
+        # both flush with Postgres-only SQL (INSERT ... ON CONFLICT from a
+        # VALUES list, make_interval); fail at startup, not on the first flush
+        if make_url(self.DATABASE_URL).get_backend_name() != "postgresql":
+            for flag in ("REACTION_BUFFER_ENABLED", "LOGIN_LIMIT_SHARED"):
+                if getattr(self, flag):
+                    raise ValueError(f"{flag} requires a Postgres DATABASE_URL")
+        return self
+
+    @model_validator(mode="after")
+    def _check_storage(self):
+        if self.STORAGE_BACKEND not in ("local", "s3"):
+            raise ValueError('STORAGE_BACKEND must be "local" or "s3"')
+        if self.STORAGE_BACKEND == "s3" and not self.S3_BUCKET:
+            raise ValueError("S3_BUCKET is required when STORAGE_BACKEND is s3")
+        return self
+
 
 settings = Settings()
@@ -0,0 +1,381 @@
+"""
+Denormalized engagement counters on ShoutOut.
+
+`ShoutOut.reaction_counts` ({emoji: count}) and `ShoutOut.comments_count`
+are updated by the write paths in the same transaction as the child rows,
+so reads never have to aggregate shoutout_reactions / shoutout_comments.
+
+If they ever drift, rebuild them from the source rows:
+
+    python -m app.counters
+"""
+import asyncio
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import Integer, String, and_, case, cast, column, delete, exists, func, literal, literal_column, null, select, text, union_all, update, values
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import changes
+from .models import ShoutOut, ShoutOutChange, ShoutOutComment, ShoutOutReaction, User
+from .portable import json_object_agg
+
+
+# ---------------------------
+# Write-path helpers
+# ---------------------------
+async def lock_shoutout(db: AsyncSession, shoutout_id: int) -> ShoutOut:
+    """Load a shoutout with a row lock so counter updates don't race."""
+    result = await db.execute(select(ShoutOut).where(ShoutOut.id == shoutout_id).with_for_update())
+    shoutout = result.scalars().first()
+    if not shoutout:
+        raise HTTPException(status_code=404, detail="Shoutout not found")
+    return shoutout
+
+
+def apply_reaction_delta(shoutout: ShoutOut, removed: Optional[str] = None, added: Optional[str] = None) -> dict:
+    """Move one reaction from `removed` to `added` (either may be None)."""
+    counts = dict(shoutout.reaction_counts or {})
+    if removed is not None:
+        remaining = counts.get(removed, 0) - 1
+        if remaining > 0:
+            counts[removed] = remaining
+        else:
+            counts.pop(removed, None)
+    if added is not None:
+        counts[added] = counts.get(added, 0) + 1
+    # assign a new dict so the JSONB change is flushed
+    shoutout.reaction_counts = counts
+    return counts
+
+
+async def bump_comments_count(db: AsyncSession, shoutout_id: int, delta: int = 1):
+    """Atomically adjust comments_count; returns the row's (department, comments_count)."""
+    result = await db.execute(
+        update(ShoutOut)
+        .where(ShoutOut.id == shoutout_id)
+        .values(comments_count=ShoutOut.comments_count + delta)
+        .returning(ShoutOut.department, ShoutOut.comments_count)
+    )
+    row = result.first()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Shoutout not found")
+    return row
+
+
+def _counts_after(counts, old_emoji, new_emoji):
+    """SQL for a reaction map with one `old_emoji` moved to `new_emoji` (either may be NULL)."""
+    old_count = cast(counts[old_emoji].astext, Integer)
+    without_old = case(
+        (old_emoji.is_(None), counts),
+        else_=counts.op("-")(old_emoji).op("||")(
+            case(
+                (old_count > 1, func.jsonb_build_object(old_emoji, old_count - 1)),
+                else_=text("'{}'::jsonb"),
+            )
+        ),
+    )
+    new_count = func.coalesce(cast(counts[new_emoji].astext, Integer), 0) + 1
+    return case(
+        (new_emoji.is_(None), without_old),
+        else_=without_old.op("||")(func.jsonb_build_object(new_emoji, new_count)),
+    )
+
+
+async def toggle_reaction(db: AsyncSession, shoutout_id: int, user_id: int, emoji: str) -> Tuple[str, str, dict]:
+    """
+    Toggle a user's reaction in one statement: the same emoji removes it, a
+    different one replaces it, none adds it. The reaction row, the counter
+    map and the change-log row are all written by the same statement, which
+    returns (action, department, reaction counts).
+
+    Each branch only takes effect if the row still looks the way the
+    statement's snapshot saw it (the unique (shoutout_id, user_id)
+    constraint and the ON CONFLICT ... WHERE recheck see concurrent
+    commits), so the counter delta is always exact. A click that loses
+    such a race is reported as "unchanged".
+
+    Backends without data-modifying CTEs (SQLite) take the row-by-row path
+    in _toggle_reaction_rows instead.
+    """
+    if db.get_bind().dialect.name != "postgresql":
+        return await _toggle_reaction_rows(db, shoutout_id, user_id, emoji)
+
+    result = await db.execute(build_toggle_statement(shoutout_id, user_id, emoji))
+    row = result.one()
+    if row.department is None:
+        raise HTTPException(status_code=404, detail="Shoutout not found")
+    reactions = row.reactions
+    if row.action == "unchanged":
+        # the statement's snapshot predates the commit it lost to; a new
+        # statement sees that commit, so report the counts as they now are
+        reactions = await db.scalar(select(ShoutOut.reaction_counts).where(ShoutOut.id == shoutout_id))
+    return row.action, row.department, reactions or {}
+
+
+def build_toggle_statement(shoutout_id: int, user_id: int, emoji: str):
+    """The single statement behind toggle_reaction (Postgres only)."""
+    mine = (ShoutOutReaction.shoutout_id == shoutout_id, ShoutOutReaction.user_id == user_id)
+    emoji = literal(emoji, String)
+
+    prior = select(ShoutOutReaction.emoji).where(*mine).cte("prior")
+    removed = (
+        delete(ShoutOutReaction)
+        .where(*mine, ShoutOutReaction.emoji == emoji)
+        .returning(ShoutOutReaction.emoji)
+        .cte("removed")
+    )
+    upsert = insert(ShoutOutReaction).from_select(
+        ["shoutout_id", "user_id", "emoji"],
+        select(literal(shoutout_id), literal(user_id), emoji).where(
+            ~exists(select(prior.c.emoji).where(prior.c.emoji == emoji)),
+            exists(select(ShoutOut.id).where(ShoutOut.id == shoutout_id)),
+        ),
+    )
+    upserted = (
+        upsert.on_conflict_do_update(
+            constraint="uq_shoutout_reactions_shoutout_id_user_id",
+            set_={"emoji": upsert.excluded.emoji},
+            # recheck against the committed row, not the snapshot
+            where=ShoutOutReaction.emoji == select(prior.c.emoji).scalar_subquery(),
+        )
+        .returning(ShoutOutReaction.emoji, literal_column("xmax = 0").label("inserted"))
+        .cte("upserted")
+    )
+    prior_emoji = select(prior.c.emoji).scalar_subquery()
+    effect = union_all(
+        select(
+            literal(shoutout_id).label("shoutout_id"),
+            removed.c.emoji.label("old_emoji"),
+            cast(null(), String).label("new_emoji"),
+            literal("removed").label("action"),
+        ),
+        select(
+            literal(shoutout_id),
+            case((upserted.c.inserted, cast(null(), String)), else_=prior_emoji),
+            upserted.c.emoji,
+            case((upserted.c.inserted, literal("added")), else_=literal("updated")),
+        ),
+    ).cte("effect")
+
+    # UPDATE ... FROM effect: the shoutout is only touched when a branch took effect
+    bumped = (
+        update(ShoutOut)
+        .where(ShoutOut.id == effect.c.shoutout_id, effect.c.action.is_not(None))
+        .values(reaction_counts=_counts_after(ShoutOut.reaction_counts, effect.c.old_emoji, effect.c.new_emoji))
+        .returning(ShoutOut.department, ShoutOut.reaction_counts.label("reactions"))
+        .cte("bumped")
+    )
+    logged = (
+        insert(ShoutOutChange)
+        .from_select(
+            ["department", "shoutout_id", "kind", "created_at"],
+            select(bumped.c.department, literal(shoutout_id), literal(changes.REACTIONS), func.timezone("utc", func.now())),
+        )
+        .returning(ShoutOutChange.id)
+        .cte("logged")
+    )
+
+    current = select(ShoutOut.department, ShoutOut.reaction_counts.label("reactions")).where(ShoutOut.id == shoutout_id).subquery()
+    return select(
+        func.coalesce(select(effect.c.action).scalar_subquery(), literal("unchanged")).label("action"),
+        func.coalesce(select(bumped.c.department).scalar_subquery(), select(current.c.department).scalar_subquery()).label("department"),
+        func.coalesce(select(bumped.c.reactions).scalar_subquery(), select(current.c.reactions).scalar_subquery()).label("reactions"),
+        select(logged.c.id).scalar_subquery().label("change_id"),
+    )
+
+
+async def _toggle_reaction_rows(db: AsyncSession, shoutout_id: int, user_id: int, emoji: str) -> Tuple[str, str, dict]:
+    """toggle_reaction one row at a time; fine where writers are serialized anyway."""
+    shoutout = await lock_shoutout(db, shoutout_id)
+    result = await db.execute(
+        select(ShoutOutReaction).where(ShoutOutReaction.shoutout_id == shoutout_id, ShoutOutReaction.user_id == user_id)
+    )
+    reaction = result.scalars().first()
+    if reaction is None:
+        db.add(ShoutOutReaction(shoutout_id=shoutout_id, user_id=user_id, emoji=emoji))
+        action, counts = "added", apply_reaction_delta(shoutout, added=emoji)
+    elif reaction.emoji == emoji:
+        await db.delete(reaction)
+        action, counts = "removed", apply_reaction_delta(shoutout, removed=emoji)
+    else:
+        previous, reaction.emoji = reaction.emoji, emoji
+        action, counts = "updated", apply_reaction_delta(shoutout, removed=previous, added=emoji)
+    changes.record_change(db, shoutout.department, shoutout_id, changes.REACTIONS)
+    return action, shoutout.department, counts
+
+
+async def release_user_engagement(db: AsyncSession, user_id: int) -> None:
+    """
+    Remove a user's reactions and comments before the user is deleted,
+    taking them off the counters of the shoutouts they touched.
+    """
+    reactions = await db.execute(select(ShoutOutReaction).where(ShoutOutReaction.user_id == user_id))
+    for reaction in reactions.scalars().all():
+        shoutout = await lock_shoutout(db, reaction.shoutout_id)
+        apply_reaction_delta(shoutout, removed=reaction.emoji)
+        changes.record_change(db, shoutout.department, shoutout.id, changes.REACTIONS)
+        await db.delete(reaction)
+
+    comment_counts = await db.execute(
+        select(ShoutOutComment.shoutout_id, func.count())
+        .where(ShoutOutComment.user_id == user_id)
+        .group_by(ShoutOutComment.shoutout_id)
+    )
+    for shoutout_id, n in comment_counts.all():
+        department, _ = await bump_comments_count(db, shoutout_id, -n)
+        changes.record_change(db, department, shoutout_id, changes.COMMENTS)
+    comments = await db.execute(select(ShoutOutComment).where(ShoutOutComment.user_id == user_id))
+    for comment in comments.scalars().all():
+        await db.delete(comment)
+
+
+# ---------------------------
+# Batched reactions
+# ---------------------------
+async def apply_reaction_toggles(db: AsyncSession, toggles: Sequence[Tuple[int, int, str, Optional[str], Optional[str]]]) -> List:
+    """
+    Apply a batch of coalesced reaction toggles (see reaction_buffer.py),
+    each (shoutout_id, user_id, first_emoji, if_first, otherwise): the
+    user's reaction becomes `if_first` when it currently is `first_emoji`
+    and `otherwise` when it isn't (None = no reaction).
+
+    The touched shoutouts are locked first (in id order), so the current
+    reactions are read fresh and the counters recounted from the rows are
+    exact. Toggles for shoutouts or users that no longer exist are dropped
+    so one stale click can't wedge the batch. Returns
+    (id, department, reactions) for every touched shoutout; the caller
+    commits.
+    """
+    shoutout_ids = sorted({t[0] for t in toggles})
+    locked = await db.execute(
+        select(ShoutOut.id).where(ShoutOut.id.in_(shoutout_ids)).order_by(ShoutOut.id).with_for_update()
+    )
+    live = set(locked.scalars().all())
+    toggles = [t for t in toggles if t[0] in live]
+    if not toggles:
+        return []
+
+    batch = values(
+        column("shoutout_id", Integer),
+        column("user_id", Integer),
+        column("first_emoji", String),
+        column("if_first", String),
+        column("otherwise", String),
+        name="batch",
+    ).data(list(toggles))
+    target = (
+        select(
+            batch.c.shoutout_id,
+            batch.c.user_id,
+            ShoutOutReaction.emoji.label("old_emoji"),
+            case(
+                (ShoutOutReaction.emoji.is_not_distinct_from(batch.c.first_emoji), batch.c.if_first),
+                else_=batch.c.otherwise,
+            ).label("new_emoji"),
+        )
+        .select_from(
+            batch.outerjoin(
+                ShoutOutReaction,
+                and_(ShoutOutReaction.shoutout_id == batch.c.shoutout_id, ShoutOutReaction.user_id == batch.c.user_id),
+            )
+        )
+        .where(exists(select(User.id).where(User.id == batch.c.user_id)))
+        .cte("target")
+    )
+    removed = (
+        delete(ShoutOutReaction)
+        .where(
+            ShoutOutReaction.shoutout_id == target.c.shoutout_id,
+            ShoutOutReaction.user_id == target.c.user_id,
+            target.c.new_emoji.is_(None),
+        )
+        .returning(ShoutOutReaction.id)
+        .cte("removed")
+    )
+    upsert = insert(ShoutOutReaction).from_select(
+        ["shoutout_id", "user_id", "emoji"],
+        select(target.c.shoutout_id, target.c.user_id, target.c.new_emoji).where(
+            target.c.new_emoji.is_not(None),
+            target.c.new_emoji.is_distinct_from(target.c.old_emoji),
+        ),
+    )
+    upserted = (
+        upsert.on_conflict_do_update(
+            constraint="uq_shoutout_reactions_shoutout_id_user_id",
+            set_={"emoji": upsert.excluded.emoji},
+        )
+        .returning(ShoutOutReaction.id)
+        .cte("upserted")
+    )
+    await db.execute(
+        select(
+            select(func.count()).select_from(removed).scalar_subquery(),
+            select(func.count()).select_from(upserted).scalar_subquery(),
+        )
+    )
+
+    # recount from the rows: one UPDATE for the whole batch
+    result = await db.execute(
+        update(ShoutOut)
+        .where(ShoutOut.id.in_(sorted({t[0] for t in toggles})))
+        .values(reaction_counts=_reaction_map())
+        .returning(ShoutOut.id, ShoutOut.department, ShoutOut.reaction_counts.label("reactions"))
+        .execution_options(synchronize_session=False)
+    )
+    touched = result.all()
+    for row in touched:
+        changes.record_change(db, row.department, row.id, changes.REACTIONS)
+    return touched
+
+
+# ---------------------------
+# Repair
+# ---------------------------
+def _reaction_map():
+    """Correlated {emoji: count} for ShoutOut, from shoutout_reactions."""
+    per_emoji = (
+        select(ShoutOutReaction.emoji, func.count().label("n"))
+        .where(ShoutOutReaction.shoutout_id == ShoutOut.id)
+        .group_by(ShoutOutReaction.emoji)
+        .correlate(ShoutOut)
+        .subquery()
+    )
+    reaction_map = select(json_object_agg(per_emoji.c.emoji, per_emoji.c.n)).scalar_subquery()
+    return func.coalesce(reaction_map, text("'{}'"))
+
+
+async def rebuild_engagement_counters(db: AsyncSession, shoutout_ids: Optional[Iterable[int]] = None) -> int:
+    """
+    Recompute the counters from shoutout_reactions / shoutout_comments in a
+    single UPDATE. Returns the number of shoutouts rewritten.
+    """
+    comment_total = (
+        select(func.count(ShoutOutComment.id))
+        .where(ShoutOutComment.shoutout_id == ShoutOut.id)
+        .scalar_subquery()
+    )
+
+    stmt = update(ShoutOut).values(
+        reaction_counts=_reaction_map(),
+        comments_count=comment_total,
+    )
+    if shoutout_ids is not None:
+        stmt = stmt.where(ShoutOut.id.in_(list(shoutout_ids)))
+
+    result = await db.execute(stmt.execution_options(synchronize_session=False))
+    await db.commit()
+    return result.rowcount
+
+
+async def main():
+    from .database import AsyncSessionLocal
+
+    async with AsyncSessionLocal() as db:
+        count = await rebuild_engagement_counters(db)
+    print(f"Rebuilt engagement counters for {count} shoutouts")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,21 +1,70 @@
+import json
 from contextlib import asynccontextmanager
+from fastapi import Depends, Request
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
-from sqlalchemy import select
-import os
-from dotenv import load_dotenv
+from sqlalchemy import event, select
 
-# Load environment variables
-load_dotenv()
+from .config import settings
+from .pool import instrumented_pool
 
-DATABASE_URL = os.getenv("DATABASE_URL")
-if DATABASE_URL is None:
-    raise ValueError("❌ DATABASE_URL is not set in .env file")
+DATABASE_URL = settings.DATABASE_URL
 
-# ✅ Create Async Engine
-engine = create_async_engine(
-    DATABASE_URL,
-    echo=True,  # set to False in production for performance
+# Requests carrying this header (any value) read from the primary, so a
+# client that has just written sees its own write despite replica lag.
+READ_YOUR_WRITES_HEADER = "X-Read-Your-Writes"
+
+
+def _create_engine(url: str, name: str):
+    if url.startswith("sqlite"):
+        return _create_sqlite_engine(url, name)
+    return create_async_engine(
+        url,
+        echo=settings.DB_ECHO,
+        poolclass=instrumented_pool(name),
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+    )
+
+
+def _create_sqlite_engine(url: str, name: str):
+    # an in-memory database lives and dies with its connection, so keep
+    # exactly one and let sessions queue for it
+    in_memory = ":memory:" in url
+    sqlite_engine = create_async_engine(
+        url,
+        echo=settings.DB_ECHO,
+        poolclass=instrumented_pool(name),
+        pool_size=1 if in_memory else settings.DB_POOL_SIZE,
+        max_overflow=0 if in_memory else settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=-1 if in_memory else settings.DB_POOL_RECYCLE,
+        connect_args={"check_same_thread": False},
+        # SQLite's JSON paths match keys literally, so store emoji unescaped
+        json_serializer=lambda value: json.dumps(value, ensure_ascii=False),
+    )
+
+    @event.listens_for(sqlite_engine.sync_engine, "connect")
+    def _set_pragmas(dbapi_connection, _record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        if not in_memory:
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.close()
+
+    return sqlite_engine
+
+
+# ✅ Create Async Engine (pool sizing and echo come from settings)
+engine = _create_engine(DATABASE_URL, "primary")
+
+# ✅ Optional read-only replica; None when DATABASE_REPLICA_URL is unset
+replica_engine = (
+    _create_engine(settings.DATABASE_REPLICA_URL, "replica") if settings.DATABASE_REPLICA_URL else None
 )
 
 # ✅ Create session factory
@@ -25,6 +74,13 @@ AsyncSessionLocal = sessionmaker(
     expire_on_commit=False
 )
 
+# ✅ Session factory for read-only handlers; None without a replica
+ReadSessionLocal = sessionmaker(
+    bind=replica_engine,
+    class_=AsyncSession,
+    expire_on_commit=False
+) if replica_engine is not None else None
+
 # ✅ Base class for all models
 Base = declarative_base()
 
@@ -38,6 +94,20 @@ async def get_db():
             await session.close()
 
 
+# ✅ Dependency for read-only routes: replica unless the client asked for read-your-writes.
+# Reads that stay on the primary reuse the request's get_db session (the one
+# authentication already used), so they don't hold a second connection.
+async def get_read_db(request: Request, primary: AsyncSession = Depends(get_db)):
+    if ReadSessionLocal is None or request.headers.get(READ_YOUR_WRITES_HEADER):
+        yield primary
+        return
+    async with ReadSessionLocal() as session:
+        try:
+            yield session
+        finally:
+            await session.close()
+
+
 # ✅ Helper function to fetch a user by email
 async def get_user_by_email(session: AsyncSession, email: str, role: str = None):
     """
@@ -0,0 +1,213 @@
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import changes, schemas
+from .config import settings
+from .models import ShoutOut, ShoutOutChange, ShoutOutTag, User
+from .pagination import encode_cursor, encode_sync_token
+from .portable import json_tuple_agg
+
+
+# ---------------------------
+# Feed query engine
+# ---------------------------
+def _page_select():
+    """The shoutout columns ShoutOutOut needs, with the author's name."""
+    return (
+        select(
+            ShoutOut.id,
+            ShoutOut.author_id,
+            ShoutOut.message,
+            ShoutOut.image_url,
+            ShoutOut.image_renditions,
+            ShoutOut.created_at,
+            ShoutOut.reaction_counts,
+            ShoutOut.comments_count,
+            User.name.label("author_name"),
+        )
+        .outerjoin(User, User.id == ShoutOut.author_id)
+    )
+
+
+def _hydrate(page):
+    """Join tags (aggregated in a CTE scoped to the page) onto a page CTE."""
+    # tagged users as [[user_id, name], ...] in tagging order
+    tags = (
+        select(
+            ShoutOutTag.shoutout_id,
+            json_tuple_agg(ShoutOutTag.id, ShoutOutTag.user_id, User.name).label("tagged"),
+        )
+        .join(User, User.id == ShoutOutTag.user_id)
+        .where(ShoutOutTag.shoutout_id.in_(select(page.c.id)))
+        .group_by(ShoutOutTag.shoutout_id)
+        .cte("tags")
+    )
+
+    return (
+        select(
+            page.c.id,
+            page.c.author_id,
+            page.c.author_name,
+            page.c.message,
+            page.c.image_url,
+            page.c.image_renditions,
+            page.c.created_at,
+            page.c.reaction_counts,
+            page.c.comments_count,
+            tags.c.tagged,
+        )
+        .select_from(page)
+        .outerjoin(tags, tags.c.shoutout_id == page.c.id)
+        .order_by(page.c.created_at.desc(), page.c.id.desc())
+    )
+
+
+def build_feed_statement(department: str, page_size: int, after: Optional[Tuple[datetime, int]] = None):
+    """
+    One SELECT that assembles a whole feed page: the shoutout columns,
+    denormalized engagement counters and author name, plus tags aggregated
+    in a CTE scoped to the page. Only the columns ShoutOutOut needs are
+    selected, so no ORM entities are built. The department's sync
+    position rides along so the page and its sync token come from the same
+    snapshot.
+
+    Fetches page_size + 1 rows so the caller can tell whether there is a
+    next page.
+    """
+    page = (
+        _page_select()
+        .where(ShoutOut.department == department)
+        .order_by(ShoutOut.created_at.desc(), ShoutOut.id.desc())
+        .limit(page_size + 1)
+    )
+    if after is not None:
+        page = page.where(tuple_(ShoutOut.created_at, ShoutOut.id) < tuple_(*after))
+
+    return _hydrate(page.cte("page")).add_columns(changes.sync_position(department).label("sync_position"))
+
+
+def build_shoutouts_statement(shoutout_ids: Sequence[int]):
+    """Same shape as a feed page, for an explicit set of shoutouts."""
+    return _hydrate(_page_select().where(ShoutOut.id.in_(list(shoutout_ids))).cte("page"))
+
+
+def _to_item(row) -> schemas.ShoutOutOut:
+    tagged = row.tagged or []
+    return schemas.ShoutOutOut(
+        id=row.id,
+        author_id=row.author_id,
+        author_name=row.author_name or "Anonymous",
+        message=row.message,
+        image_url=row.image_url,
+        image_renditions=row.image_renditions or {},
+        created_at=row.created_at.isoformat() if row.created_at else None,
+        tagged_users=[uid for uid, _ in tagged],
+        tagged_user_names=[name or str(uid) for uid, name in tagged],
+        reactions=row.reaction_counts or {},
+        comments_count=row.comments_count or 0,
+    )
+
+
+async def load_feed_page(
+    db: AsyncSession,
+    department: str,
+    page_size: int,
+    after: Optional[Tuple[datetime, int]] = None,
+) -> schemas.FeedPage:
+    """Run the feed statement in a single round trip and shape the rows."""
+    result = await db.execute(build_feed_statement(department, page_size, after))
+    rows = result.all()
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+
+    next_cursor = None
+    if has_more and rows[-1].created_at:
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+
+    sync_token = None
+    if after is None:
+        position = rows[0].sync_position if rows else await changes.current_sync_position(db, department)
+        sync_token = encode_sync_token(position)
+
+    return schemas.FeedPage(items=[_to_item(row) for row in rows], next_cursor=next_cursor, sync_token=sync_token)
+
+
+async def load_shoutouts(db: AsyncSession, shoutout_ids: Sequence[int]) -> List[schemas.ShoutOutOut]:
+    """Hydrate specific shoutouts (newest first) in one round trip."""
+    if not shoutout_ids:
+        return []
+    result = await db.execute(build_shoutouts_statement(shoutout_ids))
+    return [_to_item(row) for row in result.all()]
+
+
+# ---------------------------
+# Delta sync
+# ---------------------------
+async def load_feed_changes(db: AsyncSession, department: str, since: Optional[int]) -> schemas.FeedChanges:
+    """
+    Replay the department's change log from `since` up to the committed
+    horizon as a minimal diff. The common "nothing changed" refresh costs
+    one indexed min lookup.
+    """
+    bounds = await db.execute(
+        select(func.min(changes.position), changes.horizon()).where(ShoutOutChange.department == department)
+    )
+    oldest, until = bounds.one()
+    if oldest is None:
+        until = 0  # nothing logged yet: the first changes replay from the start
+    sync_token = encode_sync_token(until)
+
+    # A retired token, one from the future, or one older than the oldest
+    # retained change (anything between may have been pruned) can't be
+    # replayed safely.
+    if since is None or since > until or 0 < since < oldest:
+        return schemas.FeedChanges(sync_token=sync_token, reset=True)
+    if since == until:
+        return schemas.FeedChanges(sync_token=sync_token)
+
+    result = await db.execute(changes.build_changes_statement(department, since, until, settings.SYNC_MAX_CHANGES + 1))
+    rows = result.all()
+    if len(rows) > settings.SYNC_MAX_CHANGES:
+        return schemas.FeedChanges(sync_token=sync_token, reset=True)
+
+    kinds: Dict[int, Set[str]] = {}
+    for row in rows:
+        kinds.setdefault(row.shoutout_id, set()).add(row.kind)
+
+    deleted = [sid for sid, k in kinds.items() if changes.DELETED in k]
+    live = {sid: k for sid, k in kinds.items() if changes.DELETED not in k}
+    created_ids = [sid for sid, k in live.items() if changes.CREATED in k]
+    edited_ids = [sid for sid, k in live.items() if changes.CREATED not in k and changes.EDITED in k]
+    updated_ids = [
+        sid for sid, k in live.items()
+        if changes.CREATED not in k and k & {changes.REACTIONS, changes.COMMENTS, changes.RENDITIONS}
+    ]
+
+    updated: List[schemas.ShoutOutCounts] = []
+    if updated_ids:
+        counts = await db.execute(
+            select(ShoutOut.id, ShoutOut.reaction_counts, ShoutOut.comments_count, ShoutOut.image_renditions)
+            .where(ShoutOut.id.in_(updated_ids))
+        )
+        updated = [
+            schemas.ShoutOutCounts(
+                id=r.id,
+                reactions=r.reaction_counts or {},
+                comments_count=r.comments_count or 0,
+                image_renditions=r.image_renditions or {},
+            )
+            for r in counts.all()
+        ]
+
+    hydrated = await load_shoutouts(db, created_ids + edited_ids)
+    return schemas.FeedChanges(
+        sync_token=sync_token,
+        created=[item for item in hydrated if item.id not in edited_ids],
+        edited=[item for item in hydrated if item.id in edited_ids],
+        updated=updated,
+        reported=[sid for sid, k in live.items() if changes.REPORTED in k],
+        deleted=deleted,
+    )
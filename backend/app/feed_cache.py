@@ -0,0 +1,92 @@
+from typing import Optional
+
+from cachetools import TTLCache
+
+from . import schemas
+from .config import settings
+
+
+# ---------------------------
+# Per-department feed cache
+# ---------------------------
+class FeedCache:
+    """
+    In-process, size-bounded TTL cache of first feed pages, keyed by
+    department (then page size). Each entry remembers the department's
+    content version (see versions.py) and only hits while that version is
+    still current, so a write handled by another worker, committed while
+    a slow reader was building its page, or committed after a write that
+    took a later change id, never serves stale data.
+    Local write paths also call invalidate() to free the entry right away.
+
+    Checking the version is still a query. To spare the hottest pages even
+    that, a version read is reused for version_ttl seconds: this worker's
+    own writes invalidate it at once, while writes handled by other
+    workers show up (in pages and in ETags) up to version_ttl late.
+    0 reads the version on every request.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, version_ttl: float = 0.0):
+        self._pages: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._versions: Optional[TTLCache] = TTLCache(maxsize=maxsize, ttl=version_ttl) if version_ttl > 0 else None
+        self.hits = 0
+        self.misses = 0
+        self.version_hits = 0
+        self.invalidations = 0
+
+    def version(self, department: str) -> Optional[int]:
+        """The department's version if it was read less than version_ttl ago, else None."""
+        version = self._versions.get(department) if self._versions is not None else None
+        if version is not None:
+            self.version_hits += 1
+        return version
+
+    def remember_version(self, department: str, version: int) -> None:
+        if self._versions is not None:
+            self._versions[department] = version
+
+    def get(self, department: str, page_size: int, version: int) -> Optional[schemas.FeedPage]:
+        entry = self._pages.get(department, {}).get(page_size)
+        if entry is None or entry[0] != version:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[1]
+
+    def put(self, department: str, page_size: int, version: int, page: schemas.FeedPage) -> None:
+        pages = dict(self._pages.get(department, {}))
+        pages[page_size] = (version, page)
+        self._pages[department] = pages
+
+    def invalidate(self, department: Optional[str] = None) -> None:
+        """Drop one department's pages, or everything when department is None."""
+        self.invalidations += 1
+        if department is None:
+            self._pages.clear()
+            if self._versions is not None:
+                self._versions.clear()
+        else:
+            self._pages.pop(department, None)
+            if self._versions is not None:
+                self._versions.pop(department, None)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "version_hits": self.version_hits,
+            "invalidations": self.invalidations,
+            "size": len(self._pages),
+            "maxsize": self._pages.maxsize,
+            "ttl_seconds": self._pages.ttl,
+            "version_ttl_seconds": self._versions.ttl if self._versions is not None else 0.0,
+        }
+
+
+feed_cache = FeedCache(
+    maxsize=settings.FEED_CACHE_SIZE,
+    ttl=settings.FEED_CACHE_TTL_SECONDS,
+    version_ttl=settings.FEED_VERSION_TTL_SECONDS,
+)
@@ -0,0 +1,86 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from fastapi import HTTPException, status
+
+from .config import settings
+
+
+# ---------------------------
+# Bounded password-hashing pool
+# ---------------------------
+class HashingPool:
+    """
+    Runs bcrypt on a small dedicated thread pool (bcrypt releases the GIL)
+    so a login spike can't block the event loop. At most `workers` hashes
+    run at once and at most `max_queue` more wait; beyond that callers get
+    an immediate 503 instead of queueing behind work they would time out on
+    anyway.
+    """
+
+    def __init__(self, workers: int, max_queue: int):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self._busy_seconds = 0.0
+
+    @property
+    def queued(self) -> int:
+        return max(self.in_flight - self.workers, 0)
+
+    def _pool(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        return self._executor
+
+    async def run(self, fn, *args):
+        if self.in_flight >= self.workers + self.max_queue:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Server is busy, please retry shortly",
+                headers={"Retry-After": "1"},
+            )
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        started = time.perf_counter()
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(self._pool(), fn, *args)
+        except BaseException:
+            self.failed += 1
+            raise
+        else:
+            self.completed += 1
+            return result
+        finally:
+            self.in_flight -= 1
+            self._busy_seconds += time.perf_counter() - started
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        finished = self.completed + self.failed
+        return {
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "peak_in_flight": self.peak_in_flight,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "avg_latency_ms": round(1000 * self._busy_seconds / finished, 1) if finished else None,
+        }
+
+
+hashing_pool = HashingPool(workers=settings.HASHING_WORKERS, max_queue=settings.HASHING_MAX_QUEUE)
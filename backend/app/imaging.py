@@ -0,0 +1,40 @@
+"""
+Image renditions, rendered in worker processes (see renditions.py).
+
+Kept free of app imports so a freshly spawned worker only loads Pillow.
+"""
+import os
+from typing import Dict, Tuple
+
+from PIL import Image, ImageOps
+
+# name -> target width in px; feed cards are shown about 400px wide
+RENDITION_WIDTHS: Tuple[Tuple[str, int], ...] = (("thumb", 160), ("card", 480), ("large", 960))
+
+
+def render_renditions(source: str, dest_dir: str, stem: str, quality: int) -> Dict[str, str]:
+    """
+    Write a resized WebP of `source` per rendition into dest_dir and return
+    {name: filename}. Never upscales: renditions wider than the image
+    collapse into one at the image's own width. Animated images are left
+    alone (a still frame would change what people posted), so they get {}.
+    """
+    with Image.open(source) as image:
+        if getattr(image, "is_animated", False):
+            return {}
+        image = ImageOps.exif_transpose(image)  # phone photos carry their rotation in EXIF
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "transparency" in image.info or image.mode in ("LA", "PA") else "RGB")
+
+        rendered: Dict[str, str] = {}
+        for name, width in RENDITION_WIDTHS:
+            target = min(width, image.width)
+            filename = f"{stem}-{target}w.webp"
+            if filename not in rendered.values():
+                height = max(1, round(image.height * target / image.width))
+                resized = image if target == image.width else image.resize((target, height), Image.LANCZOS)
+                path = os.path.join(dest_dir, filename)
+                resized.save(f"{path}.part", "WEBP", quality=quality, method=4)
+                os.replace(f"{path}.part", path)
+            rendered[name] = filename
+        return rendered
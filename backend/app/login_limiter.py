@@ -0,0 +1,204 @@
+"""
+Login admission control.
+
+Every login attempt must take a token from two buckets, one for the email
+address and one for the client IP, before any bcrypt work is queued. A
+rejection is decided from in-process state alone, so it never costs a
+database round trip or a hash.
+
+With LOGIN_LIMIT_SHARED the buckets are also kept in the login_buckets
+table: a background task pushes each worker's consumption every
+LOGIN_LIMIT_SYNC_SECONDS in one upsert and pulls back the shared level.
+The request path still never waits on Postgres; between syncs a worker can
+overshoot a bucket by at most what it admitted itself.
+"""
+import asyncio
+import logging
+import math
+import time
+from typing import Dict, Optional, Tuple
+
+from cachetools import TTLCache
+from sqlalchemy import Float, String, column, delete, func, select, values
+from sqlalchemy.dialects.postgresql import insert
+
+from .config import settings
+from .database import AsyncSessionLocal
+from .models import LoginBucket
+
+logger = logging.getLogger(__name__)
+
+
+class Bucket:
+    __slots__ = ("tokens", "updated", "pending", "capacity", "rate")
+
+    def __init__(self, capacity: float, rate: float):
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.pending = 0  # taken here since the last shared sync
+        self.capacity = capacity
+        self.rate = rate  # tokens per second
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait(self) -> float:
+        """Seconds until one token is available."""
+        return max(1 - self.tokens, 0) / self.rate
+
+
+class LoginLimiter:
+    def __init__(self, email_burst: int, email_per_minute: float, ip_burst: int, ip_per_minute: float, maxsize: int, sync_seconds: float):
+        self.limits = {
+            "email": (float(email_burst), email_per_minute / 60),
+            "ip": (float(ip_burst), ip_per_minute / 60),
+        }
+        # an idle bucket refills completely, so forgetting it is lossless
+        idle = max(capacity / rate for capacity, rate in self.limits.values())
+        self._buckets: TTLCache = TTLCache(maxsize=maxsize, ttl=idle)
+        self._idle_seconds = idle
+        self.sync_seconds = sync_seconds
+        self._task: Optional[asyncio.Task] = None
+        self.admitted = 0
+        self.rejected = 0
+        self.rejected_by = {"email": 0, "ip": 0}
+        self.syncs = 0
+        self.sync_failures = 0
+
+    def _bucket(self, kind: str, value: str) -> Tuple[str, Bucket]:
+        key = f"{kind}:{value}"
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = Bucket(*self.limits[kind])
+        return key, bucket
+
+    def admit(self, email: str, ip: str) -> float:
+        """Take one attempt from both buckets; 0 when admitted, else seconds to wait."""
+        now = time.monotonic()
+        buckets = {"email": self._bucket("email", email.strip().lower())[1], "ip": self._bucket("ip", ip)[1]}
+        for bucket in buckets.values():
+            bucket.refill(now)
+
+        blocked = {kind: bucket.wait() for kind, bucket in buckets.items() if bucket.tokens < 1}
+        if blocked:
+            self.rejected += 1
+            for kind in blocked:
+                self.rejected_by[kind] += 1
+            return max(blocked.values())
+
+        for bucket in buckets.values():
+            bucket.tokens -= 1
+            bucket.pending += 1
+        self.admitted += 1
+        return 0
+
+    # ---------------------------
+    # Cross-worker sharing
+    # ---------------------------
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            await self.sync()
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.sync_seconds)
+            try:
+                await self.sync()
+            except Exception:
+                self.sync_failures += 1
+                logger.exception("Login limiter sync failed")
+
+    async def sync(self) -> None:
+        """Push local consumption into login_buckets and adopt the shared levels."""
+        taken: Dict[str, Tuple[Bucket, int]] = {
+            key: (bucket, bucket.pending) for key, bucket in list(self._buckets.items()) if bucket.pending
+        }
+        if not taken:
+            return
+
+        # a new row starts full minus what was taken; an existing one refills
+        # for the elapsed time first (on the database clock, shared by all workers)
+        batch = values(
+            column("key", String),
+            column("taken", Float),
+            column("capacity", Float),
+            column("refill_per_second", Float),
+            name="batch",
+        ).data([(key, float(n), bucket.capacity, bucket.rate) for key, (bucket, n) in taken.items()])
+        stmt = insert(LoginBucket).from_select(
+            ["key", "tokens", "capacity", "refill_per_second"],
+            select(batch.c.key, batch.c.capacity - batch.c.taken, batch.c.capacity, batch.c.refill_per_second),
+        )
+        elapsed = func.extract("epoch", func.now() - LoginBucket.updated_at)
+        taken_now = stmt.excluded.capacity - stmt.excluded.tokens
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[LoginBucket.key],
+            set_={
+                "tokens": func.greatest(
+                    func.least(LoginBucket.capacity, LoginBucket.tokens + elapsed * LoginBucket.refill_per_second) - taken_now,
+                    0,
+                ),
+                "capacity": stmt.excluded.capacity,
+                "refill_per_second": stmt.excluded.refill_per_second,
+                "updated_at": func.now(),
+            },
+        ).returning(LoginBucket.key, LoginBucket.tokens)
+
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(stmt)
+            shared = dict(result.all())
+            await db.execute(
+                delete(LoginBucket).where(
+                    LoginBucket.updated_at < func.now() - func.make_interval(0, 0, 0, 0, 0, 0, self._idle_seconds)
+                )
+            )
+            await db.commit()
+
+        now = time.monotonic()
+        for key, (bucket, n) in taken.items():
+            bucket.pending -= n
+            if key in shared:
+                # attempts admitted while the sync was in flight are still ours to count
+                bucket.tokens = shared[key] - bucket.pending
+                bucket.updated = now
+        self.syncs += 1
+
+    def stats(self) -> dict:
+        return {
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "rejected_by": dict(self.rejected_by),
+            "tracked_buckets": len(self._buckets),
+            "shared": self.running,
+            "syncs": self.syncs,
+            "sync_failures": self.sync_failures,
+        }
+
+
+def retry_after_header(seconds: float) -> str:
+    return str(max(1, math.ceil(seconds)))
+
+
+login_limiter = LoginLimiter(
+    email_burst=settings.LOGIN_EMAIL_BURST,
+    email_per_minute=settings.LOGIN_EMAIL_PER_MINUTE,
+    ip_burst=settings.LOGIN_IP_BURST,
+    ip_per_minute=settings.LOGIN_IP_PER_MINUTE,
+    maxsize=settings.LOGIN_LIMITER_SIZE,
+    sync_seconds=settings.LOGIN_LIMIT_SYNC_SECONDS,
+)
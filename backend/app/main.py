@@ -1,9 +1,16 @@
 import os
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from .database import engine
+from .config import settings
+from .database import engine, replica_engine
 from .models import Base
+from .migrate import check_schema
+from .reaction_buffer import reaction_buffer
+from .hashing import hashing_pool
+from .login_limiter import login_limiter
+from .query_accounting import QueryAccountingMiddleware, instrument_engine
+from .uploads import UPLOAD_DIR, UPLOAD_URL_PREFIX, UploadFiles, UploadRedirects
+from .renditions import rendition_pool
 from .routers import shoutouts_router
 from .routers import notifications_router
 from .routers import metrics_router
@@ -28,8 +35,19 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
 
+# -------------------------
+# ✅ Per-request SQL accounting (Server-Timing header)
+# -------------------------
+if settings.QUERY_ACCOUNTING_ENABLED:
+    for db_engine in (engine, replica_engine):
+        if db_engine is not None:
+            instrument_engine(db_engine)
+    # static files and the event stream run no queries worth a header
+    app.add_middleware(QueryAccountingMiddleware, skip_prefixes=(UPLOAD_URL_PREFIX, "/auth/shoutouts/stream"))
+
 # -------------------------
 # ✅ Include Routers
 # -------------------------
@@ -49,11 +67,41 @@ app.include_router(employeeofmonth_router)  # Employee of the Month routes (/emp
 # -------------------------
 @app.on_event("startup")
 async def on_startup():
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    if engine.dialect.name == "sqlite":
+        # throwaway SQLite databases are built straight from the models
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+    else:
+        # the schema is migrated out of band (python -m app.migrate); just
+        # make sure it is the one this build was written against
+        await check_schema(engine)
+    if settings.REACTION_BUFFER_ENABLED:
+        reaction_buffer.start()
+    if settings.LOGIN_LIMIT_SHARED:
+        login_limiter.start()
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    # ✅ Drain buffered reactions before the process exits
+    await reaction_buffer.stop()
+    await login_limiter.stop()
+    hashing_pool.shutdown()
+    rendition_pool.shutdown()
 
 # -------------------------
 # ✅ Serve Uploads Directory
 # -------------------------
-os.makedirs("uploads", exist_ok=True)
-app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
+# (the same directory create_shoutout writes to, whatever the working directory;
+# on object storage it only holds uploads in flight)
+os.makedirs(UPLOAD_DIR, exist_ok=True)
+if settings.STORAGE_BACKEND == "local":
+    # ✅ Cached as immutable; optionally handed to the front proxy via X-Accel-Redirect
+    app.mount(
+        UPLOAD_URL_PREFIX,
+        UploadFiles(directory=UPLOAD_DIR, accel_redirect_prefix=settings.UPLOAD_ACCEL_REDIRECT_PREFIX),
+        name="uploads",
+    )
+else:
+    # ✅ Objects are public in the bucket (or its CDN); old /uploads URLs redirect there
+    app.mount(UPLOAD_URL_PREFIX, UploadRedirects(), name="uploads")
@@ -0,0 +1,87 @@
+"""
+Schema migrations.
+
+The schema is owned by Alembic (backend/alembic). Deploys run
+
+    python -m app.migrate
+
+once before starting the app; it brings the database to the head revision.
+A database that create_all built before the app was versioned (tables but
+no alembic_version) is stamped at the baseline first and upgraded from
+there. On SQLite (SQLITE_PATH) it does nothing: the app builds those
+throwaway databases straight from the models at startup.
+
+The app itself never creates tables on Postgres: at startup it only reads
+the stored revision and refuses to serve if it isn't the head this build
+expects.
+"""
+import asyncio
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+
+from alembic import command
+from alembic.config import Config
+from alembic.runtime.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from sqlalchemy import inspect
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from .config import settings
+
+ALEMBIC_INI = Path(__file__).resolve().parent.parent / "alembic.ini"
+BASELINE_REVISION = "0000"
+
+
+def alembic_config() -> Config:
+    return Config(str(ALEMBIC_INI))
+
+
+@lru_cache(maxsize=1)
+def expected_head() -> str:
+    """The head revision shipped with this build (read from local files only)."""
+    return ScriptDirectory.from_config(alembic_config()).get_current_head()
+
+
+async def stored_revision(engine: AsyncEngine) -> Optional[str]:
+    async with engine.connect() as conn:
+        return await conn.run_sync(lambda sync_conn: MigrationContext.configure(sync_conn).get_current_revision())
+
+
+async def check_schema(engine: AsyncEngine) -> None:
+    """Raise unless the database is at the head revision."""
+    current, head = await stored_revision(engine), expected_head()
+    if current != head:
+        raise RuntimeError(
+            f"Database schema is at revision {current or '(none)'} but this build expects {head}; "
+            "run `python -m app.migrate` first"
+        )
+
+
+async def _is_unversioned() -> bool:
+    """True for a create_all-built database that Alembic has never touched."""
+    engine = create_async_engine(settings.DATABASE_URL, poolclass=NullPool)
+    try:
+        async with engine.connect() as conn:
+            tables = await conn.run_sync(lambda sync_conn: set(inspect(sync_conn).get_table_names()))
+    finally:
+        await engine.dispose()
+    return "users" in tables and "alembic_version" not in tables
+
+
+def main():
+    if make_url(settings.DATABASE_URL).get_backend_name() == "sqlite":
+        print("SQLite database: built from the models at startup, nothing to migrate")
+        return
+    config = alembic_config()
+    if asyncio.run(_is_unversioned()):
+        print(f"Unversioned database: stamping baseline {BASELINE_REVISION}")
+        command.stamp(config, BASELINE_REVISION)
+    command.upgrade(config, "head")
+    print(f"Database schema is at {expected_head()}")
+
+
+if __name__ == "__main__":
+    main()
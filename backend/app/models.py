@@ -1,13 +1,14 @@
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, Boolean, func
+from sqlalchemy import Column, Integer, BigInteger, Float, String, Text, ForeignKey, DateTime, Boolean, Index, UniqueConstraint, func, text, true
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from .database import Base
-from sqlalchemy.dialects.postgresql import JSONB
+from .portable import BigIntegerKey, JSONDocument, current_xact_id
 
 
 # ---------------- USER MODEL ----------------
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (Index("ix_users_department", "department"),)
 
     id = Column(Integer, primary_key=True, index=True)
     username = Column(String(50), unique=True, nullable=False)
@@ -21,6 +22,8 @@ class User(Base):
     group_members = Column(String, nullable=True)
     skills = Column(String, nullable=True)
     experience = Column(String, nullable=True)
+    # suspended accounts are refused at login and by get_current_user
+    is_active = Column(Boolean, nullable=False, default=True, server_default=true())
     
     # ✅ Relationships
     shoutouts = relationship("ShoutOut", back_populates="author", cascade="all, delete-orphan")
@@ -43,6 +46,13 @@ class SecurityKey(Base):
 # ---------------- SHOUTOUT ----------------
 class ShoutOut(Base):
     __tablename__ = "shoutouts"
+    __table_args__ = (
+        # feed pages and keyset cursors: department, newest first
+        Index("ix_shoutouts_department_created_at", "department", "created_at", "id"),
+        Index("ix_shoutouts_author_id_created_at", "author_id", "created_at"),
+        # the reported queue is a sliver of the table
+        Index("ix_shoutouts_reported", "department", "created_at", postgresql_where=text("is_reported"), sqlite_where=text("is_reported")),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     author_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -51,7 +61,14 @@ class ShoutOut(Base):
     department = Column(String(100), nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
     is_reported = Column(Boolean, default=False)
-    reactions = Column(JSONB, default={})  # ✅ this must exist
+
+    # ✅ Denormalized engagement counters, kept in step on write (see counters.py).
+    # The map lives in the "reactions" column; the attribute is renamed so the
+    # relationship below no longer shadows it.
+    reaction_counts = Column("reactions", JSONDocument, nullable=False, default=dict, server_default=text("'{}'"))
+    comments_count = Column(Integer, nullable=False, default=0, server_default=text("0"))
+    # {name: url} of resized WebP copies of image_url; NULL until rendered (see renditions.py)
+    image_renditions = Column(JSONDocument, nullable=True)
 
     # ✅ Relationships
     author = relationship("User", back_populates="shoutouts")
@@ -63,6 +80,10 @@ class ShoutOut(Base):
 # ---------------- SHOUTOUT TAG ----------------
 class ShoutOutTag(Base):
     __tablename__ = "shoutout_tags"
+    __table_args__ = (
+        Index("ix_shoutout_tags_shoutout_id", "shoutout_id"),
+        Index("ix_shoutout_tags_user_id", "user_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     shoutout_id = Column(Integer, ForeignKey("shoutouts.id"), nullable=False)
@@ -75,6 +96,11 @@ class ShoutOutTag(Base):
 # ---------------- SHOUTOUT REACTION ----------------
 class ShoutOutReaction(Base):
     __tablename__ = "shoutout_reactions"
+    __table_args__ = (
+        # one reaction per user per shoutout; the toggle upserts against it
+        UniqueConstraint("shoutout_id", "user_id", name="uq_shoutout_reactions_shoutout_id_user_id"),
+        Index("ix_shoutout_reactions_user_id", "user_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     shoutout_id = Column(Integer, ForeignKey("shoutouts.id"), nullable=False)
@@ -88,6 +114,10 @@ class ShoutOutReaction(Base):
 # ---------------- SHOUTOUT COMMENT ----------------
 class ShoutOutComment(Base):
     __tablename__ = "shoutout_comments"
+    __table_args__ = (
+        Index("ix_shoutout_comments_shoutout_id_created_at", "shoutout_id", "created_at", "id"),
+        Index("ix_shoutout_comments_user_id_created_at", "user_id", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     shoutout_id = Column(Integer, ForeignKey("shoutouts.id"), nullable=False)
@@ -99,6 +129,54 @@ class ShoutOutComment(Base):
     shoutout = relationship("ShoutOut", back_populates="comments")
 
 
+# ---------------- SHOUTOUT CHANGE LOG (delta sync) ----------------
+class ShoutOutChange(Base):
+    __tablename__ = "shoutout_changes"
+    __table_args__ = (
+        Index("ix_shoutout_changes_department_id", "department", "id"),
+        # sync tokens and feed versions are commit positions (see changes.py)
+        Index("ix_shoutout_changes_department_xid", "department", "xid"),
+        Index("ix_shoutout_changes_xid", "xid"),
+    )
+
+    id = Column(BigIntegerKey, primary_key=True)
+    # the writing transaction (Postgres; NULL on SQLite, where ids are in commit order)
+    xid = Column(BigInteger, nullable=True, default=current_xact_id())
+    department = Column(String(100), nullable=False)
+    # no FK: rows for deleted shoutouts must outlive them
+    shoutout_id = Column(Integer, nullable=False)
+    kind = Column(String(20), nullable=False)  # created / edited / reactions / comments / reported / deleted
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+# ---------------- LOGIN RATE-LIMIT BUCKETS (shared across workers) ----------------
+class LoginBucket(Base):
+    __tablename__ = "login_buckets"
+
+    key = Column(String(320), primary_key=True)  # "email:<address>" or "ip:<address>"
+    tokens = Column(Float, nullable=False)
+    capacity = Column(Float, nullable=False)
+    refill_per_second = Column(Float, nullable=False)
+    updated_at = Column(DateTime, nullable=False, server_default=func.now())
+
+
+# ---------------- UPLOADED FILES (content-addressed, see uploads.py) ----------------
+class UploadBlob(Base):
+    __tablename__ = "upload_blobs"
+    # the sweep only looks at blobs nothing refers to any more
+    __table_args__ = (
+        Index("ix_upload_blobs_unreferenced", "updated_at", postgresql_where=text("ref_count <= 0"), sqlite_where=text("ref_count <= 0")),
+    )
+
+    digest = Column(String(64), primary_key=True)  # sha256 hex, also the stem of filename
+    filename = Column(String(80), nullable=False)
+    size = Column(BigInteger, nullable=False)
+    ref_count = Column(Integer, nullable=False)  # shoutouts whose image_url is this file
+    # {name: url} renditions rendered once per file and shared by every shoutout using it
+    renditions = Column(JSONDocument, nullable=True)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow)  # last count change
+
+
 # ---------------- NOTIFICATIONS (for admin messages) ----------------
 class Notification(Base):
     __tablename__ = "notifications"
@@ -121,6 +199,7 @@ class Notification(Base):
 
 class EmployeeOfMonth(Base):
     __tablename__ = "employee_of_month"
+    __table_args__ = (Index("ix_employee_of_month_department_created_at", "department", "created_at"),)
 
     id = Column(Integer, primary_key=True, index=True)
     employee_id = Column(Integer, ForeignKey("users.id"), nullable=False)
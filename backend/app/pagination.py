@@ -0,0 +1,50 @@
+import base64
+from datetime import datetime
+from typing import Optional, Tuple
+
+from fastapi import HTTPException
+
+
+# ---------------------------
+# Opaque keyset cursors
+# ---------------------------
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    """Pack a (created_at, id) position into an opaque URL-safe token."""
+    raw = f"{created_at.isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Unpack a token produced by encode_cursor, or raise a 400."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, row_id = base64.urlsafe_b64decode(padded).decode().split("|", 1)
+        return datetime.fromisoformat(created_at), int(row_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+# ---------------------------
+# Delta sync tokens
+# ---------------------------
+def encode_sync_token(position: int) -> str:
+    """Wrap a change-log commit position in an opaque token."""
+    return base64.urlsafe_b64encode(f"v2|{position}".encode()).decode().rstrip("=")
+
+
+def decode_sync_token(token: str) -> Optional[int]:
+    """
+    Unpack a token produced by encode_sync_token, or raise a 400. v1
+    tokens (change ids, before the log was read in commit order) decode to
+    None: they can't be mapped onto a position, so the client starts over.
+    """
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        version, position = base64.urlsafe_b64decode(padded).decode().split("|", 1)
+        if version == "v1":
+            return None
+        if version != "v2":
+            raise ValueError(version)
+        return int(position)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid sync token")
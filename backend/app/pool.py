@@ -0,0 +1,103 @@
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+
+# ---------------------------
+# Connection pool telemetry
+# ---------------------------
+class PoolTelemetry:
+    """Counters for one engine's pool: how long checkouts wait and how often it overflows."""
+
+    def __init__(self, name: str, window: int = 1000):
+        self.name = name
+        self.pool: Optional[AsyncAdaptedQueuePool] = None
+        self.max_overflow: Optional[int] = None
+        self.checkouts = 0
+        self.overflow_checkouts = 0
+        self.timeouts = 0
+        self.max_wait = 0.0
+        self._total_wait = 0.0
+        self._recent = deque(maxlen=window)
+
+    def record(self, waited: float, overflowed: bool) -> None:
+        self.checkouts += 1
+        self._total_wait += waited
+        self._recent.append(waited)
+        self.max_wait = max(self.max_wait, waited)
+        if overflowed:
+            self.overflow_checkouts += 1
+
+    def stats(self) -> dict:
+        recent = sorted(self._recent)
+        pool = self.pool
+        return {
+            "pool_size": pool.size() if pool else None,
+            "checked_out": pool.checkedout() if pool else None,
+            "idle": pool.checkedin() if pool else None,
+            "overflow": max(pool.overflow(), 0) if pool else None,
+            "max_overflow": self.max_overflow,
+            "checkouts": self.checkouts,
+            "overflow_checkouts": self.overflow_checkouts,
+            "timeouts": self.timeouts,
+            "wait_ms": {
+                "avg": round(1000 * self._total_wait / self.checkouts, 3) if self.checkouts else None,
+                "p95_recent": round(1000 * recent[int(0.95 * (len(recent) - 1))], 3) if recent else None,
+                "max": round(1000 * self.max_wait, 3),
+            },
+        }
+
+
+pool_telemetry: Dict[str, PoolTelemetry] = {}
+
+# seconds the current checkout has spent opening a new connection, which is
+# not waiting (None outside a checkout)
+_connecting: ContextVar[Optional[float]] = ContextVar("connecting", default=None)
+
+
+def instrumented_pool(name: str):
+    """
+    An AsyncAdaptedQueuePool subclass that times how long every checkout
+    waits for a free slot; time spent opening a new connection is left
+    out. The telemetry hangs off the class, so it survives the pool being
+    recreated by engine.dispose().
+    """
+    telemetry = pool_telemetry.setdefault(name, PoolTelemetry(name))
+
+    class InstrumentedPool(AsyncAdaptedQueuePool):
+        def __init__(self, creator, pool_size: int = 5, max_overflow: int = 10, **kwargs):
+            super().__init__(creator, pool_size=pool_size, max_overflow=max_overflow, **kwargs)
+            telemetry.pool = self
+            telemetry.max_overflow = max_overflow
+
+        def _do_get(self):
+            if _connecting.get() is not None:
+                # QueuePool retries through _do_get; the outermost call times it
+                return super()._do_get()
+            token = _connecting.set(0.0)
+            started = time.perf_counter()
+            try:
+                connection = super()._do_get()
+                waited = time.perf_counter() - started - _connecting.get()
+            except exc.TimeoutError:
+                telemetry.timeouts += 1
+                raise
+            finally:
+                _connecting.reset(token)
+            telemetry.record(waited, self.overflow() > 0)
+            return connection
+
+        def _create_connection(self):
+            started = time.perf_counter()
+            try:
+                return super()._create_connection()
+            finally:
+                spent = _connecting.get()
+                if spent is not None:
+                    _connecting.set(spent + time.perf_counter() - started)
+
+    return InstrumentedPool
@@ -0,0 +1,166 @@
+"""
+Types and SQL expressions that compile on both Postgres and SQLite.
+
+Postgres is what production runs; SQLite (SQLITE_PATH) exists so the whole
+app can boot in a second for throwaway benchmarks and quick local runs.
+Anything the hot read paths need that the two spell differently lives
+here, as a type variant or a construct with one @compiles per dialect, so
+callers never branch on the dialect themselves.
+"""
+from sqlalchemy import JSON, BigInteger, Date, Integer
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.dialects.postgresql import JSONB, aggregate_order_by
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql import func
+from sqlalchemy.sql.functions import FunctionElement
+
+
+# ---------------------------
+# Types
+# ---------------------------
+# JSONB on Postgres, plain JSON (text) elsewhere
+JSONDocument = JSONB().with_variant(JSON(), "sqlite")
+
+# SQLite only auto-increments an INTEGER PRIMARY KEY
+BigIntegerKey = BigInteger().with_variant(Integer(), "sqlite")
+
+
+# ---------------------------
+# Statements
+# ---------------------------
+def upsert_insert(dialect_name: str):
+    """
+    The dialect's insert(), for INSERT ... ON CONFLICT. Both spell
+    on_conflict_do_update / excluded / returning the same way, but each
+    only compiles for its own dialect.
+    """
+    return sqlite.insert if dialect_name == "sqlite" else postgresql.insert
+
+
+# ---------------------------
+# Expressions
+# ---------------------------
+class json_tuple_agg(FunctionElement):
+    """
+    json_tuple_agg(order_by, a, b, ...): a JSON array of [a, b, ...] per
+    row of the group. Postgres orders it by `order_by`; SQLite (before
+    3.44) has no ordered aggregates and keeps scan order, which for an
+    indexed child table is insertion order anyway.
+    """
+
+    type = JSON()
+    inherit_cache = True
+
+
+@compiles(json_tuple_agg, "postgresql")
+def _json_tuple_agg_postgresql(element, compiler, **kw):
+    order_by, *values = element.clauses.clauses
+    return compiler.process(func.json_agg(aggregate_order_by(func.json_build_array(*values), order_by)), **kw)
+
+
+@compiles(json_tuple_agg)
+def _json_tuple_agg_default(element, compiler, **kw):
+    _, *values = element.clauses.clauses
+    return compiler.process(func.json_group_array(func.json_array(*values)), **kw)
+
+
+class json_object_agg(FunctionElement):
+    """json_object_agg(key, value): one {key: value, ...} object per group."""
+
+    type = JSONDocument
+    inherit_cache = True
+
+
+@compiles(json_object_agg, "postgresql")
+def _json_object_agg_postgresql(element, compiler, **kw):
+    return compiler.process(func.jsonb_object_agg(*element.clauses.clauses), **kw)
+
+
+@compiles(json_object_agg)
+def _json_object_agg_default(element, compiler, **kw):
+    return compiler.process(func.json_group_object(*element.clauses.clauses), **kw)
+
+
+class calendar_date(FunctionElement):
+    """calendar_date(timestamp): the day part, as a DATE."""
+
+    type = Date()
+    inherit_cache = True
+
+
+@compiles(calendar_date, "postgresql")
+def _calendar_date_postgresql(element, compiler, **kw):
+    return "CAST(%s AS DATE)" % compiler.process(element.clauses, **kw)
+
+
+@compiles(calendar_date)
+def _calendar_date_default(element, compiler, **kw):
+    # SQLite's CAST(... AS DATE) is numeric affinity and keeps only the year
+    return "date(%s)" % compiler.process(element.clauses, **kw)
+
+
+# ---------------------------
+# Commit order
+# ---------------------------
+# Postgres hands out serial ids at INSERT, not at COMMIT: a transaction can
+# take id 10, stall, and commit after another one has committed id 11. So
+# logs that readers tail by position (shoutout_changes) also store the
+# writer's transaction id and are read up to the oldest transaction still
+# running. SQLite runs one writer at a time, so its ids already are in
+# commit order and nothing is in flight below the newest one.
+class current_xact_id(FunctionElement):
+    """The writing transaction's id as a BIGINT; NULL where there is none (SQLite)."""
+
+    type = BigInteger()
+    inherit_cache = True
+
+
+@compiles(current_xact_id, "postgresql")
+def _current_xact_id_postgresql(element, compiler, **kw):
+    return "CAST(CAST(pg_current_xact_id() AS TEXT) AS BIGINT)"
+
+
+@compiles(current_xact_id)
+def _current_xact_id_default(element, compiler, **kw):
+    return "NULL"
+
+
+class commit_position(FunctionElement):
+    """commit_position(xid, id): a logged row's place in commit order."""
+
+    type = BigInteger()
+    inherit_cache = True
+
+
+@compiles(commit_position, "postgresql")
+def _commit_position_postgresql(element, compiler, **kw):
+    xid, _ = element.clauses.clauses
+    return compiler.process(xid, **kw)
+
+
+@compiles(commit_position)
+def _commit_position_default(element, compiler, **kw):
+    _, row_id = element.clauses.clauses
+    return compiler.process(row_id, **kw)
+
+
+class committed_horizon(FunctionElement):
+    """
+    committed_horizon(next_id): the commit position below which every
+    write has finished, as of the statement's snapshot. Postgres: the
+    oldest transaction id still running (the snapshot's xmin). SQLite:
+    `next_id`, one past the newest id.
+    """
+
+    type = BigInteger()
+    inherit_cache = True
+
+
+@compiles(committed_horizon, "postgresql")
+def _committed_horizon_postgresql(element, compiler, **kw):
+    return "CAST(CAST(pg_snapshot_xmin(pg_current_snapshot()) AS TEXT) AS BIGINT)"
+
+
+@compiles(committed_horizon)
+def _committed_horizon_default(element, compiler, **kw):
+    return compiler.process(element.clauses, **kw)
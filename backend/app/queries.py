@@ -0,0 +1,104 @@
+"""
+Statements behind the busier routes that have no engine of their own
+(the feed and comments live in feed.py and comments.py). Routes build
+their queries here, so tests/test_query_plans.py EXPLAINs exactly what
+they run.
+"""
+from typing import Optional
+
+from sqlalchemy import func, select
+
+from .models import EmployeeOfMonth, ShoutOut, ShoutOutComment, ShoutOutTag, User
+
+
+# ---------------------------
+# Moderation
+# ---------------------------
+def build_moderation_statement(department: Optional[str] = None, reported_only: bool = False):
+    """Shoutouts with their author's name, newest first; one department or all."""
+    stmt = (
+        select(
+            ShoutOut.id,
+            ShoutOut.author_id,
+            User.name.label("author_name"),
+            ShoutOut.message,
+            ShoutOut.department,
+            ShoutOut.created_at,
+            ShoutOut.is_reported,
+        )
+        .join(User, User.id == ShoutOut.author_id)
+        .order_by(ShoutOut.created_at.desc())
+    )
+    if reported_only:
+        stmt = stmt.where(ShoutOut.is_reported == True)  # noqa: E712
+    if department is not None:
+        stmt = stmt.where(ShoutOut.department == department)
+    return stmt
+
+
+# ---------------------------
+# Personal metrics
+# ---------------------------
+def build_my_posts_statement(user_id: int, limit: Optional[int] = None):
+    stmt = select(ShoutOut).where(ShoutOut.author_id == user_id).order_by(ShoutOut.created_at.desc())
+    return stmt if limit is None else stmt.limit(limit)
+
+
+def build_given_count_statement(user_id: int):
+    return select(func.count(ShoutOut.id)).where(ShoutOut.author_id == user_id)
+
+
+def build_received_count_statement(user_id: int):
+    return select(func.count(ShoutOutTag.id)).where(ShoutOutTag.user_id == user_id)
+
+
+def build_comments_count_statement(user_id: int):
+    return select(func.count(ShoutOutComment.id)).where(ShoutOutComment.user_id == user_id)
+
+
+def build_recent_received_statement(user_id: int, limit: int):
+    return (
+        select(ShoutOut, ShoutOutTag)
+        .join(ShoutOutTag, ShoutOutTag.shoutout_id == ShoutOut.id)
+        .where(ShoutOutTag.user_id == user_id)
+        .order_by(ShoutOut.created_at.desc())
+        .limit(limit)
+    )
+
+
+def build_recent_comments_statement(user_id: int, limit: int):
+    return (
+        select(ShoutOutComment)
+        .where(ShoutOutComment.user_id == user_id)
+        .order_by(ShoutOutComment.created_at.desc())
+        .limit(limit)
+    )
+
+
+# ---------------------------
+# Leaderboard and employee of the month
+# ---------------------------
+def build_leaderboard_statement(department: Optional[str] = None, limit: int = 5):
+    """Top authors by shoutout count; one department or all."""
+    query = (
+        select(
+            User.name.label("author_name"),
+            User.department,
+            func.count(ShoutOut.id).label("count"),
+        )
+        .join(User, User.id == ShoutOut.author_id)
+        .group_by(User.name, User.department)
+        .order_by(func.count(ShoutOut.id).desc())
+    )
+    if department is not None:
+        # shoutouts carry their author's department, so the feed index narrows the count
+        query = query.where(ShoutOut.department == department, User.department == department)
+    return query.limit(limit)
+
+
+def build_employee_of_month_statement(department: Optional[str] = None):
+    """The latest employee of the month; one department or all."""
+    query = select(EmployeeOfMonth).order_by(EmployeeOfMonth.created_at.desc())
+    if department is not None:
+        query = query.where(EmployeeOfMonth.department == department)
+    return query.limit(1)
@@ -0,0 +1,204 @@
+"""
+Per-request SQL accounting.
+
+Cursor-execute hooks on every engine add each statement to the tally of the
+request that issued it, found through a context variable (SQLAlchemy's
+greenlets inherit the request task's context). The middleware then reports
+the tally in a Server-Timing header, e.g.
+
+    Server-Timing: db;dur=12.4;desc="7 queries", db-slowest;dur=4.1
+
+The middleware is plain ASGI, so streamed bodies pass straight through,
+and it leaves alone paths it is told to skip (static uploads, the event
+stream) and WebSockets. The header goes out with the response start, so it
+covers the queries issued before then.
+
+With QUERY_STRICT_MODE set to "log" or "raise", a request that issues more
+than QUERY_MAX_PER_REQUEST statements, or the same statement text more than
+QUERY_MAX_REPEATS times (the usual shape of an N+1), is logged with its
+worst offender, or answered with a 500 so it fails loudly. Statements are
+already parameterised, so equal text means equal shape. "raise" is for
+development only: the check runs once the handler has returned, so the
+request's writes have already been committed and the 500 does not undo
+them.
+"""
+import logging
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Sequence
+
+from fastapi.responses import JSONResponse
+from sqlalchemy import event
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class RequestQueries:
+    __slots__ = ("count", "seconds", "slowest", "slowest_seconds", "shapes")
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.slowest: Optional[str] = None
+        self.slowest_seconds = 0.0
+        self.shapes: Counter = Counter()
+
+    def record(self, statement: str, seconds: float) -> None:
+        self.count += 1
+        self.seconds += seconds
+        self.shapes[statement] += 1
+        if seconds >= self.slowest_seconds:
+            self.slowest, self.slowest_seconds = statement, seconds
+
+    def most_repeated(self):
+        """(statement, times) for the statement issued most often, or (None, 0)."""
+        return self.shapes.most_common(1)[0] if self.shapes else (None, 0)
+
+    def server_timing(self) -> str:
+        noun = "query" if self.count == 1 else "queries"
+        return (
+            f'db;dur={1000 * self.seconds:.1f};desc="{self.count} {noun}", '
+            f"db-slowest;dur={1000 * self.slowest_seconds:.1f}"
+        )
+
+
+_current: ContextVar[Optional[RequestQueries]] = ContextVar("request_queries", default=None)
+
+
+# ---------------------------
+# Engine hooks
+# ---------------------------
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        context._query_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    queries = _current.get()
+    started = getattr(context, "_query_started", None)
+    if queries is not None and started is not None:
+        queries.record(statement, time.perf_counter() - started)
+
+
+def instrument_engine(engine: AsyncEngine) -> None:
+    event.listen(engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine.sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+# ---------------------------
+# Aggregates and strict mode
+# ---------------------------
+class QueryAccounting:
+    def __init__(self, strict_mode: str, max_per_request: int, max_repeats: int):
+        if strict_mode not in ("off", "log", "raise"):
+            raise ValueError(f"QUERY_STRICT_MODE must be off, log or raise, not {strict_mode!r}")
+        self.strict_mode = strict_mode
+        self.max_per_request = max_per_request
+        self.max_repeats = max_repeats
+        self.requests = 0
+        self.queries = 0
+        self.violations = 0
+        self._routes: Dict[str, List[float]] = {}  # route -> [requests, queries, max queries, db seconds]
+
+    def violation(self, queries: RequestQueries) -> Optional[str]:
+        statement, repeats = queries.most_repeated()
+        if queries.count > self.max_per_request:
+            return f"{queries.count} queries (limit {self.max_per_request}); most repeated x{repeats}: {statement}"
+        if repeats > self.max_repeats:
+            return f"same statement x{repeats} (limit {self.max_repeats}): {statement}"
+        return None
+
+    def observe(self, route: str, queries: RequestQueries) -> None:
+        self.requests += 1
+        self.queries += queries.count
+        totals = self._routes.setdefault(route, [0, 0, 0, 0.0])
+        totals[0] += 1
+        totals[1] += queries.count
+        totals[2] = max(totals[2], queries.count)
+        totals[3] += queries.seconds
+
+    def stats(self, top: int = 20) -> dict:
+        routes = sorted(self._routes.items(), key=lambda item: item[1][1] / item[1][0], reverse=True)
+        return {
+            "strict_mode": self.strict_mode,
+            "max_per_request": self.max_per_request,
+            "max_repeats": self.max_repeats,
+            "requests": self.requests,
+            "queries": self.queries,
+            "violations": self.violations,
+            "routes": {
+                route: {
+                    "requests": int(n),
+                    "avg_queries": round(count / n, 2),
+                    "max_queries": int(peak),
+                    "avg_db_ms": round(1000 * seconds / n, 3),
+                }
+                for route, (n, count, peak, seconds) in routes[:top]
+            },
+        }
+
+
+query_accounting = QueryAccounting(
+    strict_mode=settings.QUERY_STRICT_MODE,
+    max_per_request=settings.QUERY_MAX_PER_REQUEST,
+    max_repeats=settings.QUERY_MAX_REPEATS,
+)
+
+
+# ---------------------------
+# Middleware
+# ---------------------------
+class QueryAccountingMiddleware:
+    def __init__(self, app: ASGIApp, skip_prefixes: Sequence[str] = ()):
+        self.app = app
+        self.skip_prefixes = tuple(skip_prefixes)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"].startswith(self.skip_prefixes):
+            await self.app(scope, receive, send)
+            return
+
+        queries = RequestQueries()
+        replaced = False
+
+        async def send_with_timing(message: Message) -> None:
+            nonlocal replaced
+            if message["type"] == "http.response.start":
+                problem = self._account(scope, queries)
+                if problem and query_accounting.strict_mode == "raise":
+                    # the handler has already committed; this only makes the breach loud
+                    replaced = True
+                    response = JSONResponse(status_code=500, content={"detail": f"Query budget exceeded: {problem}"})
+                    response.headers["Server-Timing"] = queries.server_timing()
+                    await response(scope, receive, send)
+                    return
+                MutableHeaders(scope=message).append("Server-Timing", queries.server_timing())
+            elif replaced:
+                return
+            await send(message)
+
+        token = _current.set(queries)
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+
+    @staticmethod
+    def _account(scope: Scope, queries: RequestQueries) -> Optional[str]:
+        """Add the request to the aggregates; returns the strict-mode violation, if any."""
+        route = scope.get("route")
+        query_accounting.observe(f"{scope['method']} {getattr(route, 'path', '(unmatched)')}", queries)
+        problem = query_accounting.violation(queries) if query_accounting.strict_mode != "off" else None
+        if problem:
+            query_accounting.violations += 1
+            logger.warning(
+                "Query budget exceeded on %s %s: %s (slowest %.1f ms: %s)",
+                scope["method"], scope["path"], problem, 1000 * queries.slowest_seconds, queries.slowest,
+            )
+        return problem
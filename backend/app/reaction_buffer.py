@@ -0,0 +1,181 @@
+"""
+Write-coalescing buffer for reactions.
+
+With REACTION_BUFFER_ENABLED, react_shoutout acknowledges a click at once
+and parks it here. Every REACTION_FLUSH_INTERVAL_MS (or as soon as
+REACTION_FLUSH_MAX_EVENTS clicks are waiting) the buffer writes everything
+in one transaction, so a burst on a popular shoutout costs one commit
+instead of one per click.
+
+A click is a toggle, and toggles compose: whatever the stored reaction
+is, after one or more clicks it can only end up in one of two states,
+depending on whether it matched the first clicked emoji. So each (shoutout,
+user) keeps just (first_emoji, if_first, otherwise) and any number of
+clicks collapse into one row write, with the last click deciding the
+outcome.
+
+The app drains the buffer on shutdown.
+"""
+import asyncio
+import logging
+from typing import Dict, Optional, Tuple
+
+from . import counters
+from .broker import broker
+from .config import settings
+from .database import AsyncSessionLocal
+from .feed_cache import feed_cache
+
+logger = logging.getLogger(__name__)
+
+
+# ---------------------------
+# Toggle algebra
+# ---------------------------
+def _click(state: Optional[str], emoji: str) -> Optional[str]:
+    """The reaction after clicking `emoji` on `state` (None = no reaction)."""
+    return None if state == emoji else emoji
+
+
+class PendingToggle:
+    """Any number of clicks by one user on one shoutout, composed."""
+
+    __slots__ = ("first_emoji", "if_first", "otherwise")
+
+    def __init__(self, emoji: str):
+        self.first_emoji = emoji
+        self.if_first: Optional[str] = None
+        self.otherwise: Optional[str] = emoji
+
+    def click(self, emoji: str) -> None:
+        self.if_first = _click(self.if_first, emoji)
+        self.otherwise = _click(self.otherwise, emoji)
+
+    def then(self, later: "PendingToggle") -> None:
+        """Append clicks that came after this batch (used to re-queue a failed flush)."""
+        self.if_first = later.resolve(self.if_first)
+        self.otherwise = later.resolve(self.otherwise)
+
+    def resolve(self, current: Optional[str]) -> Optional[str]:
+        return self.if_first if current == self.first_emoji else self.otherwise
+
+
+# ---------------------------
+# Buffer
+# ---------------------------
+class ReactionBuffer:
+    def __init__(self, interval_ms: int, max_events: int):
+        self.interval = interval_ms / 1000
+        self.max_events = max_events
+        self._pending: Dict[Tuple[int, int], PendingToggle] = {}
+        self._events = 0
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+        self.accepted = 0
+        self.coalesced = 0
+        self.flushes = 0
+        self.flushed = 0
+        self.failures = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def add(self, shoutout_id: int, user_id: int, emoji: str) -> None:
+        key = (shoutout_id, user_id)
+        pending = self._pending.get(key)
+        if pending is None:
+            self._pending[key] = PendingToggle(emoji)
+        else:
+            pending.click(emoji)
+            self.coalesced += 1
+        self.accepted += 1
+        self._events += 1
+        if self._events >= self.max_events:
+            self._wake.set()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the flush loop and drain whatever is still buffered."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Reaction buffer flush failed; will retry")
+
+    async def flush(self) -> int:
+        """Write every buffered toggle in one transaction; returns the toggles applied."""
+        async with self._flush_lock:
+            batch, self._pending, self._events = self._pending, {}, 0
+            if not batch:
+                return 0
+            try:
+                touched = await self._write(batch)
+            except Exception:
+                self.failures += 1
+                self._requeue(batch)
+                raise
+            self.flushes += 1
+            self.flushed += len(batch)
+
+        for row in touched:
+            feed_cache.invalidate(row.department)
+            broker.publish(row.department, {"type": "reactions", "id": row.id, "reactions": row.reactions})
+        return len(batch)
+
+    async def _write(self, batch: Dict[Tuple[int, int], PendingToggle]):
+        toggles = [
+            (shoutout_id, user_id, p.first_emoji, p.if_first, p.otherwise)
+            for (shoutout_id, user_id), p in batch.items()
+        ]
+        async with AsyncSessionLocal() as db:
+            touched = await counters.apply_reaction_toggles(db, toggles)
+            await db.commit()
+        return touched
+
+    def _requeue(self, batch: Dict[Tuple[int, int], PendingToggle]) -> None:
+        """Put a failed batch back in front of the clicks that arrived meanwhile."""
+        for key, earlier in batch.items():
+            later = self._pending.get(key)
+            if later is not None:
+                earlier.then(later)
+            self._pending[key] = earlier
+        self._events = len(self._pending)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.running,
+            "buffered": len(self._pending),
+            "accepted": self.accepted,
+            "coalesced": self.coalesced,
+            "flushes": self.flushes,
+            "flushed": self.flushed,
+            "failures": self.failures,
+            "flush_interval_ms": int(self.interval * 1000),
+            "max_events": self.max_events,
+        }
+
+
+reaction_buffer = ReactionBuffer(
+    interval_ms=settings.REACTION_FLUSH_INTERVAL_MS,
+    max_events=settings.REACTION_FLUSH_MAX_EVENTS,
+)
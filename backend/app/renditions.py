@@ -0,0 +1,239 @@
+"""
+Resized WebP renditions of uploaded images.
+
+create_shoutout hands a new image to the rendition pool after it commits
+and returns at once. The pool renders on a small process pool (Pillow work
+is CPU-bound and would hold the GIL), then stores the URLs in
+shoutouts.image_renditions and records a change, so feed caches and
+delta-sync clients pick them up. Until then, and for animated images, the
+shoutout only has its original image_url.
+
+Sources are read from, and renditions written to, the configured storage
+(storage.py), so this works the same on a local directory or a bucket.
+
+Renditions belong to the stored file, so they are also kept on its
+upload_blobs row; a shoutout re-posting an image that was already
+rendered copies them from there instead of rendering again, and shoutouts
+posting the same file while it is being rendered wait for that render.
+
+image_renditions is NULL for images that were never processed. Backfill
+them (e.g. uploads from before renditions existed) with:
+
+    python -m app.renditions
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Optional, Set
+
+from sqlalchemy import select, update
+from starlette.concurrency import run_in_threadpool
+
+from . import changes
+from .broker import broker
+from .config import settings
+from .database import AsyncSessionLocal, engine
+from .feed_cache import feed_cache
+from .imaging import render_renditions
+from .models import ShoutOut, UploadBlob
+from .storage import UPLOAD_DIR, storage
+from .uploads import UPLOAD_URL_PREFIX, digest_for_url, key_for_url
+
+logger = logging.getLogger(__name__)
+
+RENDITION_KEY_PREFIX = "renditions/"
+RENDITION_URL_PREFIX = f"{UPLOAD_URL_PREFIX}/renditions"
+
+
+class RenditionPool:
+    """
+    Renders in at most `workers` processes; when `max_queue` more images
+    are already waiting, new ones are skipped (left NULL for the backfill)
+    rather than letting the backlog grow without bound.
+    """
+
+    def __init__(self, workers: int, max_queue: int, quality: int):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.quality = quality
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._tasks: Set[asyncio.Task] = set()
+        # file (digest, or URL for pre-hashing uploads) -> its renditions being looked up or rendered
+        self._rendering: Dict[str, asyncio.Task] = {}
+        self.rendered = 0
+        self.reused = 0
+        self.skipped = 0
+        self.failed = 0
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: don't fork a process that is running an event loop and threads
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._executor
+
+    def submit(self, shoutout_id: int, image_url: str) -> None:
+        """Render a committed shoutout's image in the background."""
+        if len(self._tasks) >= self.workers + self.max_queue:
+            self.skipped += 1
+            return
+        task = asyncio.create_task(self.render(shoutout_id, image_url))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def render(self, shoutout_id: int, image_url: str) -> None:
+        file = digest_for_url(image_url) or image_url
+        rendering = self._rendering.get(file)
+        if rendering is None:
+            rendering = asyncio.create_task(self._renditions_for(image_url))
+            self._rendering[file] = rendering
+            rendering.add_done_callback(lambda _: self._rendering.pop(file, None))
+        else:
+            self.reused += 1
+        # shielded: one shoutout's task being cancelled mustn't cancel the others' render
+        urls = await asyncio.shield(rendering)
+        if urls is not None:
+            await self._store(shoutout_id, image_url, urls)
+
+    async def _renditions_for(self, image_url: str) -> Optional[Dict[str, str]]:
+        """
+        {name: url} for an image, from its upload_blobs row when it was
+        rendered before, else rendered now and recorded there. None when a
+        worker died, leaving the image for the backfill.
+        """
+        digest = digest_for_url(image_url)
+        if digest is not None:
+            async with AsyncSessionLocal() as db:
+                shared = await db.scalar(select(UploadBlob.renditions).where(UploadBlob.digest == digest))
+            if shared is not None:
+                self.reused += 1
+                return shared
+
+        key = key_for_url(image_url)
+        try:
+            if key is None:
+                raise ValueError(f"{image_url} is not an upload")
+            filenames = await self._render_stored(key)
+        except asyncio.CancelledError:
+            raise
+        except BrokenProcessPool:
+            # a worker died (killed, out of memory): not the image's fault, so
+            # leave it NULL for the backfill and start a fresh pool next time
+            self.failed += 1
+            self._executor = None
+            logger.exception("Rendition worker died rendering %s", image_url)
+            return None
+        except Exception:
+            # an unreadable image stays as it is; {} keeps the backfill from retrying it
+            self.failed += 1
+            logger.exception("Could not render %s", image_url)
+            filenames = {}
+        else:
+            self.rendered += 1
+        urls = {name: f"{RENDITION_URL_PREFIX}/{filename}" for name, filename in filenames.items()}
+        if digest is not None:
+            # committed before this render leaves _rendering, so later posts find it
+            async with AsyncSessionLocal() as db:
+                await db.execute(update(UploadBlob).where(UploadBlob.digest == digest).values(renditions=urls))
+                await db.commit()
+        return urls
+
+    async def _render_stored(self, key: str) -> Dict[str, str]:
+        """Render a stored file and store its renditions; returns {name: filename}."""
+        # next to UPLOAD_DIR's files, so saving to local storage is a rename
+        scratch = await run_in_threadpool(tempfile.mkdtemp, None, ".render-", UPLOAD_DIR)
+        try:
+            source = storage.local_path(key)
+            if source is None:
+                source = os.path.join(scratch, "source")
+                await run_in_threadpool(storage.fetch, key, source)
+            stem = os.path.splitext(os.path.basename(key))[0]
+            filenames = await asyncio.get_running_loop().run_in_executor(
+                self._pool(), render_renditions, source, scratch, stem, self.quality
+            )
+            for filename in set(filenames.values()):
+                await run_in_threadpool(
+                    storage.save, f"{RENDITION_KEY_PREFIX}{filename}", os.path.join(scratch, filename), "image/webp"
+                )
+            return filenames
+        finally:
+            await run_in_threadpool(shutil.rmtree, scratch, True)
+
+    async def _store(self, shoutout_id: int, image_url: str, urls: Dict[str, str]) -> None:
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                update(ShoutOut)
+                .where(ShoutOut.id == shoutout_id, ShoutOut.image_url == image_url)
+                .values(image_renditions=urls)
+                .returning(ShoutOut.department)
+            )
+            department = result.scalar()
+            if department is None:
+                return  # deleted, or its image was replaced meanwhile
+            changes.record_change(db, department, shoutout_id, changes.RENDITIONS)
+            await db.commit()
+        feed_cache.invalidate(department)
+        broker.publish(department, {"type": "renditions", "id": shoutout_id, "image_renditions": urls})
+
+    def shutdown(self) -> None:
+        for task in [*self._tasks, *self._rendering.values()]:
+            task.cancel()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "in_flight": len(self._tasks),
+            "rendered": self.rendered,
+            "reused": self.reused,
+            "skipped": self.skipped,
+            "failed": self.failed,
+        }
+
+
+rendition_pool = RenditionPool(
+    workers=settings.RENDITION_WORKERS,
+    max_queue=settings.RENDITION_MAX_QUEUE,
+    quality=settings.RENDITION_WEBP_QUALITY,
+)
+
+
+async def backfill(batch_size: int = 100) -> int:
+    """Render every shoutout image that has no renditions yet; returns how many."""
+    done = 0
+    last_id = 0
+    while True:
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(ShoutOut.id, ShoutOut.image_url)
+                .where(ShoutOut.id > last_id, ShoutOut.image_url.is_not(None), ShoutOut.image_renditions.is_(None))
+                .order_by(ShoutOut.id)
+                .limit(batch_size)
+            )
+            rows = result.all()
+        if not rows:
+            return done
+        await asyncio.gather(*(rendition_pool.render(row.id, row.image_url) for row in rows))
+        done += len(rows)
+        last_id = rows[-1].id
+        print(f"Rendered {done} images")
+
+
+async def main():
+    try:
+        count = await backfill()
+    finally:
+        rendition_pool.shutdown()
+        await engine.dispose()
+    print(f"Backfilled renditions for {count} shoutouts")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
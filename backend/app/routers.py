@@ -1,22 +1,36 @@
+import asyncio
 import os
-from uuid import uuid4
 from fastapi import APIRouter, Depends, HTTPException, Query, status, Response, Request
-from fastapi import UploadFile, File, Form
+from fastapi import UploadFile, File, Form, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
 from fastapi.security import OAuth2PasswordBearer
+from fastapi.security.utils import get_authorization_scheme_param
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import Date, cast, select, update
+from sqlalchemy import select, update
 from datetime import datetime, timedelta
 from jose import jwt, JWTError
 from .models import Notification, ShoutOut, ShoutOutTag, User, SecurityKey
 from passlib.context import CryptContext
 import secrets
-from typing import Optional, List
+from typing import Dict, Optional, List
 from . import models, schemas
-from .auth import get_current_admin_user, get_current_user, get_password_hash
+from .auth import Principal, get_current_admin_user, get_current_user, hash_password
 from . import auth, crud, schemas
-from .database import get_db
+from .database import get_db, get_read_db
+from .config import settings
+from .pagination import decode_cursor, decode_sync_token
+from . import changes, comments, counters, feed, queries, uploads, versions
+from .feed_cache import feed_cache
+from .broker import broker
+from .reaction_buffer import reaction_buffer
+from .hashing import hashing_pool
+from .login_limiter import login_limiter, retry_after_header
+from .pool import pool_telemetry
+from .portable import calendar_date
+from .query_accounting import query_accounting
+from .renditions import rendition_pool
 from .models import User, SecurityKey
 from .models import User, ShoutOut, ShoutOutTag, ShoutOutReaction, ShoutOutComment, SecurityKey
 from sqlalchemy import func
@@ -39,8 +53,8 @@ shoutouts_router = APIRouter(prefix="/shoutouts", tags=["Shoutouts"])
 # ---------------- GET ALL EMPLOYEES ----------------
 @admin_router.get("/employees", response_model=List[schemas.UserOut])
 async def list_employees(
-    current_admin: User = Depends(get_current_admin_user),
-    db: AsyncSession = Depends(get_db)
+    current_admin: Principal = Depends(get_current_admin_user),
+    db: AsyncSession = Depends(get_read_db)
 ):
     """
     Fetch employees based on admin's department.
@@ -64,8 +78,8 @@ async def list_employees(
 # ---------------- GET ALL ADMINS ----------------
 @admin_router.get("/admins", response_model=List[schemas.UserOut])
 async def list_admins(
-    current_admin: User = Depends(get_current_admin_user),
-    db: AsyncSession = Depends(get_db)
+    current_admin: Principal = Depends(get_current_admin_user),
+    db: AsyncSession = Depends(get_read_db)
 ):
     """Superadmin can view all admins"""
     if current_admin.role != "superadmin":
@@ -75,11 +89,22 @@ async def list_admins(
     admins = result.scalars().all()
     return admins
 
+async def _release_user(db: AsyncSession, user: User):
+    """Unwind a user's footprint on feeds before the row (and its shoutouts) is deleted."""
+    await counters.release_user_engagement(db, user.id)
+    owned = (
+        await db.execute(select(ShoutOut.id, ShoutOut.department, ShoutOut.image_url).where(ShoutOut.author_id == user.id))
+    ).all()
+    for shoutout_id, department, _ in owned:
+        changes.record_change(db, department, shoutout_id, changes.DELETED)
+    await uploads.release_images(db, [image_url for _, _, image_url in owned])
+
+
 # ---------------- DELETE ADMIN ----------------
 @admin_router.delete("/admins/{admin_id}")
 async def delete_admin(
     admin_id: int,
-    current_admin: User = Depends(get_current_admin_user),
+    current_admin: Principal = Depends(get_current_admin_user),
     db: AsyncSession = Depends(get_db)
 ):
     if current_admin.role != "superadmin":
@@ -90,8 +115,11 @@ async def delete_admin(
     if not admin:
         raise HTTPException(status_code=404, detail="Admin not found")
     
+    await _release_user(db, admin)
     await db.delete(admin)
     await db.commit()
+    auth.invalidate_principal(admin_id)
+    _after_feed_write(None)
     return {"msg": "Admin deleted successfully"}
 
 
@@ -101,7 +129,7 @@ async def delete_admin(
 @admin_router.delete("/employees/{emp_id}")
 async def delete_employee(
     emp_id: int,
-    current_admin: User = Depends(get_current_admin_user),
+    current_admin: Principal = Depends(get_current_admin_user),
     db: AsyncSession = Depends(get_db)
 ):
     result = await db.execute(select(User).where(User.id == emp_id, User.role == "employee"))
@@ -109,8 +137,11 @@ async def delete_employee(
     if not employee:
         raise HTTPException(status_code=404, detail="Employee not found")
     
+    await _release_user(db, employee)
     await db.delete(employee)
     await db.commit()
+    auth.invalidate_principal(emp_id)
+    _after_feed_write(None)
     return {"msg": "Employee deleted successfully"}
 
 # ---------------- SUSPEND / UNSUSPEND EMPLOYEE ----------------
@@ -118,7 +149,7 @@ async def delete_employee(
 async def suspend_employee(
     emp_id: int,
     suspend: bool,
-    current_admin: User = Depends(get_current_admin_user),
+    current_admin: Principal = Depends(get_current_admin_user),
     db: AsyncSession = Depends(get_db)
 ):
     """Suspend or unsuspend employee"""
@@ -127,17 +158,17 @@ async def suspend_employee(
     if not employee:
         raise HTTPException(status_code=404, detail="Employee not found")
     
-    # Add a new column to User model called 'is_active' (Boolean, default=True)
     employee.is_active = not suspend
     db.add(employee)
     await db.commit()
+    auth.invalidate_principal(emp_id)
     await db.refresh(employee)
     return {"msg": f"Employee {'suspended' if suspend else 'activated'} successfully"}
 
 # ---------------- ADMIN-ONLY ROUTE ----------------
 @router.post("/admin-only-route")
 async def admin_action(
-    current_admin: User = Depends(get_current_admin_user),
+    current_admin: Principal = Depends(get_current_admin_user),
     db: AsyncSession = Depends(get_db)
 ):
     return {"msg": f"Hello, admin {current_admin.username}"}
@@ -165,7 +196,7 @@ async def register_user(user: schemas.UserCreate, db: AsyncSession = Depends(get
         await db.commit()
 
     # Create new user
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await hash_password(user.password)
     new_user = await crud.create_user(
         db,
         username=user.username,
@@ -180,10 +211,21 @@ async def register_user(user: schemas.UserCreate, db: AsyncSession = Depends(get
 # ---------------- LOGIN ----------------
 @router.post("/login", response_model=schemas.Token)
 async def login_user(
+    request: Request,
     response: Response,
     user_credentials: schemas.UserLogin,
     db: AsyncSession = Depends(get_db),
 ):
+    # ✅ Step 0: Admission control, decided in memory before any DB or bcrypt work
+    client_ip = request.client.host if request.client else "unknown"
+    retry_after = login_limiter.admit(user_credentials.email, client_ip)
+    if retry_after:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many login attempts, please try again later",
+            headers={"Retry-After": retry_after_header(retry_after)},
+        )
+
     # ✅ Step 1: Authenticate user credentials
     user = await auth.authenticate_user(db, user_credentials.email, user_credentials.password)
     if not user:
@@ -191,6 +233,8 @@ async def login_user(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid credentials"
         )
+    if not user.is_active:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Account suspended")
 
     # ✅ Step 2: Role verification (critical security)
     if user_credentials.role != user.role:
@@ -243,7 +287,7 @@ async def refresh_token(request: Request, db: AsyncSession = Depends(get_db)):
     if not refresh_token:
         raise HTTPException(status_code=401, detail="Missing refresh token")
     try:
-        payload = jwt.decode(refresh_token, auth.settings.SECRET_KEY, algorithms=[auth.settings.ALGORITHM])
+        payload = auth.decode_token(refresh_token)
         user_id = int(payload.get("sub"))
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid refresh token")
@@ -253,6 +297,8 @@ async def refresh_token(request: Request, db: AsyncSession = Depends(get_db)):
     user = res.scalars().first()
     if not user:
         raise HTTPException(status_code=401, detail="User not found")
+    if not user.is_active:
+        raise HTTPException(status_code=403, detail="Account suspended")
 
     access_token_expires = timedelta(minutes=auth.settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = auth.create_access_token(data={"sub": str(user.id)}, expires_delta=access_token_expires)
@@ -267,9 +313,9 @@ async def logout(response: Response):
 
 # ---------------- CURRENT USER ----------------
 @router.get("/me", response_model=schemas.UserOut)
-async def me(token: str = Depends(auth.oauth2_scheme), db: AsyncSession = Depends(get_db)):
+async def me(token: str = Depends(auth.oauth2_scheme), db: AsyncSession = Depends(get_read_db)):
     try:
-        payload = jwt.decode(token, auth.settings.SECRET_KEY, algorithms=[auth.settings.ALGORITHM])
+        payload = auth.decode_token(token)
         user_id = int(payload.get("sub"))
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
@@ -279,6 +325,8 @@ async def me(token: str = Depends(auth.oauth2_scheme), db: AsyncSession = Depend
     user = res.scalars().first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
+    if not user.is_active:
+        raise HTTPException(status_code=403, detail="Account suspended")
 
     return user
 
@@ -299,7 +347,7 @@ async def create_security_key(db: AsyncSession = Depends(get_db)):
 
 # List all security keys (admin-only)
 @router.get("/security-keys", dependencies=[Depends(get_current_admin_user)])
-async def list_security_keys(db: AsyncSession = Depends(get_db)):
+async def list_security_keys(db: AsyncSession = Depends(get_read_db)):
     result = await db.execute(select(SecurityKey))
     keys = result.scalars().all()
     return [{"id": k.id, "key": k.key, "is_used": k.is_used} for k in keys]
@@ -319,8 +367,8 @@ async def delete_security_key(key_id: int, db: AsyncSession = Depends(get_db)):
 # ✅ Fetch department-wise employees (used for dropdown)
 @router.get("/department-employees")
 async def get_department_employees(
-    current_user: User = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db)
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_read_db)
 ):
     query = await db.execute(select(User).where(User.department == current_user.department))
     employees = query.scalars().all()
@@ -332,7 +380,7 @@ async def get_department_employees(
 async def update_profile(
     user_update: schemas.UpdateProfile,
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     query = await db.execute(select(User).where(User.id == current_user.id))
     user = query.scalar_one_or_none()
@@ -346,14 +394,32 @@ async def update_profile(
 
     db.add(user)
     await db.commit()
+    auth.invalidate_principal(user.id)
     await db.refresh(user)
 
     return user
 
 
     # ---------------- SHOUT-OUTS ----------------
-uploads_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "uploads"))
-os.makedirs(uploads_dir, exist_ok=True)
+def _not_modified(tag: str) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": tag, "Cache-Control": versions.CACHE_CONTROL})
+
+
+def _after_feed_write(department: Optional[str], event: Optional[dict] = None):
+    """Call after committing a write that changes a department's feed (None = all)."""
+    feed_cache.invalidate(department)
+    broker.publish(department, event or {"type": "resync"})
+
+
+# ✅ Direct-to-storage uploads: get a ticket, PUT the file to it, then post the
+# shoutout with its image_key (no upload needed when the ticket has none)
+@router.post("/uploads", response_model=schemas.UploadTicket)
+async def create_upload_ticket(
+    body: schemas.UploadIn,
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
+):
+    return await uploads.upload_ticket(db, body.content_type, body.size, body.sha256)
 
 
 @router.post("/shoutouts", response_model=schemas.ShoutOutOut)
@@ -361,18 +427,18 @@ async def create_shoutout(
     message: str = Form(...),
     tagged_user_ids: Optional[str] = Form(None),  # comma-separated ids
     image: Optional[UploadFile] = File(None),
+    image_key: Optional[str] = Form(None),  # from POST /uploads, instead of `image`
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
 ):
-    image_url = None
+    # ✅ Streamed to disk in chunks; rejected early on type, magic bytes or size.
+    # Stored under its content hash: re-posting an image reuses the stored file.
     if image is not None:
-        ext = os.path.splitext(image.filename)[1]
-        filename = f"{uuid4().hex}{ext}"
-        filepath = os.path.join(uploads_dir, filename)
-        content = await image.read()
-        with open(filepath, "wb") as f:
-            f.write(content)
-        image_url = f"/uploads/{filename}"
+        image_url = await uploads.save_image(db, image)
+    elif image_key:
+        image_url = await uploads.claim_upload(db, image_key)  # ✅ already PUT straight to storage
+    else:
+        image_url = None
 
     # ✅ FIX: include department when creating shoutout
     new_shout = ShoutOut(
@@ -395,10 +461,11 @@ async def create_shoutout(
     for uid in user_ids:
         db.add(ShoutOutTag(shoutout_id=new_shout.id, user_id=uid))
 
+    changes.record_change(db, new_shout.department, new_shout.id, changes.CREATED)
     await db.commit()
     await db.refresh(new_shout)
 
-    return schemas.ShoutOutOut(
+    out = schemas.ShoutOutOut(
         id=new_shout.id,
         author_id=new_shout.author_id,
         author_name=current_user.name,
@@ -409,161 +476,201 @@ async def create_shoutout(
         tagged_users=user_ids,
         reactions={},
     )
+    _after_feed_write(new_shout.department, {"type": "created", "shoutout": out.model_dump()})
+    # ✅ Thumbnails / WebP copies are rendered off the request path
+    if image_url:
+        rendition_pool.submit(new_shout.id, image_url)
+    return out
 
 
 
-@router.get("/shoutouts/feed", response_model=List[schemas.ShoutOutOut])
+@router.get("/shoutouts/feed", response_model=schemas.FeedPage)
 async def get_feed(
-    db: AsyncSession = Depends(get_db),
-    
-    current_user: User = Depends(get_current_user),
+    request: Request,
+    response: Response,
+    cursor: Optional[str] = Query(None),
+    limit: Optional[int] = Query(None, ge=1),
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Principal = Depends(get_current_user),
+):
+    page_size = min(limit or settings.FEED_PAGE_SIZE, settings.FEED_MAX_PAGE_SIZE)
+    after = decode_cursor(cursor) if cursor else None
+    department = current_user.department
+
+    # ✅ Conditional GET: answer 304 from the version alone (itself briefly cached)
+    version = feed_cache.version(department)
+    if version is None:
+        version = await versions.feed_version(db, department)
+        feed_cache.remember_version(department, version)
+    tag = versions.etag("feed", version, department, cursor, page_size)
+    if versions.is_fresh(request, tag):
+        return _not_modified(tag)
+
+    # ✅ First pages are shared by the whole department, so serve them from cache
+    page = feed_cache.get(department, page_size, version) if after is None else None
+    if page is None:
+        # ✅ Only shoutouts from the same department, newest first.
+        # Keyset on (created_at, id) so deep pages cost the same as the first one,
+        # and the whole page is assembled in a single statement.
+        page = await feed.load_feed_page(db, department, page_size, after)
+        if after is None:
+            feed_cache.put(department, page_size, version, page)
+
+    response.headers["ETag"] = tag
+    response.headers["Cache-Control"] = versions.CACHE_CONTROL
+    return page
+
+
+@router.get("/shoutouts/feed/changes", response_model=schemas.FeedChanges)
+async def get_feed_changes(
+    since: str = Query(..., description="sync_token from a feed page or a previous delta"),
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Principal = Depends(get_current_user),
 ):
-    # ✅ Only fetch shoutouts from the same department
-    res = await db.execute(
-        select(ShoutOut)
-        .where(ShoutOut.department == current_user.department)
-        .order_by(ShoutOut.created_at.desc())
-        .limit(100)
+    """
+    What changed in the department's feed since `since`: new and edited shoutouts,
+    reaction/comment count changes, reports and deletions, plus a new token.
+    `reset: true` means the client should refetch the first page instead.
+    """
+    return await feed.load_feed_changes(db, current_user.department, decode_sync_token(since))
+
+
+# ---------------- LIVE FEED STREAM ----------------
+async def _stream_user(token: Optional[str], authorization: Optional[str]) -> Principal:
+    """
+    Resolve the streaming client. Browsers can't set headers on WebSocket or
+    EventSource connections, so the token may also arrive as ?token=. A
+    short-lived session is used so an idle stream never pins a DB connection.
+    """
+    if not token and authorization:
+        scheme, param = get_authorization_scheme_param(authorization)
+        if scheme.lower() == "bearer":
+            token = param
+    if not token:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    async with database.AsyncSessionLocal() as db:
+        return await get_current_user(token, db)
+
+
+@router.websocket("/shoutouts/stream")
+async def stream_feed_ws(websocket: WebSocket, token: Optional[str] = Query(None)):
+    try:
+        user = await _stream_user(token, websocket.headers.get("authorization"))
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    await websocket.accept()
+    subscription = broker.subscribe(user.department)
+
+    async def send_events():
+        while True:
+            payload = await subscription.next(settings.STREAM_HEARTBEAT_SECONDS)
+            await websocket.send_text(payload if payload is not None else '{"type": "ping"}')
+
+    async def wait_for_close():
+        # clients never send anything; receiving is only how a close is seen
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+
+    # ✅ Whichever ends first ends the stream, so a closed socket unsubscribes
+    # at once instead of on the next event or heartbeat
+    sending = asyncio.create_task(send_events())
+    receiving = asyncio.create_task(wait_for_close())
+    try:
+        done, _ = await asyncio.wait({sending, receiving}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        sending.cancel()
+        receiving.cancel()
+        broker.unsubscribe(subscription)
+    for task in done:
+        error = task.exception()
+        if error is not None and not isinstance(error, WebSocketDisconnect):
+            raise error
+
+
+@router.get("/shoutouts/stream")
+async def stream_feed_sse(request: Request, token: Optional[str] = Query(None)):
+    """Server-Sent Events fallback for clients that can't use the WebSocket."""
+    user = await _stream_user(token, request.headers.get("authorization"))
+
+    async def events():
+        subscription = broker.subscribe(user.department)
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                payload = await subscription.next(settings.STREAM_HEARTBEAT_SECONDS)
+                yield f"data: {payload}\n\n" if payload is not None else ": ping\n\n"
+        finally:
+            broker.unsubscribe(subscription)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
-    shoutouts = res.scalars().all()
-
-    # 2 Add this here: fetch author names
-    author_ids = list({s.author_id for s in shoutouts})
-    authors: dict[int, str] = {}
-    if author_ids:
-        res_authors = await db.execute(select(User).where(User.id.in_(author_ids)))
-        users = res_authors.scalars().all()
-        authors = {u.id: u.name for u in users}
-
-    # gather tags
-    shoutout_ids = [s.id for s in shoutouts]
-    tags_map = {sid: [] for sid in shoutout_ids}
-    tag_names_map = {sid: [] for sid in shoutout_ids}
-    if shoutout_ids:
-        res_tags = await db.execute(select(ShoutOutTag, User.name).join(User, User.id == ShoutOutTag.user_id).where(ShoutOutTag.shoutout_id.in_(shoutout_ids)))
-        for t, name in res_tags.all():
-            tags_map[t.shoutout_id].append(t.user_id)
-            tag_names_map[t.shoutout_id].append(name or str(t.user_id))
-
-    # gather reactions counts as {emoji: count}
-    reactions_map = {sid: {} for sid in shoutout_ids}
-    if shoutout_ids:
-        res_rx = await db.execute(
-            select(ShoutOutReaction.shoutout_id, ShoutOutReaction.emoji, func.count(ShoutOutReaction.id))
-            .where(ShoutOutReaction.shoutout_id.in_(shoutout_ids))
-            .group_by(ShoutOutReaction.shoutout_id, ShoutOutReaction.emoji)
-        )
-        for sid, emoji, cnt in res_rx.all():
-            reactions_map[sid][emoji] = int(cnt)
-
-    # comments count per shoutout
-    comments_count = {sid: 0 for sid in shoutout_ids}
-    if shoutout_ids:
-        res_cc = await db.execute(
-            select(ShoutOutComment.shoutout_id, func.count(ShoutOutComment.id))
-            .where(ShoutOutComment.shoutout_id.in_(shoutout_ids))
-            .group_by(ShoutOutComment.shoutout_id)
-        )
-        for sid, cnt in res_cc.all():
-            comments_count[sid] = int(cnt)
-
-    out: List[schemas.ShoutOutOut] = []
-    for s in shoutouts:
-        out.append(
-            schemas.ShoutOutOut(
-                id=s.id,
-                author_id=s.author_id,
-                author_name=authors.get(s.author_id, "Anonymous"),  # <- fetch actual author
-                message=s.message,
-                image_url=s.image_url,
-                created_at=s.created_at.isoformat() if s.created_at else None,
-                tagged_users=tags_map.get(s.id, []),
-                tagged_user_names=tag_names_map.get(s.id, []),
-                reactions=reactions_map.get(s.id, {}),
-                comments_count=comments_count.get(s.id, 0),
-            )
-        )
-    return out
 
 
 @router.post("/shoutouts/{shoutout_id}/react")
 async def react_shoutout(
     shoutout_id: int,
     body: schemas.ReactionIn,
+    response: Response,
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
 ):
-    # Check if the user has reacted before
-    res = await db.execute(
-        select(ShoutOutReaction).where(
-            ShoutOutReaction.shoutout_id == shoutout_id,
-            ShoutOutReaction.user_id == current_user.id
-        )
-    )
-    existing = res.scalars().first()
-
-    if existing:
-        if existing.emoji == body.emoji:
-            # User clicked the same reaction → remove it
-            await db.delete(existing)
-            await db.commit()
-            return {"msg": "reaction removed"}
-        else:
-            # User clicked a different reaction → update it
-            existing.emoji = body.emoji
-            db.add(existing)
-            await db.commit()
-            return {"msg": "reaction updated"}
-    else:
-        # User never reacted → add new reaction
-        reaction = ShoutOutReaction(
-            shoutout_id=shoutout_id,
-            user_id=current_user.id,
-            emoji=body.emoji
-        )
-        db.add(reaction)
-        await db.commit()
-        return {"msg": "reaction added"}
+    # Buffered mode: acknowledge now, the buffer writes the burst in one batch
+    if reaction_buffer.running:
+        reaction_buffer.add(shoutout_id, current_user.id, body.emoji)
+        response.status_code = status.HTTP_202_ACCEPTED
+        return {"msg": "reaction queued"}
+
+    # One statement toggles the reaction, moves the counters and logs the change
+    action, department, counts = await counters.toggle_reaction(db, shoutout_id, current_user.id, body.emoji)
+    await db.commit()
+    if action != "unchanged":
+        _after_feed_write(department, {"type": "reactions", "id": shoutout_id, "reactions": counts})
+    return {"msg": f"reaction {action}", "reactions": counts}
 
 @router.post("/shoutouts/{shoutout_id}/comments", response_model=schemas.CommentOut)
 async def add_comment(
     shoutout_id: int,
     body: schemas.CommentCreate,
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
 ):
+    department, comments_count = await counters.bump_comments_count(db, shoutout_id)
+    changes.record_change(db, department, shoutout_id, changes.COMMENTS)
     c = ShoutOutComment(shoutout_id=shoutout_id, user_id=current_user.id, content=body.content)
     db.add(c)
     await db.commit()
+    _after_feed_write(department, {"type": "comments", "id": shoutout_id, "comments_count": comments_count})
     await db.refresh(c)
     return schemas.CommentOut(
         id=c.id,
         shoutout_id=c.shoutout_id,
         user_id=c.user_id,
+        author_name=current_user.name,
         content=c.content,
         created_at=c.created_at.isoformat() if c.created_at else None,
     )
 
 @router.get("/my-posts")
-def get_my_posts(current_user=Depends(get_current_user), db=Depends(get_db)):
-    posts = (
-        db.query(ShoutOut)
-        .filter(ShoutOut.author_id == current_user.id)
-        .order_by(ShoutOut.created_at.desc())
-        .all()
-    )
-    return posts
+async def get_my_posts(current_user: Principal = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    result = await db.execute(queries.build_my_posts_statement(current_user.id))
+    return result.scalars().all()
 
 # ---------------- UPDATE a Shoutout ----------------
 @router.put("/{shoutout_id}")
-def update_shoutout(
+async def update_shoutout(
     shoutout_id: int,
     payload: dict,
-    db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
 ):
     """Edit a shoutout (only by the owner)."""
-    shoutout = db.query(models.ShoutOut).filter(models.ShoutOut.id == shoutout_id).first()
+    result = await db.execute(select(ShoutOut).where(ShoutOut.id == shoutout_id))
+    shoutout = result.scalars().first()
 
     if not shoutout:
         raise HTTPException(status_code=404, detail="Shoutout not found")
@@ -576,20 +683,23 @@ def update_shoutout(
         raise HTTPException(status_code=400, detail="Message cannot be empty")
 
     shoutout.message = new_message
-    db.commit()
-    db.refresh(shoutout)
+    changes.record_change(db, shoutout.department, shoutout.id, changes.EDITED)
+    await db.commit()
+    await db.refresh(shoutout)
+    _after_feed_write(shoutout.department, {"type": "edited", "id": shoutout.id, "message": shoutout.message})
     return {"message": "Shoutout updated successfully", "data": shoutout}
 
 
 # ---------------- DELETE a Shoutout ----------------
 @router.delete("/{shoutout_id}")
-def delete_shoutout(
+async def delete_own_shoutout(
     shoutout_id: int,
-    db: Session = Depends(database.get_db),
-    current_user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user),
 ):
     """Delete a shoutout (only by the owner)."""
-    shoutout = db.query(models.ShoutOut).filter(models.ShoutOut.id == shoutout_id).first()
+    result = await db.execute(select(ShoutOut).where(ShoutOut.id == shoutout_id))
+    shoutout = result.scalars().first()
 
     if not shoutout:
         raise HTTPException(status_code=404, detail="Shoutout not found")
@@ -597,51 +707,104 @@ def delete_shoutout(
     if shoutout.author_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized to delete this shoutout")
 
-    db.delete(shoutout)
-    db.commit()
+    await _delete_shoutout(db, shoutout)
+    await db.commit()
+    _after_feed_write(shoutout.department, {"type": "deleted", "id": shoutout_id})
     return {"message": "Shoutout deleted successfully"}
 
 
-@router.get("/shoutouts/{shoutout_id}/comments", response_model=List[schemas.CommentOut])
+async def _delete_shoutout(db: AsyncSession, shoutout: ShoutOut):
+    """Delete a shoutout in the caller's transaction: log it for delta sync and drop its image reference."""
+    changes.record_change(db, shoutout.department, shoutout.id, changes.DELETED)
+    await uploads.release_images(db, [shoutout.image_url])
+    await db.delete(shoutout)
+
+
+@router.get("/shoutouts/comments", response_model=Dict[int, schemas.CommentPage])
+async def preview_comments(
+    ids: List[int] = Query(...),
+    limit: Optional[int] = Query(None, ge=1),
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Principal = Depends(get_current_user),
+):
+    """
+    ✅ First comments of many shoutouts at once (?ids=1&ids=2...), so a feed
+    page can expand its comments without one request per shoutout.
+    Continue any of them with /shoutouts/{id}/comments?cursor=...
+    """
+    if len(ids) > settings.FEED_MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"At most {settings.FEED_MAX_PAGE_SIZE} shoutout ids per request")
+    per_shoutout = min(limit or settings.COMMENTS_PREVIEW_SIZE, settings.COMMENTS_MAX_PAGE_SIZE)
+    return await comments.load_comment_previews(db, list(dict.fromkeys(ids)), per_shoutout)
+
+
+@router.get("/shoutouts/{shoutout_id}/comments", response_model=schemas.CommentPage)
 async def list_comments(
     shoutout_id: int,
-    db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    cursor: Optional[str] = Query(None),
+    limit: Optional[int] = Query(None, ge=1),
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Principal = Depends(get_current_user),
 ):
-    res = await db.execute(
-        select(ShoutOutComment)
-        .where(ShoutOutComment.shoutout_id == shoutout_id)
-        .order_by(ShoutOutComment.created_at.asc())
-    )
-    out: List[schemas.CommentOut] = []
-    for c in res.scalars().all():
-        out.append(
-            schemas.CommentOut(
-                id=c.id,
-                shoutout_id=c.shoutout_id,
-                user_id=c.user_id,
-                content=c.content,
-                created_at=c.created_at.isoformat() if c.created_at else None,
-            )
-        )
-    return out
+    # ✅ Oldest first, keyset on (created_at, id), with each commenter's name
+    page_size = min(limit or settings.COMMENTS_PAGE_SIZE, settings.COMMENTS_MAX_PAGE_SIZE)
+    after = decode_cursor(cursor) if cursor else None
+    return await comments.load_comment_page(db, shoutout_id, page_size, after)
 
 #---------------------------------------Metrics---------------------------------------
 
+@metrics_router.get("/feed-cache", dependencies=[Depends(get_current_admin_user)])
+async def feed_cache_metrics():
+    return feed_cache.stats()
+
+
+@metrics_router.get("/stream", dependencies=[Depends(get_current_admin_user)])
+async def stream_metrics():
+    return broker.stats()
+
+
+@metrics_router.get("/reaction-buffer", dependencies=[Depends(get_current_admin_user)])
+async def reaction_buffer_metrics():
+    return reaction_buffer.stats()
+
+
+@metrics_router.get("/hashing", dependencies=[Depends(get_current_admin_user)])
+async def hashing_metrics():
+    return hashing_pool.stats()
+
+
+@metrics_router.get("/login-limiter", dependencies=[Depends(get_current_admin_user)])
+async def login_limiter_metrics():
+    return login_limiter.stats()
+
+
+@metrics_router.get("/db-pool", dependencies=[Depends(get_current_admin_user)])
+async def db_pool_metrics():
+    return {name: telemetry.stats() for name, telemetry in pool_telemetry.items()}
+
+
+@metrics_router.get("/queries", dependencies=[Depends(get_current_admin_user)])
+async def query_metrics():
+    return query_accounting.stats()
+
+
+@metrics_router.get("/renditions", dependencies=[Depends(get_current_admin_user)])
+async def rendition_metrics():
+    return rendition_pool.stats()
+
+
 @metrics_router.get("/me", response_model=schemas.MetricsOut)
 async def my_metrics(
-    db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Principal = Depends(get_current_user),
 ):
-    given = await db.execute(select(func.count(ShoutOut.id)).where(ShoutOut.author_id == current_user.id))
-    received = await db.execute(select(func.count(ShoutOutTag.id)).where(ShoutOutTag.user_id == current_user.id))
-    comments = await db.execute(select(func.count(ShoutOutComment.id)).where(ShoutOutComment.user_id == current_user.id))
+    given = await db.execute(queries.build_given_count_statement(current_user.id))
+    received = await db.execute(queries.build_received_count_statement(current_user.id))
+    comments = await db.execute(queries.build_comments_count_statement(current_user.id))
 
     recent: List[dict] = []
 
-    res_recent_given = await db.execute(
-        select(ShoutOut).where(ShoutOut.author_id == current_user.id).order_by(ShoutOut.created_at.desc()).limit(5)
-    )
+    res_recent_given = await db.execute(queries.build_my_posts_statement(current_user.id, limit=5))
     for s in res_recent_given.scalars().all():
         recent.append({
             "type": "given",
@@ -649,12 +812,7 @@ async def my_metrics(
             "created_at": s.created_at.isoformat() if s.created_at else None,
         })
 
-    res_recent_received = await db.execute(
-        select(ShoutOut, ShoutOutTag)
-        .join(ShoutOutTag, ShoutOutTag.shoutout_id == ShoutOut.id)
-        .where(ShoutOutTag.user_id == current_user.id)
-        .order_by(ShoutOut.created_at.desc()).limit(5)
-    )
+    res_recent_received = await db.execute(queries.build_recent_received_statement(current_user.id, 5))
     for s, _ in res_recent_received.all():
         recent.append({
             "type": "received",
@@ -662,11 +820,7 @@ async def my_metrics(
             "created_at": s.created_at.isoformat() if s.created_at else None,
         })
 
-    res_recent_comments = await db.execute(
-        select(ShoutOutComment)
-        .where(ShoutOutComment.user_id == current_user.id)
-        .order_by(ShoutOutComment.created_at.desc()).limit(5)
-    )
+    res_recent_comments = await db.execute(queries.build_recent_comments_statement(current_user.id, 5))
     for c in res_recent_comments.scalars().all():
         recent.append({
             "type": "comment",
@@ -696,7 +850,7 @@ class NotificationCreate(BaseModel):
 async def create_notification(
     data: schemas.NotificationCreate,
     db: AsyncSession = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),  # ✅ Add this
+    current_user: Principal = Depends(get_current_user),  # ✅ Add this
 ):
     # 🧠 validation
     if not data.message.strip():
@@ -716,9 +870,15 @@ async def create_notification(
 
 # ✅ Fetch all notifications
 @notifications_router.get("/")
-async def get_notifications(db: AsyncSession = Depends(get_db)):
+async def get_notifications(request: Request, response: Response, db: AsyncSession = Depends(get_read_db)):
+    tag = versions.etag("notifications", await versions.notifications_version(db))
+    if versions.is_fresh(request, tag):
+        return _not_modified(tag)
+
     result = await db.execute(select(Notification).order_by(Notification.created_at.desc()))
     notifications = result.scalars().all()
+    response.headers["ETag"] = tag
+    response.headers["Cache-Control"] = versions.CACHE_CONTROL
     return notifications
 
 # ---------------- EMPLOYEE OF THE MONTH ROUTES ----------------
@@ -726,8 +886,8 @@ async def get_notifications(db: AsyncSession = Depends(get_db)):
 # ✅ Get all employees (filtered by admin's department)
 @router.get("/users/", response_model=list[schemas.UserOut])
 async def get_all_users(
-    db: AsyncSession = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Principal = Depends(get_current_user),
 ):
     # ✅ Only allow admin or superadmin to view this route
     if current_user.role not in ["admin", "superadmin"]:
@@ -752,24 +912,26 @@ async def get_all_users(
 # ✅ Get latest Employee of the Month (filtered by department for everyone)
 @router.get("/employee-of-month/", response_model=schemas.EmployeeOfMonthOut)
 async def get_employee_of_month(
-    db: AsyncSession = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Principal = Depends(get_current_user),
 ):
-    query = (
-        select(models.EmployeeOfMonth)
-        .order_by(models.EmployeeOfMonth.created_at.desc())
-    )
+    scope = None if current_user.role == "superadmin" else current_user.department
+    tag = versions.etag("employee-of-month", await versions.employee_of_month_version(db, scope), scope)
+    if versions.is_fresh(request, tag):
+        return _not_modified(tag)
 
     # ✅ Both admins and employees see EOM for their department only
-    if current_user.role != "superadmin":  # everyone except superadmin
-        query = query.where(models.EmployeeOfMonth.department == current_user.department)
-
-    result = await db.execute(query)
+    # (scope is None for superadmin)
+    result = await db.execute(queries.build_employee_of_month_statement(scope))
     record = result.scalars().first()
 
     if not record:
         raise HTTPException(status_code=404, detail="No Employee of the Month found")
 
+    response.headers["ETag"] = tag
+    response.headers["Cache-Control"] = versions.CACHE_CONTROL
     return record
 
 
@@ -778,7 +940,7 @@ async def get_employee_of_month(
 async def announce_employee_of_month(
     payload: schemas.EmployeeOfMonthCreate,
     db: AsyncSession = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
 ):
     # ✅ Verify employee exists
     result = await db.execute(select(models.User).where(models.User.id == payload.employee_id))
@@ -809,8 +971,8 @@ async def announce_employee_of_month(
 #---------------------------------------for super admin EOM-----------------------
 @router.get("/employee-of-month/all", response_model=list[schemas.EmployeeOfMonthOut])
 async def get_all_eoms(
-    db: AsyncSession = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Principal = Depends(get_current_user),
 ):
     if current_user.role != "superadmin":
         raise HTTPException(status_code=403, detail="Access denied")
@@ -826,8 +988,8 @@ async def get_all_eoms(
 @router.get("/shoutouts/department", response_model=List[schemas.ShoutoutResponse])
 async def get_shoutouts_by_department(
     dept: Optional[str] = Query(None),
-    db: AsyncSession = Depends(get_db),
-    current_user: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Principal = Depends(get_current_user),
 ):
     """
     ✅ Admin sees only their own department’s shoutouts (unless super_admin)
@@ -842,30 +1004,17 @@ async def get_shoutouts_by_department(
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    stmt = (
-        select(
-            models.ShoutOut.id,
-            models.ShoutOut.author_id,
-            models.User.name.label("author_name"),
-            models.ShoutOut.message,
-            models.ShoutOut.department,
-            models.ShoutOut.created_at,
-            models.ShoutOut.is_reported,
-        )
-        .join(models.User, models.User.id == models.ShoutOut.author_id)
-        .order_by(models.ShoutOut.created_at.desc())
-    )
-
     # ✅ Restrict data visibility
+    department = None
     if user.role == "admin":
         # Admin can only see their own department’s shoutouts
-        stmt = stmt.filter(models.ShoutOut.department == user.department)
+        department = user.department
 
     # ✅ If a department filter is applied (for employees)
     elif dept and dept != "All":
-        stmt = stmt.filter(models.ShoutOut.department == dept)
+        department = dept
 
-    result = await db.execute(stmt)
+    result = await db.execute(queries.build_moderation_statement(department))
     rows = result.all()
 
     shoutouts = [
@@ -887,8 +1036,8 @@ async def get_shoutouts_by_department(
 # ✅ Fetch Reported Shoutouts (Restricted by Admin’s Department)
 @router.get("/shoutouts/reported", response_model=List[schemas.ShoutoutResponse])
 async def get_reported_shoutouts(
-    db: AsyncSession = Depends(get_db),
-    current_user: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Principal = Depends(get_current_user),
 ):
     """
     ✅ Admin sees only reported shoutouts from their own department.
@@ -901,26 +1050,9 @@ async def get_reported_shoutouts(
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    stmt = (
-        select(
-            models.ShoutOut.id,
-            models.ShoutOut.author_id,
-            models.User.name.label("author_name"),
-            models.ShoutOut.message,
-            models.ShoutOut.department,
-            models.ShoutOut.created_at,
-            models.ShoutOut.is_reported,
-        )
-        .join(models.User, models.User.id == models.ShoutOut.author_id)
-        .filter(models.ShoutOut.is_reported == True)
-        .order_by(models.ShoutOut.created_at.desc())
-    )
-
     # ✅ Restrict reported shoutouts to admin's department
-    if user.role == "admin":
-        stmt = stmt.filter(models.ShoutOut.department == user.department)
-
-    result = await db.execute(stmt)
+    department = user.department if user.role == "admin" else None
+    result = await db.execute(queries.build_moderation_statement(department, reported_only=True))
     rows = result.all()
 
     shoutouts = [
@@ -944,7 +1076,7 @@ async def get_reported_shoutouts(
 async def create_shoutout(
     request: schemas.ShoutoutCreate,
     db: AsyncSession = Depends(get_db),
-    current_user: dict = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
 ):
     new_shoutout = models.ShoutOut(
         author_id=current_user.id,
@@ -963,7 +1095,7 @@ async def create_shoutout(
 async def report_shoutout(
     id: int,
     db: AsyncSession = Depends(get_db),
-    current_user: dict = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
 ):
     result = await db.execute(select(models.ShoutOut).filter(models.ShoutOut.id == id))
     shoutout = result.scalars().first()
@@ -975,8 +1107,10 @@ async def report_shoutout(
         raise HTTPException(status_code=400, detail="You cannot report your own shoutout")
 
     shoutout.is_reported = True
+    changes.record_change(db, shoutout.department, shoutout.id, changes.REPORTED)
     await db.commit()
     await db.refresh(shoutout)
+    _after_feed_write(shoutout.department, {"type": "reported", "id": shoutout.id})
     return shoutout
 
 
@@ -985,7 +1119,7 @@ async def report_shoutout(
 async def delete_shoutout(
     id: int,
     db: AsyncSession = Depends(get_db),
-    current_user: dict = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
 ):
     result = await db.execute(select(models.ShoutOut).filter(models.ShoutOut.id == id))
     shoutout = result.scalars().first()
@@ -993,44 +1127,39 @@ async def delete_shoutout(
     if not shoutout:
         raise HTTPException(status_code=404, detail="Shoutout not found")
 
-    await db.delete(shoutout)
+    await _delete_shoutout(db, shoutout)
     await db.commit()
+    _after_feed_write(shoutout.department, {"type": "deleted", "id": id})
     return {"message": "Shoutout deleted successfully"}
 
 #-------------------------------------top contributers for employee------------------------------------------
 
 @router.get("/leaderboard")
 async def get_top_contributors(
-    db: AsyncSession = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Principal = Depends(get_current_user),
 ):
     """
     Get top contributors (department-wise).
     Superadmins see all departments, admins & employees see only their own department.
     """
+    scope = None if current_user.role == "superadmin" else current_user.department
+    tag = versions.etag("leaderboard", await versions.feed_version(db, scope), scope)
+    if versions.is_fresh(request, tag):
+        return _not_modified(tag)
 
-    # 🧠 Base query
-    query = (
-        select(
-            models.User.name.label("author_name"),
-            models.User.department,
-            func.count(models.ShoutOut.id).label("count"),
-        )
-        .join(models.User, models.User.id == models.ShoutOut.author_id)
-        .group_by(models.User.name, models.User.department)
-        .order_by(func.count(models.ShoutOut.id).desc())
-    )
-
-    # ✅ If user is not a superadmin, filter by their department
-    if current_user.role != "superadmin":
-        query = query.where(models.User.department == current_user.department)
-
-    result = await db.execute(query.limit(5))
+    # ✅ If user is not a superadmin, filter by their department (scope)
+    result = await db.execute(queries.build_leaderboard_statement(scope))
     rows = result.all()
 
     if not rows:
         raise HTTPException(status_code=404, detail="No contributors found for this department")
 
+    response.headers["ETag"] = tag
+    response.headers["Cache-Control"] = versions.CACHE_CONTROL
+
     # ✅ Return formatted JSON
     return [
         {
@@ -1047,8 +1176,8 @@ async def get_top_contributors(
 
 @router.get("/analytics/daily-activity")
 async def get_daily_activity(
-    db: AsyncSession = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Principal = Depends(get_current_user)
 ):
     """
     Returns number of shoutouts created per day (last 7 days),
@@ -1058,11 +1187,11 @@ async def get_daily_activity(
 
     query = (
         select(
-            cast(func.date(models.ShoutOut.created_at), Date).label("date"),
+            calendar_date(models.ShoutOut.created_at).label("date"),
             func.count(models.ShoutOut.id).label("count")
         )
         .where(models.ShoutOut.created_at >= last_7_days)
-        .group_by(cast(func.date(models.ShoutOut.created_at), Date))
+        .group_by(calendar_date(models.ShoutOut.created_at))
         .order_by("date")
     )
 
@@ -1081,19 +1210,19 @@ async def get_daily_activity(
 #-----------------------------------------Most liked Shoutouts (not succed yet)--------------------------------------------
 @router.get("/most-liked")
 async def get_most_liked_post(
-    db: AsyncSession = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_read_db),
+    current_user: Principal = Depends(get_current_user),
 ):
     query = (
         select(
             models.User.name.label("author_name"),
             func.sum(
-                func.coalesce(models.ShoutOut.reactions["👍"].as_integer(), 0)
+                func.coalesce(models.ShoutOut.reaction_counts["👍"].as_integer(), 0)
             ).label("like_count"),
         )
         .join(models.User, models.User.id == models.ShoutOut.author_id)
         .group_by(models.User.name)
-        .order_by(func.sum(func.coalesce(models.ShoutOut.reactions["👍"].as_integer(), 0)).desc())
+        .order_by(func.sum(func.coalesce(models.ShoutOut.reaction_counts["👍"].as_integer(), 0)).desc())
         .limit(1)
     )
 
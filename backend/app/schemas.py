@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr
-from typing import List, Optional
+from typing import Dict, List, Optional
 from datetime import datetime
 
 # ----- Login Request -----
@@ -64,6 +64,7 @@ class ShoutOutOut(BaseModel):
     author_name: str
     message: str
     image_url: Optional[str] = None
+    image_renditions: Dict[str, str] = {}  # name -> URL; empty until rendered
     created_at: Optional[str] = None
     tagged_users: List[int] = []
     tagged_user_names: List[str] = []
@@ -74,6 +75,41 @@ class ShoutOutOut(BaseModel):
         from_attributes = True
 
 
+class FeedPage(BaseModel):
+    items: List[ShoutOutOut] = []
+    next_cursor: Optional[str] = None
+    sync_token: Optional[str] = None  # first page only; pass to /shoutouts/feed/changes
+
+
+class ShoutOutCounts(BaseModel):
+    id: int
+    reactions: dict = {}
+    comments_count: int = 0
+    image_renditions: Dict[str, str] = {}
+
+
+class FeedChanges(BaseModel):
+    sync_token: str
+    reset: bool = False  # token too old or too far behind: refetch the feed
+    created: List[ShoutOutOut] = []
+    edited: List[ShoutOutOut] = []  # message changed: the whole shoutout again
+    updated: List[ShoutOutCounts] = []
+    reported: List[int] = []
+    deleted: List[int] = []
+
+
+# ----- Direct uploads (object storage) -----
+class UploadIn(BaseModel):
+    content_type: str
+    size: int
+    sha256: str  # hex digest of the file, computed by the client
+
+
+class UploadTicket(BaseModel):
+    image_key: str  # send with POST /shoutouts once uploaded
+    upload: Optional[dict] = None  # {method, url, headers}; None: already stored, skip the upload
+
+
 class ShoutOutCommentOut(BaseModel):
     id: int
     content: str
@@ -103,14 +139,21 @@ class CommentIn(BaseModel):
 
 class CommentOut(BaseModel):
     id: int
+    shoutout_id: Optional[int] = None
     content: str
     created_at: Optional[str] = None
     user_id: int
+    author_name: Optional[str] = None
 
     class Config:
         from_attributes = True
 
 
+class CommentPage(BaseModel):
+    items: List[CommentOut] = []
+    next_cursor: Optional[str] = None
+
+
 class CommentCreate(BaseModel):
     content: str
 
@@ -0,0 +1,350 @@
+"""
+Where uploaded files live.
+
+Files are addressed by key, their path under /uploads ("<sha256>.jpg",
+"renditions/<sha256>-480w.webp"). The database only ever holds
+/uploads/<key> URLs, so moving between backends rewrites no rows.
+STORAGE_BACKEND picks the implementation:
+
+- local: a directory (UPLOAD_DIR) that the app serves itself (see
+  uploads.UploadFiles). Every replica must see the same directory.
+- s3: a bucket on S3 or anything speaking its API (MinIO, R2, a moto
+  server during development). /uploads answers with a cacheable redirect
+  to S3_PUBLIC_URL, and clients may PUT images straight into the bucket
+  with a presigned URL, so the bytes never pass through an API worker.
+
+All methods block on disk or network I/O; call them on the thread pool.
+
+    python -m app.storage
+
+round-trips an object (presigned upload included) through the configured
+backend, e.g. against `moto_server` or a local MinIO.
+"""
+import abc
+import base64
+import hashlib
+import os
+import shutil
+import sys
+from typing import List, Optional, Tuple
+from urllib.parse import quote
+
+from .config import settings
+
+UPLOAD_DIR = settings.UPLOAD_DIR or os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "uploads"))
+
+# every key is written once and never changes (see uploads.py)
+UPLOAD_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+class BlobStorage(abc.ABC):
+    """What uploads.py and renditions.py need from a backend."""
+
+    @abc.abstractmethod
+    def save(self, key: str, path: str, content_type: str) -> None:
+        """Store the local file at `path` under `key`; the file is moved or removed."""
+
+    def local_path(self, key: str) -> Optional[str]:
+        """A path the key can be read from directly, if the backend has one."""
+        return None
+
+    @abc.abstractmethod
+    def fetch(self, key: str, path: str) -> None:
+        """Copy the object to a local file."""
+
+    @abc.abstractmethod
+    def exists(self, key: str) -> bool:
+        """Whether there is an object under `key`."""
+
+    @abc.abstractmethod
+    def peek(self, key: str, length: int) -> Optional[Tuple[bytes, int]]:
+        """The first `length` bytes and the total size, or None if there is no such object."""
+
+    @abc.abstractmethod
+    def sha256(self, key: str) -> Optional[str]:
+        """Hex digest of the object's bytes, or None if there is no such object."""
+
+    @abc.abstractmethod
+    def delete(self, key: str) -> None:
+        """Remove the object if it exists."""
+
+    @abc.abstractmethod
+    def delete_if_older(self, key: str, cutoff: float) -> bool:
+        """Remove the object only if it was last written before `cutoff` (epoch seconds)."""
+
+    @abc.abstractmethod
+    def stale_keys(self, cutoff: float) -> List[str]:
+        """Top-level keys last written before `cutoff` (epoch seconds)."""
+
+    def public_url(self, key: str) -> Optional[str]:
+        """Where browsers fetch the object; None when the app serves it under /uploads."""
+        return None
+
+    def presign_put(self, key: str, content_type: str, size: int, sha256: str) -> Optional[dict]:
+        """
+        {"method", "url", "headers"} for a client to upload exactly these
+        bytes (size and sha256 are bound into the signature), or None if the
+        backend can't take uploads directly.
+        """
+        return None
+
+
+# ---------------------------
+# Local directory
+# ---------------------------
+class LocalStorage(BlobStorage):
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+
+    def _path(self, key: str) -> str:
+        path = os.path.normpath(os.path.join(self.root, key))
+        if os.path.commonpath([path, self.root]) != self.root:
+            raise ValueError(f"{key!r} is outside the upload directory")
+        return path
+
+    def save(self, key: str, path: str, content_type: str) -> None:
+        dest = self._path(key)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        os.replace(path, dest)  # scratch files live in the same directory: a rename, not a copy
+
+    def local_path(self, key: str) -> Optional[str]:
+        return self._path(key)
+
+    def fetch(self, key: str, path: str) -> None:
+        shutil.copyfile(self._path(key), path)
+
+    def exists(self, key: str) -> bool:
+        return os.path.isfile(self._path(key))
+
+    def peek(self, key: str, length: int) -> Optional[Tuple[bytes, int]]:
+        try:
+            with open(self._path(key), "rb") as handle:
+                return handle.read(length), os.fstat(handle.fileno()).st_size
+        except (FileNotFoundError, IsADirectoryError):
+            return None
+
+    def sha256(self, key: str) -> Optional[str]:
+        digest = hashlib.sha256()
+        try:
+            with open(self._path(key), "rb") as handle:
+                for chunk in iter(lambda: handle.read(settings.UPLOAD_CHUNK_BYTES), b""):
+                    digest.update(chunk)
+        except (FileNotFoundError, IsADirectoryError):
+            return None
+        return digest.hexdigest()
+
+    def delete(self, key: str) -> None:
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def delete_if_older(self, key: str, cutoff: float) -> bool:
+        path = self._path(key)
+        try:
+            if os.stat(path).st_mtime >= cutoff:
+                return False
+            os.remove(path)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def stale_keys(self, cutoff: float) -> List[str]:
+        with os.scandir(self.root) as entries:
+            return [entry.name for entry in entries if entry.is_file() and entry.stat().st_mtime < cutoff]
+
+
+# ---------------------------
+# S3 and compatibles
+# ---------------------------
+class S3Storage(BlobStorage):
+    def __init__(
+        self,
+        bucket: str,
+        endpoint_url: Optional[str] = None,
+        region: Optional[str] = None,
+        access_key_id: Optional[str] = None,
+        secret_access_key: Optional[str] = None,
+        public_url: Optional[str] = None,
+        presign_expires: int = 300,
+    ):
+        # only deployments on object storage need boto3
+        import boto3
+        from botocore.config import Config
+        from botocore.exceptions import ClientError
+
+        self._client_error = ClientError
+        self.bucket = bucket
+        self.presign_expires = presign_expires
+        self._client = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url,
+            region_name=region,
+            aws_access_key_id=access_key_id,
+            aws_secret_access_key=secret_access_key,
+            config=Config(
+                signature_version="s3v4",
+                # custom endpoints rarely have per-bucket DNS
+                s3={"addressing_style": "path" if endpoint_url else "auto"},
+                # only send the checksum we sign ourselves (presign_put)
+                request_checksum_calculation="when_required",
+                response_checksum_validation="when_required",
+            ),
+        )
+        if public_url:
+            self._public_base = public_url.rstrip("/")
+        elif endpoint_url:
+            self._public_base = f"{endpoint_url.rstrip('/')}/{bucket}"
+        else:
+            self._public_base = f"https://{bucket}.s3.{region or 'us-east-1'}.amazonaws.com"
+
+    def _missing(self, error) -> bool:
+        return error.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound", "InvalidRange")
+
+    def save(self, key: str, path: str, content_type: str) -> None:
+        self._client.upload_file(
+            path, self.bucket, key, ExtraArgs={"ContentType": content_type, "CacheControl": UPLOAD_CACHE_CONTROL}
+        )
+        os.remove(path)
+
+    def fetch(self, key: str, path: str) -> None:
+        self._client.download_file(self.bucket, key, path)
+
+    def exists(self, key: str) -> bool:
+        try:
+            self._client.head_object(Bucket=self.bucket, Key=key)
+        except self._client_error as error:
+            if self._missing(error):
+                return False
+            raise
+        return True
+
+    def peek(self, key: str, length: int) -> Optional[Tuple[bytes, int]]:
+        try:
+            response = self._client.get_object(Bucket=self.bucket, Key=key, Range=f"bytes=0-{length - 1}")
+        except self._client_error as error:
+            if self._missing(error):
+                return None
+            raise
+        with response["Body"] as body:
+            head = body.read()
+        content_range = response.get("ContentRange")  # "bytes 0-15/48213"
+        return head, int(content_range.rsplit("/", 1)[1]) if content_range else response["ContentLength"]
+
+    def sha256(self, key: str) -> Optional[str]:
+        try:
+            response = self._client.get_object(Bucket=self.bucket, Key=key)
+        except self._client_error as error:
+            if self._missing(error):
+                return None
+            raise
+        digest = hashlib.sha256()
+        body = response["Body"]
+        try:
+            for chunk in body.iter_chunks(settings.UPLOAD_CHUNK_BYTES):
+                digest.update(chunk)
+        finally:
+            body.close()
+        return digest.hexdigest()
+
+    def delete(self, key: str) -> None:
+        self._client.delete_object(Bucket=self.bucket, Key=key)
+
+    def delete_if_older(self, key: str, cutoff: float) -> bool:
+        try:
+            written = self._client.head_object(Bucket=self.bucket, Key=key)["LastModified"]
+        except self._client_error as error:
+            if self._missing(error):
+                return False
+            raise
+        if written.timestamp() >= cutoff:
+            return False
+        self.delete(key)
+        return True
+
+    def stale_keys(self, cutoff: float) -> List[str]:
+        keys = []
+        for page in self._client.get_paginator("list_objects_v2").paginate(Bucket=self.bucket, Delimiter="/"):
+            keys += [item["Key"] for item in page.get("Contents", []) if item["LastModified"].timestamp() < cutoff]
+        return keys
+
+    def public_url(self, key: str) -> Optional[str]:
+        return f"{self._public_base}/{quote(key)}"
+
+    def presign_put(self, key: str, content_type: str, size: int, sha256: str) -> Optional[dict]:
+        # S3 refuses the PUT unless the body has exactly this length and hash
+        checksum = base64.b64encode(bytes.fromhex(sha256)).decode()
+        url = self._client.generate_presigned_url(
+            "put_object",
+            Params={
+                "Bucket": self.bucket,
+                "Key": key,
+                "ContentType": content_type,
+                "ContentLength": size,
+                "ChecksumSHA256": checksum,
+                "CacheControl": UPLOAD_CACHE_CONTROL,
+            },
+            ExpiresIn=self.presign_expires,
+        )
+        headers = {"Content-Type": content_type, "Cache-Control": UPLOAD_CACHE_CONTROL, "x-amz-checksum-sha256": checksum}
+        return {"method": "PUT", "url": url, "headers": headers}
+
+
+def _build_storage() -> BlobStorage:
+    if settings.STORAGE_BACKEND == "s3":
+        return S3Storage(
+            bucket=settings.S3_BUCKET,
+            endpoint_url=settings.S3_ENDPOINT_URL,
+            region=settings.S3_REGION,
+            access_key_id=settings.S3_ACCESS_KEY_ID,
+            secret_access_key=settings.S3_SECRET_ACCESS_KEY,
+            public_url=settings.S3_PUBLIC_URL,
+            presign_expires=settings.S3_PRESIGN_EXPIRES_SECONDS,
+        )
+    return LocalStorage(UPLOAD_DIR)
+
+
+storage = _build_storage()
+
+
+def main() -> int:
+    import tempfile
+    import time
+
+    import httpx
+
+    key = f"storage-check-{int(time.time())}.txt"
+    body = b"storage check\n"
+    failures = []
+
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=UPLOAD_DIR, suffix=".part", delete=False) as handle:
+        handle.write(body)
+    storage.save(key, handle.name, "text/plain")
+    if storage.peek(key, 5) != (body[:5], len(body)):
+        failures.append(f"save/peek: got {storage.peek(key, 5)!r}")
+    public = storage.public_url(key)
+    if public is not None and httpx.get(public).content != body:
+        failures.append(f"public read: {public} did not return the object")
+    storage.delete(key)
+    if storage.peek(key, 5) is not None:
+        failures.append("delete: object still there")
+
+    ticket = storage.presign_put(key, "text/plain", len(body), hashlib.sha256(body).hexdigest())
+    if ticket is None:
+        print(f"{type(storage).__name__} takes no direct uploads")
+    else:
+        response = httpx.request(ticket["method"], ticket["url"], content=body, headers=ticket["headers"])
+        if response.status_code != 200 or storage.peek(key, 5) != (body[:5], len(body)):
+            failures.append(f"presigned PUT: {response.status_code} {response.text[:200]}")
+        storage.delete(key)
+
+    for failure in failures:
+        print(failure)
+    if not failures:
+        print(f"{type(storage).__name__} OK")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,400 @@
+"""
+Image uploads.
+
+An upload is copied to UPLOAD_DIR in UPLOAD_CHUNK_BYTES pieces, with the
+file I/O on the thread pool, so neither memory nor the event loop scales
+with the file size (Starlette has already spooled anything large to a
+temporary file). Uploads are rejected as soon as we can tell: on the
+declared content type before reading, on the magic bytes of the first
+chunk, and on UPLOAD_MAX_BYTES mid-copy. The file is written under a
+temporary name and only then handed to storage (storage.py), so a
+rejected or failed upload never becomes visible under /uploads.
+
+Files are content-addressed: every chunk goes through a sha256 on its way
+to disk, so when the copy ends the file's key (<sha256><ext>) is known
+without reading it again. upload_blobs holds one row per file with the
+number of shoutouts using it. Posting an image that is already stored
+just bumps that count; the temporary copy is dropped rather than stored
+again, and the file's renditions are reused (see renditions.py).
+
+On object storage, clients can skip the API for the bytes: they ask for
+an upload ticket with the file's size and sha256, PUT the file to the
+presigned URL (storage rejects any other bytes), then post the shoutout
+with the ticket's image_key. We only read the first bytes back to check
+it is an image. A file that is already stored needs no upload at all.
+
+Deleting a shoutout only decrements the count. Files nothing refers to
+any more, with their renditions, are removed by
+
+    python -m app.uploads
+
+which also clears files and temporaries that failed requests left behind,
+once they are older than UPLOAD_SWEEP_GRACE_SECONDS.
+
+Every key is unique and its bytes never change (a content hash, a
+rendition of one, or a random name from before hashing), so /uploads is
+served as immutable for a year with the name as a strong ETag.
+"""
+import asyncio
+import hashlib
+import mimetypes
+import os
+import posixpath
+import re
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional, Tuple
+from urllib.parse import quote
+from uuid import uuid4
+
+from fastapi import HTTPException, UploadFile, status
+from fastapi.staticfiles import StaticFiles
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, RedirectResponse, Response
+from starlette.staticfiles import NotModifiedResponse
+
+from .config import settings
+from .database import AsyncSessionLocal
+from .models import UploadBlob
+from .portable import upsert_insert
+from .storage import UPLOAD_CACHE_CONTROL, UPLOAD_DIR, storage
+
+UPLOAD_URL_PREFIX = "/uploads"
+
+CONTENT_TYPES = {".jpg": "image/jpeg", ".png": "image/png", ".gif": "image/gif", ".webp": "image/webp"}
+ALLOWED_CONTENT_TYPES = set(CONTENT_TYPES.values())
+
+# what sniff_image can name a stored file
+HASHED_NAME = re.compile(r"([0-9a-f]{64})\.(?:jpg|png|gif|webp)")
+SHA256_HEX = re.compile(r"[0-9a-f]{64}")
+
+
+def sniff_image(head: bytes) -> Optional[str]:
+    """The file extension for a supported image's leading bytes, else None."""
+    if head.startswith(b"\xff\xd8\xff"):
+        return ".jpg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return ".png"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return ".gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return ".webp"
+    return None
+
+
+def key_for_url(url: str) -> Optional[str]:
+    """The storage key behind an /uploads URL, or None if the URL isn't one."""
+    prefix = f"{UPLOAD_URL_PREFIX}/"
+    if not url.startswith(prefix):
+        return None
+    key = posixpath.normpath(url[len(prefix):])
+    if key in (".", "..") or key.startswith(("../", "/")):
+        return None
+    return key
+
+
+def digest_for_url(url: Optional[str]) -> Optional[str]:
+    """The sha256 an upload is stored under; None for other URLs (and pre-hashing uploads)."""
+    prefix = f"{UPLOAD_URL_PREFIX}/"
+    if not url or not url.startswith(prefix):
+        return None
+    match = HASHED_NAME.fullmatch(url[len(prefix):])
+    return match.group(1) if match else None
+
+
+def _unsupported() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+        detail="Images must be JPEG, PNG, GIF or WebP",
+    )
+
+
+def _too_large() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"Images are limited to {settings.UPLOAD_MAX_BYTES / (1024 * 1024):.1f} MB",
+    )
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _discard(handle, path: str) -> None:
+    handle.close()
+    _remove(path)
+
+
+def _write(handle, digest, chunk: bytes) -> None:
+    digest.update(chunk)  # hashlib releases the GIL for chunks this size
+    handle.write(chunk)
+
+
+async def _receive(upload: UploadFile) -> Tuple[str, str, str, int]:
+    """Stream an upload to a temporary file; returns (temporary path, sha256 hex, extension, size)."""
+    if upload.content_type not in ALLOWED_CONTENT_TYPES:
+        raise _unsupported()
+
+    chunk = await upload.read(settings.UPLOAD_CHUNK_BYTES)
+    ext = sniff_image(chunk)
+    if ext is None:
+        raise _unsupported()
+
+    # random, so concurrent uploads of the same image don't share it
+    partial = os.path.join(UPLOAD_DIR, f"{uuid4().hex}.part")
+    handle = await run_in_threadpool(open, partial, "wb")
+    digest = hashlib.sha256()
+    try:
+        size = 0
+        while chunk:
+            size += len(chunk)
+            if size > settings.UPLOAD_MAX_BYTES:
+                raise _too_large()
+            await run_in_threadpool(_write, handle, digest, chunk)
+            chunk = await upload.read(settings.UPLOAD_CHUNK_BYTES)
+        await run_in_threadpool(handle.close)
+    except BaseException:
+        await run_in_threadpool(_discard, handle, partial)
+        raise
+    return partial, digest.hexdigest(), ext, size
+
+
+async def _count_reference(db: AsyncSession, digest: str, filename: str, size: int) -> int:
+    """Count one more user of the blob in the caller's transaction; returns the new count."""
+    insert = upsert_insert(db.get_bind().dialect.name)
+    stmt = insert(UploadBlob).values(
+        digest=digest, filename=filename, size=size, ref_count=1, updated_at=datetime.utcnow()
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[UploadBlob.digest],
+        set_={"ref_count": UploadBlob.ref_count + 1, "updated_at": stmt.excluded.updated_at},
+    ).returning(UploadBlob.ref_count)
+    return (await db.execute(stmt)).scalar_one()
+
+
+async def save_image(db: AsyncSession, upload: UploadFile) -> str:
+    """
+    Stream an uploaded image into storage and count a reference to it in
+    the caller's transaction; returns its public URL.
+    """
+    partial, digest, ext, size = await _receive(upload)
+    filename = f"{digest}{ext}"
+    try:
+        ref_count = await _count_reference(db, digest, filename, size)
+        # The upsert waits on a sweep deleting this row, and a sweep skips
+        # rows we have counted, so a file someone else still refers to
+        # stays put. Only a fresh (or revived) blob needs our copy.
+        if ref_count > 1 and await run_in_threadpool(storage.exists, filename):
+            await run_in_threadpool(_remove, partial)
+        else:
+            await run_in_threadpool(storage.save, filename, partial, CONTENT_TYPES[ext])
+    except BaseException:
+        await run_in_threadpool(_remove, partial)
+        raise
+    return f"{UPLOAD_URL_PREFIX}/{filename}"
+
+
+async def upload_ticket(db: AsyncSession, content_type: str, size: int, sha256: str) -> dict:
+    """Where to PUT a file the client has hashed, unless it is stored already."""
+    ext = next((ext for ext, known in CONTENT_TYPES.items() if known == content_type), None)
+    if ext is None:
+        raise _unsupported()
+    if size > settings.UPLOAD_MAX_BYTES:
+        raise _too_large()
+    sha256 = sha256.lower()
+    if size <= 0 or not SHA256_HEX.fullmatch(sha256):
+        raise HTTPException(status_code=400, detail="size and sha256 of the file are required")
+
+    filename = f"{sha256}{ext}"
+    stored = await db.scalar(select(UploadBlob.ref_count).where(UploadBlob.digest == sha256))
+    if stored is not None and stored > 0:
+        return {"image_key": filename, "upload": None}
+    upload = await run_in_threadpool(storage.presign_put, filename, content_type, size, sha256)
+    if upload is None:
+        raise HTTPException(
+            status_code=status.HTTP_501_NOT_IMPLEMENTED,
+            detail="Direct uploads need object storage; attach the image to the shoutout instead",
+        )
+    return {"image_key": filename, "upload": upload}
+
+
+async def claim_upload(db: AsyncSession, image_key: str) -> str:
+    """
+    Count a reference to a file the client uploaded with a ticket, in the
+    caller's transaction; returns its public URL. Storage has already
+    checked the bytes against the key's sha256, so only the type is left
+    (and, with S3_VERIFY_UPLOADS, the hash for stores that don't check).
+    """
+    match = HASHED_NAME.fullmatch(image_key)
+    head = await run_in_threadpool(storage.peek, image_key, 16) if match else None
+    if head is None:
+        raise HTTPException(status_code=400, detail="No such upload; request a new upload ticket")
+    prefix, size = head
+    if sniff_image(prefix) != os.path.splitext(image_key)[1]:
+        await run_in_threadpool(storage.delete, image_key)
+        raise _unsupported()
+    if settings.S3_VERIFY_UPLOADS and await run_in_threadpool(storage.sha256, image_key) != match.group(1):
+        await run_in_threadpool(storage.delete, image_key)
+        raise HTTPException(status_code=400, detail="Upload does not match its sha256; request a new upload ticket")
+    await _count_reference(db, match.group(1), image_key, size)
+    return f"{UPLOAD_URL_PREFIX}/{image_key}"
+
+
+async def release_images(db: AsyncSession, image_urls: Iterable[Optional[str]]) -> None:
+    """Drop the references of shoutouts being deleted in the caller's transaction."""
+    released = Counter(digest for digest in map(digest_for_url, image_urls) if digest)
+    by_count = defaultdict(list)
+    for digest, count in released.items():
+        by_count[count].append(digest)
+    for count, digests in by_count.items():
+        await db.execute(
+            update(UploadBlob)
+            .where(UploadBlob.digest.in_(sorted(digests)))
+            .values(ref_count=UploadBlob.ref_count - count, updated_at=datetime.utcnow())
+        )
+
+
+# ---------------------------
+# Serving (mounted at /uploads)
+# ---------------------------
+class UploadFiles(StaticFiles):
+    """
+    StaticFiles with immutable caching and a name-based strong ETag (the
+    same on every replica, unlike Starlette's mtime-based one). Ranges,
+    304s and the ASGI pathsend extension (zero-copy on servers that offer
+    it) come from Starlette.
+
+    With accel_redirect_prefix set, the body is left to the front proxy:
+    the response only carries the headers and an X-Accel-Redirect to
+    <prefix><path>, which nginx maps onto an internal location aliasing
+    UPLOAD_DIR. Python then never reads image bytes; the proxy does the
+    sendfile and the ranges.
+    """
+
+    def __init__(self, *, directory: str, accel_redirect_prefix: Optional[str] = None):
+        super().__init__(directory=directory)
+        self.accel_redirect_prefix = accel_redirect_prefix
+
+    def file_response(self, full_path, stat_result: os.stat_result, scope, status_code: int = 200) -> Response:
+        name = os.path.basename(full_path)
+        headers = {"Cache-Control": UPLOAD_CACHE_CONTROL, "ETag": f'"{os.path.splitext(name)[0]}"'}
+        if self.accel_redirect_prefix:
+            relative = os.path.relpath(full_path, self.directory).replace(os.sep, "/")
+            headers["X-Accel-Redirect"] = f"{self.accel_redirect_prefix}{quote(relative)}"
+            response = Response(
+                status_code=status_code,
+                headers=headers,
+                media_type=mimetypes.guess_type(name)[0] or "application/octet-stream",
+            )
+        else:
+            response = FileResponse(full_path, status_code=status_code, headers=headers, stat_result=stat_result)
+        if self.is_not_modified(response.headers, Headers(scope=scope)):
+            return NotModifiedResponse(response.headers)
+        return response
+
+
+class UploadRedirects(StaticFiles):
+    """
+    /uploads on object storage: a permanent, cacheable redirect to where
+    the object is public, so a browser asks us about each image once.
+    """
+
+    def __init__(self):
+        super().__init__(directory=None, check_dir=False)
+
+    async def get_response(self, path: str, scope) -> Response:
+        if scope["method"] not in ("GET", "HEAD"):
+            raise HTTPException(status_code=405)
+        key = path.replace(os.sep, "/")
+        if key in (".", "") or key.startswith(".."):
+            raise HTTPException(status_code=404)
+        return RedirectResponse(
+            storage.public_url(key),
+            status_code=status.HTTP_301_MOVED_PERMANENTLY,
+            headers={"Cache-Control": UPLOAD_CACHE_CONTROL},
+        )
+
+
+# ---------------------------
+# Sweep (python -m app.uploads)
+# ---------------------------
+def _remove_blob_files(filename: str, renditions: Optional[dict]) -> None:
+    storage.delete(filename)
+    for url in (renditions or {}).values():
+        key = key_for_url(url)
+        if key:
+            storage.delete(key)
+
+
+def _remove_if_stale(path: str, cutoff: float) -> bool:
+    try:
+        if os.stat(path).st_mtime >= cutoff:
+            return False
+        os.remove(path)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def _stale_partials(cutoff: float) -> List[str]:
+    """Temporaries in UPLOAD_DIR last touched before cutoff."""
+    with os.scandir(UPLOAD_DIR) as entries:
+        return [
+            entry.path for entry in entries
+            if entry.name.endswith(".part") and entry.is_file() and entry.stat().st_mtime < cutoff
+        ]
+
+
+async def sweep(grace_seconds: int, batch_size: int = 500) -> Tuple[int, int]:
+    """Remove unreferenced files; returns (blobs, leftovers) removed."""
+    cutoff = datetime.utcnow() - timedelta(seconds=grace_seconds)
+    async with AsyncSessionLocal() as db:
+        # the rows stay locked until the files are gone, so an upload of the
+        # same image waits and then stores its own copy
+        result = await db.execute(
+            delete(UploadBlob)
+            .where(UploadBlob.ref_count <= 0, UploadBlob.updated_at < cutoff)
+            .returning(UploadBlob.filename, UploadBlob.renditions)
+        )
+        blobs = result.all()
+        for filename, renditions in blobs:
+            await run_in_threadpool(_remove_blob_files, filename, renditions)
+        await db.commit()
+
+    # files without a row: their request failed after the copy was stored,
+    # or a ticket was used to upload but never claimed
+    stale_before = time.time() - grace_seconds
+    hashed = [key for key in await run_in_threadpool(storage.stale_keys, stale_before) if HASHED_NAME.fullmatch(key)]
+    removed = 0
+    for start in range(0, len(hashed), batch_size):
+        batch = {HASHED_NAME.fullmatch(key).group(1): key for key in hashed[start:start + batch_size]}
+        async with AsyncSessionLocal() as db:
+            known = set((await db.execute(select(UploadBlob.digest).where(UploadBlob.digest.in_(batch)))).scalars())
+        for digest, key in batch.items():
+            # an upload may have stored a fresh copy since the listing
+            if digest not in known:
+                removed += await run_in_threadpool(storage.delete_if_older, key, stale_before)
+    for path in await run_in_threadpool(_stale_partials, stale_before):
+        removed += await run_in_threadpool(_remove_if_stale, path, stale_before)
+    return len(blobs), removed
+
+
+async def main():
+    from .database import engine
+
+    try:
+        blobs, leftovers = await sweep(settings.UPLOAD_SWEEP_GRACE_SECONDS)
+    finally:
+        await engine.dispose()  # an open aiosqlite connection would keep the process alive
+    print(f"Removed {blobs} unreferenced uploads and {leftovers} leftover files")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
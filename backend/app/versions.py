@@ -0,0 +1,83 @@
+"""
+Content versions and strong ETags for conditional GETs.
+
+Versions are read from append-only tables the write paths already
+maintain, so they advance with every relevant write without a hot counter
+row that every reaction in a department would have to lock:
+
+* feed / leaderboard: newest committed shoutout_changes position (per
+  department, or overall for superadmins). Not the newest id: ids are
+  taken at INSERT, so a late commit of a lower id would leave that max
+  where it was and keep the stale version current (see changes.py).
+* employee of the month: newest employee_of_month id
+* notifications: newest notification id plus the row count, since user
+  deletion can cascade rows away
+
+Read the version *before* the content: a response is then never tagged
+with a version newer than the data it carries.
+"""
+import hashlib
+from typing import Optional
+
+from fastapi import Request
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import changes
+from .models import EmployeeOfMonth, Notification, ShoutOutChange
+
+
+# ---------------------------
+# Versions
+# ---------------------------
+def build_feed_version_statement(department: Optional[str] = None):
+    """
+    Newest change below the committed horizon, for one department or for
+    every department when None. Whenever the horizon passes a commit, the
+    max rises past everything counted before, so the version moves.
+    """
+    query = select(func.max(changes.position)).where(changes.position < changes.horizon())
+    if department is not None:
+        query = query.where(ShoutOutChange.department == department)
+    return query
+
+
+async def feed_version(db: AsyncSession, department: Optional[str] = None) -> int:
+    result = await db.execute(build_feed_version_statement(department))
+    return result.scalar() or 0
+
+
+async def employee_of_month_version(db: AsyncSession, department: Optional[str] = None) -> int:
+    query = select(func.max(EmployeeOfMonth.id))
+    if department is not None:
+        query = query.where(EmployeeOfMonth.department == department)
+    result = await db.execute(query)
+    return result.scalar() or 0
+
+
+async def notifications_version(db: AsyncSession) -> str:
+    result = await db.execute(select(func.max(Notification.id), func.count(Notification.id)))
+    newest, total = result.one()
+    return f"{newest or 0}.{total}"
+
+
+# ---------------------------
+# ETags
+# ---------------------------
+def etag(resource: str, version, *variant) -> str:
+    """Strong ETag for a resource at a version, varied by whatever shapes the body."""
+    key = "|".join(str(part) for part in (resource, version, *variant))
+    return '"' + hashlib.sha1(key.encode()).hexdigest()[:24] + '"'
+
+
+def is_fresh(request: Request, tag: str) -> bool:
+    """True when the client's If-None-Match already names this representation."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    # If-None-Match uses weak comparison, so ignore a W/ prefix
+    candidates = [c.strip().removeprefix("W/") for c in header.split(",")]
+    return "*" in candidates or tag in candidates
+
+
+CACHE_CONTROL = "private, no-cache"
@@ -1,2 +1,2 @@
 #!/bin/bash
-uvicorn app.main:app --host 0.0.0.0 --port 10000
+python -m app.migrate && uvicorn app.main:app --host 0.0.0.0 --port 10000
@@ -0,0 +1,93 @@
+"""
+Settings are read when app.config is imported, so give the app enough
+configuration to load before any test imports it: a throwaway SQLite
+file and upload directory unless the environment says otherwise. Tests
+that need Postgres read TEST_DATABASE_URL and skip without it.
+"""
+import asyncio
+import os
+import tempfile
+import uuid
+
+import pytest
+
+_scratch = tempfile.mkdtemp(prefix="shoutouts-tests-")
+
+os.environ.setdefault("SECRET_KEY", "test-secret")
+os.environ.setdefault("UPLOAD_DIR", os.path.join(_scratch, "uploads"))
+if not os.environ.get("DATABASE_URL") and not os.environ.get("SQLITE_PATH"):
+    os.environ["SQLITE_PATH"] = os.path.join(_scratch, "app.sqlite")
+
+
+async def _fresh_schema():
+    from app.database import Base, engine
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+
+
+@pytest.fixture
+def client():
+    """A TestClient on an empty schema, with the in-process caches emptied."""
+    from fastapi.testclient import TestClient
+
+    from app import auth
+    from app.feed_cache import feed_cache
+    from app.login_limiter import login_limiter
+    from app.main import app
+
+    with TestClient(app) as test_client:
+        test_client.portal.call(_fresh_schema)
+        auth.token_cache.clear()
+        auth.principal_cache.clear()
+        feed_cache.invalidate()
+        login_limiter._buckets.clear()
+        yield test_client
+
+
+@pytest.fixture
+def login(client):
+    """login(email, role=..., department=...) registers a user and returns its auth headers."""
+
+    def login(email: str, role: str = "employee", department: str = "IT") -> dict:
+        name = email.split("@")[0]
+        user = dict(username=name, name=name.title(), email=email, password="pw", role=role, department=department)
+        registered = client.post("/auth/register", json=user)
+        assert registered.status_code == 200, registered.text
+        response = client.post("/auth/login", json=dict(email=email, password="pw", role=role))
+        assert response.status_code == 200, response.text
+        return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    return login
+
+
+TEST_DATABASE_URL = os.environ.get("TEST_DATABASE_URL", "")
+
+
+async def _server_command(sql: str) -> None:
+    from sqlalchemy import text
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from sqlalchemy.pool import NullPool
+
+    engine = create_async_engine(TEST_DATABASE_URL, poolclass=NullPool, isolation_level="AUTOCOMMIT")
+    try:
+        async with engine.connect() as conn:
+            await conn.execute(text(sql))
+    finally:
+        await engine.dispose()
+
+
+@pytest.fixture
+def postgres_database():
+    """URL of a new, empty database on the TEST_DATABASE_URL server, dropped afterwards."""
+    from sqlalchemy.engine import make_url
+
+    if not TEST_DATABASE_URL.startswith("postgresql"):
+        pytest.skip("set TEST_DATABASE_URL to a Postgres database to run Postgres-only tests")
+    name = f"shoutouts_test_{uuid.uuid4().hex[:12]}"
+    asyncio.run(_server_command(f'CREATE DATABASE "{name}"'))
+    try:
+        yield make_url(TEST_DATABASE_URL).set(database=name).render_as_string(hide_password=False)
+    finally:
+        asyncio.run(_server_command(f'DROP DATABASE "{name}" WITH (FORCE)'))
@@ -0,0 +1,191 @@
+"""
+Authentication on the SQLite app: suspended accounts, the bcrypt pool,
+the shared token decode path and login admission control.
+"""
+import asyncio
+import threading
+import time
+
+import pytest
+from jose import jwt
+from jose.exceptions import ExpiredSignatureError
+from sqlalchemy import event
+
+from app import auth, database
+from app.config import settings
+from app.hashing import HashingPool, hashing_pool
+from app.login_limiter import LoginLimiter, login_limiter
+
+
+# ---------------------------
+# Suspended accounts
+# ---------------------------
+def test_suspended_employee_is_refused_until_reactivated(client, login):
+    admin = login("boss@x.com", role="superadmin")
+    employee = login("emp@x.com")
+    emp_id = client.get("/auth/me", headers=employee).json()["id"]
+    assert client.get("/auth/shoutouts/feed", headers=employee).status_code == 200
+    assert auth.principal_cache[emp_id].is_active
+
+    suspended = client.patch(f"/admin/employees/{emp_id}/suspend", params={"suspend": True}, headers=admin)
+    assert suspended.status_code == 200
+
+    # the cached principal was dropped, so the very next request sees it
+    assert emp_id not in auth.principal_cache
+    refused = client.get("/auth/shoutouts/feed", headers=employee)
+    assert refused.status_code == 403
+    assert refused.json()["detail"] == "Account suspended"
+    assert client.get("/auth/me", headers=employee).status_code == 403
+    login_again = client.post("/auth/login", json=dict(email="emp@x.com", password="pw", role="employee"))
+    assert login_again.status_code == 403
+
+    client.patch(f"/admin/employees/{emp_id}/suspend", params={"suspend": False}, headers=admin)
+    assert client.get("/auth/shoutouts/feed", headers=employee).status_code == 200
+
+
+# ---------------------------
+# Hashing pool
+# ---------------------------
+def test_login_gets_503_when_the_hashing_pool_is_full(client, login, monkeypatch):
+    login("busy@x.com")
+    monkeypatch.setattr(hashing_pool, "workers", 1)
+    monkeypatch.setattr(hashing_pool, "max_queue", 0)
+    release = threading.Event()
+    blocker = client.portal.start_task_soon(hashing_pool.run, release.wait)
+    try:
+        started = time.monotonic()
+        while hashing_pool.in_flight < 1 and time.monotonic() - started < 5:
+            time.sleep(0.01)
+        rejected_before = hashing_pool.rejected
+
+        response = client.post("/auth/login", json=dict(email="busy@x.com", password="pw", role="employee"))
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
+        assert hashing_pool.rejected == rejected_before + 1
+    finally:
+        release.set()
+        blocker.result(timeout=5)
+
+    assert client.post("/auth/login", json=dict(email="busy@x.com", password="pw", role="employee")).status_code == 200
+
+
+def test_failed_hashes_are_counted_apart_from_completed_ones():
+    def broken(_password):
+        raise ValueError("bad salt")
+
+    async def main():
+        pool = HashingPool(workers=1, max_queue=0)
+        try:
+            assert await pool.run(len, "pw") == 2
+            with pytest.raises(ValueError):
+                await pool.run(broken, "pw")
+        finally:
+            pool.shutdown()
+        return pool.stats()
+
+    stats = asyncio.run(main())
+    assert (stats["completed"], stats["failed"], stats["in_flight"]) == (1, 1, 0)
+
+
+# ---------------------------
+# Token decoding
+# ---------------------------
+@pytest.fixture
+def decodes(monkeypatch):
+    """Counts signature checks per token, i.e. calls that missed the token cache."""
+    counts = {}
+    real_decode = jwt.decode
+
+    def counting(token, *args, **kwargs):
+        counts[token] = counts.get(token, 0) + 1
+        return real_decode(token, *args, **kwargs)
+
+    monkeypatch.setattr(jwt, "decode", counting)
+    auth.token_cache.clear()
+    return counts
+
+
+def test_cached_claims_stop_validating_at_exp(decodes):
+    exp = int(time.time()) + 1
+    token = jwt.encode({"sub": "1", "exp": exp}, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
+    assert auth.decode_token(token)["sub"] == "1"
+    assert auth.decode_token(token)["sub"] == "1"
+    assert decodes[token] == 1
+
+    while time.time() <= exp:
+        time.sleep(0.05)
+    assert len(auth.token_cache) == 0
+    # jose compares whole seconds, so the signature check only refuses it a second later
+    while time.time() < exp + 1:
+        time.sleep(0.05)
+    with pytest.raises(ExpiredSignatureError):
+        auth.decode_token(token)
+    assert decodes[token] == 2
+
+
+def test_tokens_without_a_numeric_exp_are_not_cached(decodes):
+    token = jwt.encode({"sub": "1"}, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
+    auth.decode_token(token)
+    auth.decode_token(token)
+    assert decodes[token] == 2
+    assert len(auth.token_cache) == 0
+
+
+def test_me_refresh_and_protected_routes_share_the_decode_path(client, login, decodes):
+    headers = login("reader@x.com")
+    access_token = headers["Authorization"].removeprefix("Bearer ")
+    refresh_token = client.cookies["refresh_token"]
+
+    for _ in range(2):
+        assert client.get("/auth/me", headers=headers).status_code == 200
+        assert client.get("/auth/shoutouts/feed", headers=headers).status_code == 200
+        assert client.post("/auth/refresh").status_code == 200
+
+    # each token's signature was checked once, whichever route saw it first
+    assert decodes[access_token] == 1
+    assert decodes[refresh_token] == 1
+
+
+# ---------------------------
+# Login admission control
+# ---------------------------
+def test_login_over_the_email_burst_gets_429_without_touching_the_database(client, login):
+    login("target@x.com")
+    login_limiter._buckets.clear()
+    attempt = dict(email="target@x.com", password="wrong", role="employee")
+    for _ in range(settings.LOGIN_EMAIL_BURST):
+        assert client.post("/auth/login", json=attempt).status_code == 401
+
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    hashes_before = hashing_pool.stats()["completed"]
+    rejected_before = dict(login_limiter.rejected_by)
+    event.listen(database.engine.sync_engine, "before_cursor_execute", record)
+    try:
+        # the email is normalised, so case and padding do not buy another attempt
+        response = client.post("/auth/login", json={**attempt, "email": " Target@X.com "})
+    finally:
+        event.remove(database.engine.sync_engine, "before_cursor_execute", record)
+
+    assert response.status_code == 429
+    assert 1 <= int(response.headers["Retry-After"]) <= 60 / settings.LOGIN_EMAIL_PER_MINUTE
+    assert statements == []
+    assert hashing_pool.stats()["completed"] == hashes_before
+    assert login_limiter.rejected_by == {"email": rejected_before["email"] + 1, "ip": rejected_before["ip"]}
+
+
+def test_ip_bucket_trips_independently_of_email_buckets():
+    limiter = LoginLimiter(
+        email_burst=5, email_per_minute=5, ip_burst=3, ip_per_minute=30, maxsize=100, sync_seconds=1
+    )
+    assert [limiter.admit(f"user{n}@x.com", "10.0.0.1") for n in range(3)] == [0, 0, 0]
+
+    wait = limiter.admit("fresh@x.com", "10.0.0.1")
+    assert 0 < wait <= 2  # one token per two seconds
+    assert limiter.rejected_by == {"email": 0, "ip": 1}
+    # another address is unaffected, and so is the refused email from it
+    assert limiter.admit("fresh@x.com", "10.0.0.2") == 0
+    assert limiter.stats()["admitted"] == 4
@@ -0,0 +1,111 @@
+"""
+Comment pages on the SQLite app: oldest first with a keyset cursor, and
+the batch preview endpoint for a page of feed items.
+"""
+from datetime import datetime, timedelta
+
+from app import database
+from app.config import settings
+from app.models import ShoutOut, ShoutOutComment
+
+
+def seed(client, author_id: int, comment_times: list) -> list:
+    """One shoutout per entry of comment_times, with a comment at each of its times; returns (id, comment ids)."""
+
+    async def insert():
+        async with database.AsyncSessionLocal() as db:
+            shoutouts = [ShoutOut(message=f"m{n}", author_id=author_id, department="IT") for n in comment_times]
+            db.add_all(shoutouts)
+            await db.flush()
+            comments = [
+                [ShoutOutComment(shoutout_id=shoutout.id, user_id=author_id, content=f"c{n}", created_at=at)
+                 for n, at in enumerate(times)]
+                for shoutout, times in zip(shoutouts, comment_times)
+            ]
+            db.add_all([comment for group in comments for comment in group])
+            await db.commit()
+            return [(shoutout.id, [comment.id for comment in group]) for shoutout, group in zip(shoutouts, comments)]
+
+    return client.portal.call(insert)
+
+
+def oldest_first(times: list, ids: list) -> list:
+    return [comment_id for _, comment_id in sorted(zip(times, ids))]
+
+
+# ---------------------------
+# One shoutout's comments
+# ---------------------------
+def test_comments_page_oldest_first_across_equal_timestamps(client, login):
+    headers = login("reader@x.com")
+    me = client.get("/auth/me", headers=headers).json()
+    tie = datetime(2026, 1, 2, 12, 0, 0)
+    times = [datetime(2026, 1, 3), tie, datetime(2026, 1, 1), tie, tie]
+    [(shoutout_id, comment_ids)] = seed(client, me["id"], [times])
+
+    seen, pages, cursor = [], [], None
+    while True:
+        params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+        response = client.get(f"/auth/shoutouts/{shoutout_id}/comments", params=params, headers=headers)
+        assert response.status_code == 200, response.text
+        page = response.json()
+        pages.append(len(page["items"]))
+        seen += page["items"]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+    assert [item["id"] for item in seen] == oldest_first(times, comment_ids)
+    assert pages == [2, 2, 1]
+    assert {item["author_name"] for item in seen} == {me["name"]}
+
+
+def test_comments_page_rejects_a_bad_cursor(client, login):
+    headers = login("reader@x.com")
+    response = client.get("/auth/shoutouts/1/comments", params={"cursor": "not-a-cursor"}, headers=headers)
+    assert response.status_code == 400
+
+
+# ---------------------------
+# Batch previews
+# ---------------------------
+def test_previews_for_a_full_page_of_ids(client, login):
+    headers = login("reader@x.com")
+    author_id = client.get("/auth/me", headers=headers).json()["id"]
+    preview = settings.COMMENTS_PREVIEW_SIZE
+    start = datetime(2026, 1, 1)
+    # 0 .. preview + 2 comments each, newest inserted first
+    comment_times = [
+        [start - timedelta(minutes=m) for m in range(n % (preview + 3))]
+        for n in range(settings.FEED_MAX_PAGE_SIZE)
+    ]
+    seeded = seed(client, author_id, comment_times)
+
+    response = client.get(
+        "/auth/shoutouts/comments",
+        params={"ids": [shoutout_id for shoutout_id, _ in seeded]},
+        headers=headers,
+    )
+    assert response.status_code == 200, response.text
+    previews = response.json()
+    assert len(previews) == len(seeded)
+    for (shoutout_id, comment_ids), times in zip(seeded, comment_times):
+        page = previews[str(shoutout_id)]
+        expected = oldest_first(times, comment_ids)
+        assert [item["id"] for item in page["items"]] == expected[:preview]
+        assert (page["next_cursor"] is not None) == (len(expected) > preview)
+
+        if page["next_cursor"]:
+            rest = client.get(
+                f"/auth/shoutouts/{shoutout_id}/comments",
+                params={"cursor": page["next_cursor"]},
+                headers=headers,
+            ).json()
+            assert [item["id"] for item in rest["items"]] == expected[preview:]
+
+
+def test_previews_refuse_more_than_a_page_of_ids(client, login):
+    headers = login("reader@x.com")
+    ids = list(range(1, settings.FEED_MAX_PAGE_SIZE + 2))
+    response = client.get("/auth/shoutouts/comments", params={"ids": ids}, headers=headers)
+    assert response.status_code == 400
@@ -0,0 +1,246 @@
+"""
+Denormalized engagement counters on ShoutOut: the reaction toggle (the
+single statement on Postgres, row by row on SQLite), migration 0003's
+duplicate cleanup and the counter rebuild.
+
+Postgres cases run in a scratch database on TEST_DATABASE_URL's server and
+are skipped without one.
+"""
+import asyncio
+
+import pytest
+from alembic import command
+from fastapi import HTTPException
+from sqlalchemy import func, select, text, update
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from app import counters, database
+from app.config import settings
+from app.database import Base
+from app.migrate import alembic_config
+from app.models import ShoutOut, ShoutOutChange, ShoutOutReaction, User
+
+
+def post(client, headers, message: str) -> int:
+    response = client.post("/auth/shoutouts", data={"message": message, "tagged_user_ids": ""}, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()["id"]
+
+
+def stored_counts(client, *shoutout_ids: int) -> dict:
+    async def read():
+        async with database.AsyncSessionLocal() as db:
+            query = select(ShoutOut.id, ShoutOut.reaction_counts, ShoutOut.comments_count)
+            result = await db.execute(query.where(ShoutOut.id.in_(shoutout_ids)))
+            return {row.id: (row.reaction_counts, row.comments_count) for row in result}
+
+    return client.portal.call(read)
+
+
+@pytest.fixture(params=["sqlite", "postgresql"])
+def database_url(request, tmp_path):
+    """An empty database on each backend the toggle has a path for."""
+    if request.param == "sqlite":
+        return f"sqlite+aiosqlite:///{tmp_path / 'toggle.sqlite'}"
+    return request.getfixturevalue("postgres_database")
+
+
+def run_on(url: str, steps):
+    """Run `steps(sessionmaker, shoutout_id, user_ids)` on a schema built from the models."""
+
+    async def main():
+        engine = create_async_engine(url, poolclass=NullPool)
+        try:
+            async with engine.begin() as conn:
+                await conn.run_sync(Base.metadata.create_all)
+            sessions = async_sessionmaker(engine, expire_on_commit=False)
+            async with sessions() as db:
+                users = [
+                    User(username=name, email=f"{name}@x.com", password="x", name=name, department="IT")
+                    for name in ("alice", "bob")
+                ]
+                db.add_all(users)
+                await db.flush()
+                shoutout = ShoutOut(message="hi", author_id=users[0].id, department="IT")
+                db.add(shoutout)
+                await db.commit()
+            return await steps(sessions, shoutout.id, [user.id for user in users])
+        finally:
+            await engine.dispose()
+
+    return asyncio.run(main())
+
+
+async def reactions_of(sessions, shoutout_id: int):
+    async with sessions() as db:
+        rows = await db.execute(
+            select(ShoutOutReaction.user_id, ShoutOutReaction.emoji).where(ShoutOutReaction.shoutout_id == shoutout_id)
+        )
+        counts = await db.scalar(select(ShoutOut.reaction_counts).where(ShoutOut.id == shoutout_id))
+        logged = await db.scalar(
+            select(func.count()).select_from(ShoutOutChange).where(ShoutOutChange.kind == "reactions")
+        )
+        return sorted(rows.all()), counts, logged
+
+
+# ---------------------------
+# Reaction toggle
+# ---------------------------
+def test_toggle_adds_switches_and_removes(database_url):
+    async def steps(sessions, shoutout_id, user_ids):
+        alice, bob = user_ids
+
+        async def toggle(user_id, emoji):
+            async with sessions() as db:
+                outcome = await counters.toggle_reaction(db, shoutout_id, user_id, emoji)
+                await db.commit()
+                return outcome
+
+        assert await toggle(alice, "👍") == ("added", "IT", {"👍": 1})
+        assert await toggle(bob, "👍") == ("added", "IT", {"👍": 2})
+        # a different emoji replaces the user's reaction
+        assert await toggle(alice, "🎉") == ("updated", "IT", {"👍": 1, "🎉": 1})
+        # the same emoji takes it back
+        assert await toggle(bob, "👍") == ("removed", "IT", {"🎉": 1})
+        assert await reactions_of(sessions, shoutout_id) == ([(alice, "🎉")], {"🎉": 1}, 4)
+
+    run_on(database_url, steps)
+
+
+def test_toggle_on_a_missing_shoutout_is_a_404(database_url):
+    async def steps(sessions, shoutout_id, user_ids):
+        async with sessions() as db:
+            with pytest.raises(HTTPException) as missing:
+                await counters.toggle_reaction(db, shoutout_id + 1, user_ids[0], "👍")
+        assert missing.value.status_code == 404
+
+    run_on(database_url, steps)
+
+
+def test_concurrent_identical_toggles_leave_one_row(postgres_database):
+    async def steps(sessions, shoutout_id, user_ids):
+        user_id = user_ids[1]
+        first, second = sessions(), sessions()
+        try:
+            assert (await counters.toggle_reaction(first, shoutout_id, user_id, "👍"))[0] == "added"
+            # the second click's statement blocks on the first's uncommitted row...
+            racing = asyncio.create_task(counters.toggle_reaction(second, shoutout_id, user_id, "👍"))
+            await asyncio.sleep(0.3)
+            assert not racing.done()
+            await first.commit()
+            # ...then rechecks it and does nothing, rather than adding a second 👍
+            assert await racing == ("unchanged", "IT", {"👍": 1})
+            await second.commit()
+        finally:
+            await first.close()
+            await second.close()
+        assert await reactions_of(sessions, shoutout_id) == ([(user_id, "👍")], {"👍": 1}, 1)
+
+    run_on(postgres_database, steps)
+
+
+# ---------------------------
+# Migration 0003
+# ---------------------------
+def test_migration_0003_collapses_duplicate_reactions(postgres_database, monkeypatch):
+    monkeypatch.setattr(settings, "DATABASE_URL", postgres_database)
+    config = alembic_config()
+    command.upgrade(config, "0002")
+
+    async def seed_duplicates(sql):
+        engine = create_async_engine(postgres_database, poolclass=NullPool)
+        try:
+            async with engine.begin() as conn:
+                for statement in sql:
+                    await conn.execute(text(statement))
+                return (await conn.execute(text("SELECT id FROM shoutouts"))).scalar()
+        finally:
+            await engine.dispose()
+
+    shoutout_id = asyncio.run(
+        seed_duplicates(
+            [
+                "INSERT INTO users (username, email, password, role, name, department) VALUES "
+                "('a', 'a@x.com', 'x', 'employee', 'A', 'IT'), ('b', 'b@x.com', 'x', 'employee', 'B', 'IT')",
+                "INSERT INTO shoutouts (author_id, message, department, reactions) "
+                "SELECT min(id), 'hi', 'IT', '{\"👍\": 2, \"🎉\": 1}' FROM users",
+                # a racing double click left user a with two rows; the newest (🎉) wins
+                "INSERT INTO shoutout_reactions (shoutout_id, user_id, emoji) "
+                "SELECT s.id, u.id, e.emoji FROM shoutouts s, users u, "
+                "(VALUES (1, '👍'), (2, '🎉')) AS e(n, emoji) WHERE u.username = 'a' ORDER BY e.n",
+                "INSERT INTO shoutout_reactions (shoutout_id, user_id, emoji) "
+                "SELECT s.id, u.id, '👍' FROM shoutouts s, users u WHERE u.username = 'b'",
+            ]
+        )
+    )
+
+    command.upgrade(config, "0003")
+
+    async def after():
+        engine = create_async_engine(postgres_database, poolclass=NullPool)
+        try:
+            async with engine.connect() as conn:
+                rows = await conn.execute(
+                    text(
+                        "SELECT u.username, r.emoji FROM shoutout_reactions r JOIN users u ON u.id = r.user_id "
+                        "ORDER BY u.username"
+                    )
+                )
+                counts = await conn.execute(text("SELECT reactions FROM shoutouts WHERE id = :id"), {"id": shoutout_id})
+                constraints = await conn.execute(
+                    text(
+                        "SELECT conname FROM pg_constraint "
+                        "WHERE conrelid = 'shoutout_reactions'::regclass AND contype = 'u'"
+                    )
+                )
+                return rows.all(), counts.scalar(), constraints.scalars().all()
+        finally:
+            await engine.dispose()
+
+    rows, counts, constraints = asyncio.run(after())
+    assert rows == [("a", "🎉"), ("b", "👍")]
+    assert counts == {"👍": 1, "🎉": 1}
+    assert constraints == ["uq_shoutout_reactions_shoutout_id_user_id"]
+
+
+# ---------------------------
+# Repair
+# ---------------------------
+def test_rebuild_restores_drifted_counters(client, login, capsys):
+    alice, bob = login("alice@x.com"), login("bob@x.com")
+    first, second = post(client, alice, "first"), post(client, alice, "second")
+    client.post(f"/auth/shoutouts/{first}/react", json={"emoji": "👍"}, headers=alice)
+    client.post(f"/auth/shoutouts/{first}/react", json={"emoji": "🎉"}, headers=bob)
+    client.post(f"/auth/shoutouts/{first}/comments", json={"content": "nice"}, headers=bob)
+    client.post(f"/auth/shoutouts/{second}/comments", json={"content": "yes"}, headers=alice)
+    correct = {first: ({"👍": 1, "🎉": 1}, 1), second: ({}, 1)}
+    assert stored_counts(client, first, second) == correct
+
+    async def drift():
+        async with database.AsyncSessionLocal() as db:
+            await db.execute(update(ShoutOut).values(reaction_counts={"👍": 9, "😢": 2}, comments_count=7))
+            await db.commit()
+
+    client.portal.call(drift)
+    drifted = ({"👍": 9, "😢": 2}, 7)
+    assert stored_counts(client, first, second) == {first: drifted, second: drifted}
+
+    # `python -m app.counters`
+    client.portal.call(counters.main)
+    assert "Rebuilt engagement counters for 2 shoutouts" in capsys.readouterr().out
+    assert stored_counts(client, first, second) == correct
+
+
+def test_rebuild_can_be_limited_to_some_shoutouts(client, login):
+    headers = login("alice@x.com")
+    first, second = post(client, headers, "first"), post(client, headers, "second")
+
+    async def drift_and_rebuild_first():
+        async with database.AsyncSessionLocal() as db:
+            await db.execute(update(ShoutOut).values(comments_count=3))
+            await db.commit()
+            return await counters.rebuild_engagement_counters(db, [first])
+
+    assert client.portal.call(drift_and_rebuild_first) == 1
+    assert stored_counts(client, first, second) == {first: ({}, 0), second: ({}, 3)}
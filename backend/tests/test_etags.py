@@ -0,0 +1,63 @@
+"""
+Conditional GETs with strong ETags on the SQLite app.
+"""
+import pytest
+
+
+def post(client, headers, message: str) -> int:
+    response = client.post("/auth/shoutouts", data={"message": message, "tagged_user_ids": ""}, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()["id"]
+
+
+def assert_not_modified(response, tag: str) -> None:
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["ETag"] == tag
+    assert response.headers["Cache-Control"] == "private, no-cache"
+
+
+@pytest.mark.parametrize("path", ["/auth/shoutouts/feed", "/auth/leaderboard", "/notifications/"])
+def test_matching_if_none_match_gets_an_empty_304(client, login, path):
+    headers = login("etag@x.com")
+    post(client, headers, "hello")
+    first = client.get(path, headers=headers)
+    assert first.status_code == 200
+    tag = first.headers["ETag"]
+    assert tag.startswith('"') and tag.endswith('"')
+
+    assert_not_modified(client.get(path, headers={**headers, "If-None-Match": tag}), tag)
+    # weak comparison, and any entry of a list
+    assert_not_modified(client.get(path, headers={**headers, "If-None-Match": f'"other", W/{tag}'}), tag)
+    assert client.get(path, headers={**headers, "If-None-Match": '"other"'}).status_code == 200
+
+
+def test_feed_and_leaderboard_tags_change_with_writes(client, login):
+    headers = login("etag@x.com")
+    shoutout_id = post(client, headers, "hello")
+    paths = ("/auth/shoutouts/feed", "/auth/leaderboard")
+    tags = {path: client.get(path, headers=headers).headers["ETag"] for path in paths}
+
+    client.post(f"/auth/shoutouts/{shoutout_id}/react", json={"emoji": "👍"}, headers=headers)
+    for path, tag in tags.items():
+        response = client.get(path, headers={**headers, "If-None-Match": tag})
+        assert response.status_code == 200, path
+        assert response.headers["ETag"] != tag
+
+
+def test_feed_tag_varies_by_department_and_page(client, login):
+    it, hr = login("it@x.com"), login("hr@x.com", department="HR")
+    tag = client.get("/auth/shoutouts/feed", headers=it).headers["ETag"]
+    assert client.get("/auth/shoutouts/feed", headers={**hr, "If-None-Match": tag}).status_code == 200
+    smaller = client.get("/auth/shoutouts/feed", params={"limit": 5}, headers={**it, "If-None-Match": tag})
+    assert smaller.status_code == 200
+
+
+def test_notifications_tag_changes_when_one_is_added(client, login):
+    headers = login("etag@x.com")
+    tag = client.get("/notifications/", headers=headers).headers["ETag"]
+    created = client.post("/notifications/", json={"message": "ping"}, headers=headers)
+    assert created.status_code == 200, created.text
+    response = client.get("/notifications/", headers={**headers, "If-None-Match": tag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != tag
@@ -0,0 +1,157 @@
+"""
+The shoutout feed on the SQLite app: keyset pagination and the
+per-department first-page cache.
+"""
+from datetime import datetime
+
+import pytest
+from cachetools import TTLCache
+
+from app import changes, database
+from app.config import settings
+from app.feed_cache import FeedCache, feed_cache
+from app.models import ShoutOut
+
+
+def post(client, headers, message: str) -> int:
+    response = client.post("/auth/shoutouts", data={"message": message, "tagged_user_ids": ""}, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()["id"]
+
+
+def first_page(client, headers) -> dict:
+    response = client.get("/auth/shoutouts/feed", headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def seed(client, author_id: int, created_at: list) -> list:
+    """Insert shoutouts with the given created_at values; returns their ids."""
+
+    async def insert():
+        async with database.AsyncSessionLocal() as db:
+            rows = [
+                ShoutOut(message=f"m{n}", author_id=author_id, department="IT", created_at=at)
+                for n, at in enumerate(created_at)
+            ]
+            db.add_all(rows)
+            await db.commit()
+            return [row.id for row in rows]
+
+    return client.portal.call(insert)
+
+
+# ---------------------------
+# Keyset pagination
+# ---------------------------
+def test_pages_are_disjoint_and_complete_across_equal_timestamps(client, login):
+    headers = login("reader@x.com")
+    author_id = client.get("/auth/me", headers=headers).json()["id"]
+    tie = datetime(2026, 1, 2, 12, 0, 0)
+    created_at = [datetime(2026, 1, 1), tie, tie, tie, tie, datetime(2026, 1, 3), tie]
+    ids = seed(client, author_id, created_at)
+    # newest first, ties broken by the higher id
+    expected = [row_id for _, row_id in sorted(zip(created_at, ids), reverse=True)]
+
+    seen, pages, cursor = [], 0, None
+    while True:
+        params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+        page = client.get("/auth/shoutouts/feed", params=params, headers=headers).json()
+        pages += 1
+        seen += [item["id"] for item in page["items"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+    assert seen == expected
+    assert pages == 4
+
+
+def test_page_size_is_clamped_to_the_maximum(client, login, monkeypatch):
+    headers = login("reader@x.com")
+    author_id = client.get("/auth/me", headers=headers).json()["id"]
+    seed(client, author_id, [datetime(2026, 1, day) for day in range(1, 6)])
+    monkeypatch.setattr(settings, "FEED_MAX_PAGE_SIZE", 3)
+
+    page = client.get("/auth/shoutouts/feed", params={"limit": 50}, headers=headers).json()
+    assert len(page["items"]) == 3
+    assert page["next_cursor"] is not None
+    assert client.get("/auth/shoutouts/feed", params={"limit": 0}, headers=headers).status_code == 422
+
+
+@pytest.mark.parametrize("cursor", ["not-a-cursor", "!!!!", "MjAyNi0wMS0wMXxub3QtYW4taWQ"])
+def test_malformed_cursor_is_a_400(client, login, cursor):
+    headers = login("reader@x.com")
+    response = client.get("/auth/shoutouts/feed", params={"cursor": cursor}, headers=headers)
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid cursor"
+
+
+# ---------------------------
+# First-page cache
+# ---------------------------
+def test_repeat_reads_hit_and_writes_invalidate(client, login):
+    headers = login("reader@x.com")
+    post(client, headers, "first")
+    hits, misses = feed_cache.hits, feed_cache.misses
+
+    assert [item["message"] for item in first_page(client, headers)["items"]] == ["first"]
+    assert (feed_cache.hits, feed_cache.misses) == (hits, misses + 1)
+    first_page(client, headers)
+    assert (feed_cache.hits, feed_cache.misses) == (hits + 1, misses + 1)
+
+    # create_shoutout drops the department's page
+    shoutout_id = post(client, headers, "second")
+    assert [item["message"] for item in first_page(client, headers)["items"]] == ["second", "first"]
+    assert feed_cache.misses == misses + 2
+
+    # and so does react_shoutout
+    reacted = client.post(f"/auth/shoutouts/{shoutout_id}/react", json={"emoji": "👍"}, headers=headers)
+    assert reacted.status_code == 200
+    assert first_page(client, headers)["items"][0]["reactions"] == {"👍": 1}
+    assert feed_cache.misses == misses + 3
+
+
+def test_other_departments_keep_their_cached_page(client, login):
+    it, hr = login("it@x.com"), login("hr@x.com", department="HR")
+    first_page(client, hr)
+    post(client, it, "IT only")
+    hits = feed_cache.hits
+
+    assert first_page(client, hr)["items"] == []
+    assert feed_cache.hits == hits + 1
+
+
+def test_write_from_another_worker_shows_once_the_version_is_reread(client, login, monkeypatch):
+    headers = login("reader@x.com")
+    post(client, headers, "first")
+    first_page(client, headers)
+    author_id = client.get("/auth/me", headers=headers).json()["id"]
+
+    async def write_elsewhere():
+        # committed without touching this process's cache, as another worker would
+        async with database.AsyncSessionLocal() as db:
+            shoutout = ShoutOut(message="elsewhere", author_id=author_id, department="IT")
+            db.add(shoutout)
+            await db.flush()
+            changes.record_change(db, "IT", shoutout.id, changes.CREATED)
+            await db.commit()
+
+    client.portal.call(write_elsewhere)
+    version_hits = feed_cache.version_hits
+    assert [item["message"] for item in first_page(client, headers)["items"]] == ["first"]
+    assert feed_cache.version_hits == version_hits + 1
+
+    # once the remembered version lapses the new change is seen
+    monkeypatch.setattr(feed_cache, "_versions", TTLCache(maxsize=8, ttl=60))
+    assert [item["message"] for item in first_page(client, headers)["items"]] == ["elsewhere", "first"]
+
+
+@pytest.mark.parametrize("version_ttl", [0.0, 5.0])
+def test_version_memo_is_dropped_by_invalidate(version_ttl):
+    cache = FeedCache(maxsize=8, ttl=30, version_ttl=version_ttl)
+    cache.remember_version("IT", 7)
+    assert cache.version("IT") == (7 if version_ttl else None)
+    cache.invalidate("IT")
+    assert cache.version("IT") is None
+    assert cache.stats()["version_ttl_seconds"] == version_ttl
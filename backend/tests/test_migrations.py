@@ -0,0 +1,60 @@
+"""
+Alembic owns the Postgres schema: the migrations must build exactly what
+the models describe, and the app must refuse a database at any other
+revision. Runs in scratch databases on TEST_DATABASE_URL's server.
+"""
+import asyncio
+
+import pytest
+from alembic import command
+from alembic.autogenerate import compare_metadata
+from alembic.runtime.migration import MigrationContext
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+
+from app.config import settings
+from app.database import Base
+from app.migrate import alembic_config, check_schema, expected_head, stored_revision
+
+
+@pytest.fixture
+def database_url(postgres_database, monkeypatch):
+    monkeypatch.setattr(settings, "DATABASE_URL", postgres_database)
+    return postgres_database
+
+
+def on(url: str, work):
+    async def main():
+        engine = create_async_engine(url, poolclass=NullPool)
+        try:
+            return await work(engine)
+        finally:
+            await engine.dispose()
+
+    return asyncio.run(main())
+
+
+async def differences(engine):
+    async with engine.connect() as conn:
+        return await conn.run_sync(
+            lambda sync_conn: compare_metadata(MigrationContext.configure(sync_conn), Base.metadata)
+        )
+
+
+def test_upgrading_an_empty_database_matches_the_models(database_url):
+    command.upgrade(alembic_config(), "head")
+
+    assert on(database_url, differences) == []
+    on(database_url, check_schema)
+
+
+def test_check_schema_refuses_any_other_revision(database_url):
+    with pytest.raises(RuntimeError, match=rf"at revision \(none\) but this build expects {expected_head()}"):
+        on(database_url, check_schema)
+
+    command.upgrade(alembic_config(), "head")
+    command.downgrade(alembic_config(), "-1")
+    previous = on(database_url, stored_revision)
+    assert previous != expected_head()
+    with pytest.raises(RuntimeError, match=rf"at revision {previous} but this build expects {expected_head()}"):
+        on(database_url, check_schema)
@@ -0,0 +1,52 @@
+"""
+Connection pool telemetry, on a throwaway SQLite file.
+"""
+import asyncio
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.config import settings
+from app.pool import instrumented_pool, pool_telemetry
+
+
+def test_overflow_checkouts_are_counted_against_the_configured_limit(tmp_path):
+    async def main():
+        engine = create_async_engine(
+            f"sqlite+aiosqlite:///{tmp_path / 'pool.sqlite'}",
+            poolclass=instrumented_pool("test-overflow"),
+            pool_size=1,
+            max_overflow=2,
+        )
+        try:
+            connections = [await engine.connect() for _ in range(3)]
+            for connection in connections:
+                await connection.execute(text("select 1"))
+            busy = pool_telemetry["test-overflow"].stats()
+            for connection in connections:
+                await connection.close()
+            # dispose() builds a new pool; the telemetry follows it
+            await engine.dispose()
+            async with engine.connect() as connection:
+                await connection.execute(text("select 1"))
+            return busy, pool_telemetry["test-overflow"].stats()
+        finally:
+            await engine.dispose()
+
+    busy, after = asyncio.run(main())
+    assert busy["pool_size"] == 1
+    assert busy["max_overflow"] == 2
+    assert busy["checked_out"] == 3
+    assert busy["overflow"] == 2
+    assert busy["checkouts"] == 3
+    assert busy["overflow_checkouts"] == 2
+    assert after["max_overflow"] == 2
+    assert after["checkouts"] == 4
+
+
+def test_db_pool_metrics_report_the_app_pool(client, login):
+    admin = login("boss@x.com", role="superadmin")
+    primary = client.get("/metrics/db-pool", headers=admin).json()["primary"]
+    assert primary["pool_size"] == settings.DB_POOL_SIZE
+    assert primary["max_overflow"] == settings.DB_MAX_OVERFLOW
+    assert primary["checkouts"] > 0
@@ -0,0 +1,111 @@
+"""
+Per-request SQL accounting: the Server-Timing header and strict mode, on a
+small app of its own that runs a given number of statements per request.
+"""
+import logging
+import re
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.query_accounting import QueryAccountingMiddleware, RequestQueries, instrument_engine, query_accounting
+
+TIMING = re.compile(r'db;dur=(?P<total>[\d.]+);desc="(?P<count>\d+) quer(?:y|ies)", db-slowest;dur=(?P<slowest>[\d.]+)')
+
+
+@pytest.fixture
+def client(monkeypatch):
+    engine = create_async_engine("sqlite+aiosqlite://")
+    instrument_engine(engine)
+    app = FastAPI()
+
+    @app.get("/same/{times}")
+    async def same(times: int):
+        async with engine.connect() as conn:
+            for _ in range(times):
+                await conn.execute(text("SELECT 1"))
+        return {"ran": times}
+
+    @app.get("/distinct/{times}")
+    async def distinct(times: int):
+        async with engine.connect() as conn:
+            for n in range(times):
+                await conn.execute(text(f"SELECT {n}"))
+        return {"ran": times}
+
+    @app.get("/static/{times}")
+    async def static(times: int):
+        return await same(times)
+
+    app.add_middleware(QueryAccountingMiddleware, skip_prefixes=("/static",))
+    monkeypatch.setattr(query_accounting, "strict_mode", "off")
+    monkeypatch.setattr(query_accounting, "max_per_request", 20)
+    monkeypatch.setattr(query_accounting, "max_repeats", 5)
+    with TestClient(app) as test_client:
+        yield test_client
+        test_client.portal.call(engine.dispose)
+
+
+def timing(response) -> dict:
+    match = TIMING.fullmatch(response.headers["Server-Timing"])
+    assert match, response.headers["Server-Timing"]
+    return {"count": int(match["count"]), "total": float(match["total"]), "slowest": float(match["slowest"])}
+
+
+# ---------------------------
+# Server-Timing
+# ---------------------------
+def test_server_timing_carries_count_total_and_slowest(client):
+    reported = timing(client.get("/same/3"))
+    assert reported["count"] == 3
+    assert 0 <= reported["slowest"] <= reported["total"]
+    assert timing(client.get("/same/1"))["count"] == 1
+    assert "Server-Timing" not in client.get("/static/3").headers
+
+
+def test_slowest_statement_is_remembered():
+    queries = RequestQueries()
+    for statement, seconds in (("SELECT 1", 0.002), ("SELECT 2", 0.005), ("SELECT 1", 0.001)):
+        queries.record(statement, seconds)
+    assert (queries.count, queries.slowest, queries.slowest_seconds) == (3, "SELECT 2", 0.005)
+    assert queries.most_repeated() == ("SELECT 1", 2)
+    assert queries.server_timing() == 'db;dur=8.0;desc="3 queries", db-slowest;dur=5.0'
+
+
+# ---------------------------
+# Strict mode
+# ---------------------------
+def test_log_mode_reports_repeats_over_the_limit(client, monkeypatch, caplog):
+    monkeypatch.setattr(query_accounting, "strict_mode", "log")
+    # Alembic's env.py runs fileConfig, which disables loggers that already exist
+    monkeypatch.setattr(logging.getLogger("app.query_accounting"), "disabled", False)
+    violations = query_accounting.violations
+
+    with caplog.at_level(logging.WARNING, logger="app.query_accounting"):
+        assert client.get("/same/5").status_code == 200
+        assert caplog.records == []
+        response = client.get("/same/6")
+
+    assert response.status_code == 200
+    assert timing(response)["count"] == 6
+    assert query_accounting.violations == violations + 1
+    [record] = caplog.records
+    assert "same statement x6 (limit 5): SELECT 1" in record.getMessage()
+
+
+def test_raise_mode_answers_500(client, monkeypatch):
+    monkeypatch.setattr(query_accounting, "strict_mode", "raise")
+
+    response = client.get("/same/6")
+    assert response.status_code == 500
+    assert response.json()["detail"] == "Query budget exceeded: same statement x6 (limit 5): SELECT 1"
+    assert timing(response)["count"] == 6
+
+    # many distinct statements stay under the repeat limit, but not under the total one
+    assert client.get("/distinct/20").status_code == 200
+    response = client.get("/distinct/21")
+    assert response.status_code == 500
+    assert response.json()["detail"].startswith("Query budget exceeded: 21 queries (limit 20)")
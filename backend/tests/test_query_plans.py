@@ -0,0 +1,224 @@
+"""
+Query-plan regression test for the hot read paths.
+
+Seeds a realistically sized dataset inside a transaction, ANALYZEs it,
+EXPLAINs each hot query, built by the same functions the routes call, and
+fails any that sequentially scans one of the large tables. Everything is
+rolled back afterwards (tables included, when the database was empty), so
+TEST_DATABASE_URL may point at a development database:
+
+    TEST_DATABASE_URL=postgresql+asyncpg://... pytest tests/test_query_plans.py
+
+Skipped without a Postgres TEST_DATABASE_URL.
+"""
+import asyncio
+import json
+import os
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List
+
+import pytest
+from sqlalchemy import func, select, text
+from sqlalchemy.ext.asyncio import AsyncConnection, create_async_engine
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.pool import NullPool
+from sqlalchemy.sql.expression import ClauseElement, Executable
+
+from app import changes, comments, counters, feed, queries, versions
+from app.config import settings
+from app.database import Base
+from app.models import ShoutOut, User
+
+TEST_DATABASE_URL = os.environ.get("TEST_DATABASE_URL", "")
+
+pytestmark = pytest.mark.skipif(
+    not TEST_DATABASE_URL.startswith("postgresql"),
+    reason="set TEST_DATABASE_URL to a Postgres database to check query plans",
+)
+
+# Tables that grow with usage; a Seq Scan on any of them is a regression.
+# users and the other lookup tables stay small enough to scan.
+LARGE_TABLES = {
+    "shoutouts",
+    "shoutout_tags",
+    "shoutout_reactions",
+    "shoutout_comments",
+    "shoutout_changes",
+    "employee_of_month",
+}
+
+DEPARTMENTS = 50
+USERS = 5_000
+SHOUTOUTS = 100_000
+DEPARTMENT = "qp_dept_7"
+
+
+# ---------------------------
+# EXPLAIN construct
+# ---------------------------
+class Explain(Executable, ClauseElement):
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(Explain, "postgresql")
+def _compile_explain(element, compiler, **kw):
+    return "EXPLAIN (FORMAT JSON) " + compiler.process(element.statement, **kw)
+
+
+# ---------------------------
+# Seed data
+# ---------------------------
+SEED = [
+    """
+    INSERT INTO users (id, username, email, password, role, name, department)
+    SELECT :u + g, 'qp_user_' || g, 'qp_user_' || g || '@example.com', 'x', 'employee',
+           'QP User ' || g, 'qp_dept_' || (g % :depts)
+    FROM generate_series(1, :users) AS g
+    """,
+    # authors cycle through the users, so each shoutout lands in its author's department
+    """
+    INSERT INTO shoutouts (id, author_id, message, department, created_at, is_reported, reactions, comments_count)
+    SELECT :s + g, :u + 1 + g % :users, 'query plan check ' || g, 'qp_dept_' || ((1 + g % :users) % :depts),
+           now() - g * interval '1 minute', g % 97 = 0, '{}', 0
+    FROM generate_series(1, :shoutouts) AS g
+    """,
+    """
+    INSERT INTO shoutout_tags (shoutout_id, user_id)
+    SELECT :s + g, :u + 1 + (g * 7 + k) % :users
+    FROM generate_series(1, :shoutouts) AS g, generate_series(1, 2) AS k
+    """,
+    """
+    INSERT INTO shoutout_reactions (shoutout_id, user_id, emoji)
+    SELECT :s + g, :u + 1 + (g * 13 + k) % :users, (ARRAY['👍', '🎉', '❤️'])[1 + k % 3]
+    FROM generate_series(1, :shoutouts) AS g, generate_series(1, 3) AS k
+    """,
+    """
+    INSERT INTO shoutout_comments (shoutout_id, user_id, content, created_at)
+    SELECT :s + g, :u + 1 + (g * 17 + k) % :users, 'comment ' || k, now() - g * interval '1 minute' + k * interval '1 second'
+    FROM generate_series(1, :shoutouts) AS g, generate_series(1, 2) AS k
+    """,
+    """
+    INSERT INTO shoutout_changes (department, shoutout_id, kind, created_at, xid)
+    SELECT department, id, 'created', created_at, id FROM shoutouts WHERE id > :s
+    """,
+    """
+    INSERT INTO employee_of_month (employee_id, month_year, name, department, created_at)
+    SELECT :u + 1 + g % :users, 'month ' || g, 'QP User', 'qp_dept_' || ((1 + g % :users) % :depts),
+           now() - g * interval '1 day'
+    FROM generate_series(1, :depts * 24) AS g
+    """,
+]
+
+
+async def seed(conn: AsyncConnection) -> None:
+    users = (await conn.execute(select(func.coalesce(func.max(User.id), 0)))).scalar()
+    shoutouts = (await conn.execute(select(func.coalesce(func.max(ShoutOut.id), 0)))).scalar()
+    params = {"u": users, "s": shoutouts, "users": USERS, "shoutouts": SHOUTOUTS, "depts": DEPARTMENTS}
+    for statement in SEED:
+        await conn.execute(text(statement), params)
+    await conn.execute(text("ANALYZE"))
+
+
+# ---------------------------
+# Hot queries
+# ---------------------------
+HOT_QUERIES = {
+    "feed first page": lambda p: feed.build_feed_statement(DEPARTMENT, settings.FEED_PAGE_SIZE),
+    "feed next page": lambda p: feed.build_feed_statement(DEPARTMENT, settings.FEED_PAGE_SIZE, p["cursor"]),
+    "feed version": lambda p: versions.build_feed_version_statement(DEPARTMENT),
+    "feed version (all departments)": lambda p: versions.build_feed_version_statement(),
+    "feed changes": lambda p: changes.build_changes_statement(
+        DEPARTMENT, p["since"], changes.horizon(), settings.SYNC_MAX_CHANGES + 1
+    ),
+    "department shoutouts": lambda p: queries.build_moderation_statement(DEPARTMENT),
+    "reported queue": lambda p: queries.build_moderation_statement(DEPARTMENT, reported_only=True),
+    "toggle reaction": lambda p: counters.build_toggle_statement(p["shoutout_id"], p["user_id"], "👍"),
+    "comments": lambda p: comments.build_comments_statement(p["shoutout_id"], settings.COMMENTS_PAGE_SIZE),
+    "comments next page": lambda p: comments.build_comments_statement(
+        p["shoutout_id"], settings.COMMENTS_PAGE_SIZE, p["cursor"]
+    ),
+    "comment previews": lambda p: comments.build_comment_previews_statement(p["page_ids"], settings.COMMENTS_PREVIEW_SIZE),
+    "my posts": lambda p: queries.build_my_posts_statement(p["user_id"]),
+    "metrics given": lambda p: queries.build_given_count_statement(p["user_id"]),
+    "metrics received": lambda p: queries.build_received_count_statement(p["user_id"]),
+    "metrics comments": lambda p: queries.build_comments_count_statement(p["user_id"]),
+    "recent received": lambda p: queries.build_recent_received_statement(p["user_id"], 5),
+    "recent comments": lambda p: queries.build_recent_comments_statement(p["user_id"], 5),
+    "leaderboard": lambda p: queries.build_leaderboard_statement(DEPARTMENT),
+    "employee of the month": lambda p: queries.build_employee_of_month_statement(DEPARTMENT),
+}
+
+
+async def representative_params(conn: AsyncConnection) -> dict:
+    """Ids and positions from the seeded department, the way a request would carry them."""
+    page_ids = (
+        await conn.execute(
+            select(ShoutOut.id)
+            .where(ShoutOut.department == DEPARTMENT)
+            .order_by(ShoutOut.created_at.desc())
+            .limit(settings.FEED_PAGE_SIZE)
+        )
+    ).scalars().all()
+    user_id = (await conn.execute(select(func.min(User.id)).where(User.department == DEPARTMENT))).scalar()
+    since = (await conn.execute(select(func.max(changes.position) - 50))).scalar()
+    return {
+        "page_ids": page_ids,
+        "shoutout_id": page_ids[0],
+        "user_id": user_id,
+        "since": since,
+        "cursor": (datetime.utcnow() - timedelta(days=30), 2**31 - 1),
+    }
+
+
+async def explain_hot_queries() -> Dict[str, dict]:
+    engine = create_async_engine(TEST_DATABASE_URL, poolclass=NullPool)
+    plans = {}
+    try:
+        async with engine.connect() as conn:
+            transaction = await conn.begin()
+            try:
+                await conn.run_sync(Base.metadata.create_all)
+                await seed(conn)
+                params = await representative_params(conn)
+                for name, build in HOT_QUERIES.items():
+                    document = (await conn.execute(Explain(build(params)))).scalar()
+                    if isinstance(document, str):
+                        document = json.loads(document)
+                    plans[name] = document[0]["Plan"]
+            finally:
+                await transaction.rollback()
+    finally:
+        await engine.dispose()
+    return plans
+
+
+def _nodes(plan: dict) -> Iterator[dict]:
+    yield plan
+    for child in plan.get("Plans", ()):
+        yield from _nodes(child)
+
+
+def seq_scans(plan: dict) -> List[str]:
+    """Large tables the plan reads with a sequential scan."""
+    return [
+        node["Relation Name"]
+        for node in _nodes(plan)
+        if node["Node Type"] == "Seq Scan" and node.get("Relation Name") in LARGE_TABLES
+    ]
+
+
+# ---------------------------
+# Tests
+# ---------------------------
+@pytest.fixture(scope="module")
+def plans() -> Dict[str, dict]:
+    return asyncio.run(explain_hot_queries())
+
+
+@pytest.mark.parametrize("name", HOT_QUERIES)
+def test_hot_query_avoids_seq_scans(plans, name):
+    scanned = sorted(set(seq_scans(plans[name])))
+    assert not scanned, f"{name}: sequential scan on {', '.join(scanned)}"
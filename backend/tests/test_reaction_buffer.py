@@ -0,0 +1,204 @@
+"""
+The reaction write-coalescing buffer: the toggle algebra on its own, and
+flushing into Postgres (the batched write is Postgres-only SQL; these run
+in a scratch database on TEST_DATABASE_URL's server and are skipped
+without one).
+"""
+import asyncio
+import itertools
+import json
+import time
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from app import counters, reaction_buffer as buffering
+from app.broker import broker
+from app.database import Base
+from app.models import ShoutOut, ShoutOutReaction, User
+from app.reaction_buffer import PendingToggle, ReactionBuffer, _click
+
+EMOJIS = ("👍", "🎉", "❤️")
+STATES = (None, *EMOJIS)
+
+
+def compose(clicks) -> PendingToggle:
+    pending = PendingToggle(clicks[0])
+    for emoji in clicks[1:]:
+        pending.click(emoji)
+    return pending
+
+
+def replay(state, clicks):
+    for emoji in clicks:
+        state = _click(state, emoji)
+    return state
+
+
+# ---------------------------
+# Toggle algebra
+# ---------------------------
+@pytest.mark.parametrize(
+    "clicks, outcomes",
+    [
+        # from no reaction, from 👍, from 🎉
+        (["👍", "👍"], (None, "👍", None)),  # a double click leaves 👍 where it found it
+        (["👍", "🎉"], ("🎉", "🎉", "🎉")),  # the last of two different emojis wins
+        (["👍", "👍", "🎉"], ("🎉", "🎉", "🎉")),
+        (["👍"], ("👍", None, "👍")),
+    ],
+)
+def test_composed_clicks(clicks, outcomes):
+    pending = compose(clicks)
+    assert tuple(pending.resolve(state) for state in (None, "👍", "🎉")) == outcomes
+
+
+def test_composition_matches_clicking_one_at_a_time():
+    for length in range(1, 5):
+        for clicks in itertools.product(EMOJIS, repeat=length):
+            pending = compose(clicks)
+            for state in STATES:
+                assert pending.resolve(state) == replay(state, clicks), (state, clicks)
+
+
+def test_then_appends_later_clicks():
+    for first, second in itertools.product(itertools.product(EMOJIS, repeat=2), itertools.product(EMOJIS, repeat=2)):
+        earlier = compose(first)
+        earlier.then(compose(second))
+        for state in STATES:
+            assert earlier.resolve(state) == replay(state, first + second), (state, first, second)
+
+
+# ---------------------------
+# Flushing (Postgres)
+# ---------------------------
+@pytest.fixture
+def sessions(postgres_database, monkeypatch):
+    """A sessionmaker on a fresh schema, which the buffer's flushes write through."""
+    engine = create_async_engine(postgres_database, poolclass=NullPool)
+
+    async def create():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+    asyncio.run(create())
+    factory = async_sessionmaker(engine, expire_on_commit=False)
+    monkeypatch.setattr(buffering, "AsyncSessionLocal", factory)
+    try:
+        yield factory
+    finally:
+        asyncio.run(engine.dispose())
+
+
+async def seed(sessions, users: int = 3):
+    async with sessions() as db:
+        people = [
+            User(username=f"u{n}", email=f"u{n}@x.com", password="x", name=f"U{n}", department="IT")
+            for n in range(users)
+        ]
+        db.add_all(people)
+        await db.flush()
+        shoutout = ShoutOut(message="hi", author_id=people[0].id, department="IT")
+        db.add(shoutout)
+        await db.commit()
+        return shoutout.id, [person.id for person in people]
+
+
+async def stored(sessions, shoutout_id: int):
+    async with sessions() as db:
+        rows = await db.execute(
+            select(ShoutOutReaction.user_id, ShoutOutReaction.emoji).where(ShoutOutReaction.shoutout_id == shoutout_id)
+        )
+        counts = await db.scalar(select(ShoutOut.reaction_counts).where(ShoutOut.id == shoutout_id))
+        return dict(rows.all()), counts
+
+
+async def until(condition, timeout: float = 5.0) -> None:
+    started = time.monotonic()
+    while not condition():
+        assert time.monotonic() - started < timeout, "timed out"
+        await asyncio.sleep(0.01)
+
+
+def test_flush_writes_one_row_per_user_and_publishes(sessions):
+    async def main():
+        shoutout_id, (a, b, c) = await seed(sessions)
+        buffer = ReactionBuffer(interval_ms=60_000, max_events=1_000)
+        subscription = broker.subscribe("IT")
+        try:
+            buffer.add(shoutout_id, a, "👍")
+            for emoji in ("👍", "🎉"):
+                buffer.add(shoutout_id, b, emoji)
+            for emoji in ("👍", "👍"):
+                buffer.add(shoutout_id, c, emoji)
+
+            assert await buffer.flush() == 3
+            assert await stored(sessions, shoutout_id) == ({a: "👍", b: "🎉"}, {"👍": 1, "🎉": 1})
+            event = json.loads(await subscription.next(1))
+            assert event == {"type": "reactions", "id": shoutout_id, "reactions": {"👍": 1, "🎉": 1}}
+        finally:
+            broker.unsubscribe(subscription)
+        stats = buffer.stats()
+        assert (stats["accepted"], stats["coalesced"], stats["flushes"], stats["flushed"]) == (5, 2, 1, 3)
+        assert await buffer.flush() == 0
+
+    asyncio.run(main())
+
+
+def test_failed_flush_is_requeued_ahead_of_newer_clicks(sessions, monkeypatch):
+    async def main():
+        shoutout_id, (a, _, _) = await seed(sessions)
+        buffer = ReactionBuffer(interval_ms=60_000, max_events=1_000)
+        real_apply = counters.apply_reaction_toggles
+
+        async def fail_once(db, toggles):
+            monkeypatch.setattr(counters, "apply_reaction_toggles", real_apply)
+            buffer.add(shoutout_id, a, "🎉")  # clicked while the failing batch was in flight
+            raise ConnectionError("database went away")
+
+        monkeypatch.setattr(counters, "apply_reaction_toggles", fail_once)
+        buffer.add(shoutout_id, a, "👍")
+        with pytest.raises(ConnectionError):
+            await buffer.flush()
+        assert buffer.stats()["failures"] == 1
+        assert buffer.stats()["buffered"] == 1
+
+        # 👍 then 🎉 ends on 🎉; the other order would have ended on 👍
+        assert await buffer.flush() == 1
+        assert await stored(sessions, shoutout_id) == ({a: "🎉"}, {"🎉": 1})
+
+    asyncio.run(main())
+
+
+def test_max_events_flushes_before_the_interval(sessions):
+    async def main():
+        shoutout_id, users = await seed(sessions)
+        buffer = ReactionBuffer(interval_ms=60_000, max_events=3)
+        buffer.start()
+        try:
+            for user_id in users[:2]:
+                buffer.add(shoutout_id, user_id, "👍")
+            await asyncio.sleep(0.2)
+            assert buffer.stats()["flushes"] == 0
+            buffer.add(shoutout_id, users[2], "👍")
+            await until(lambda: buffer.stats()["flushes"] == 1)
+            assert (await stored(sessions, shoutout_id))[1] == {"👍": 3}
+        finally:
+            await buffer.stop()
+
+    asyncio.run(main())
+
+
+def test_stop_drains_the_buffer(sessions):
+    async def main():
+        shoutout_id, (a, _, _) = await seed(sessions)
+        buffer = ReactionBuffer(interval_ms=60_000, max_events=1_000)
+        buffer.start()
+        buffer.add(shoutout_id, a, "❤️")
+        await buffer.stop()
+        assert not buffer.running
+        assert await stored(sessions, shoutout_id) == ({a: "❤️"}, {"❤️": 1})
+
+    asyncio.run(main())
@@ -0,0 +1,123 @@
+"""
+Image renditions: what render_renditions writes for an image, and the
+backfill command filling image_renditions for stored uploads.
+"""
+import hashlib
+import io
+import os
+
+from PIL import Image
+from sqlalchemy import select
+
+from app import database
+from app.imaging import RENDITION_WIDTHS, render_renditions
+from app.models import ShoutOut, UploadBlob
+from app.renditions import backfill, rendition_pool
+from app.storage import UPLOAD_DIR
+
+
+def image_file(path, size, mode="RGB", fmt="PNG") -> str:
+    Image.new(mode, size, "green").save(path, fmt)
+    return str(path)
+
+
+def widths(dest, filenames: dict) -> dict:
+    sizes = {}
+    for name, filename in filenames.items():
+        with Image.open(os.path.join(dest, filename)) as rendition:
+            assert rendition.format == "WEBP"
+            sizes[name] = rendition.size
+    return sizes
+
+
+# ---------------------------
+# Rendering
+# ---------------------------
+def test_each_rendition_is_resized_to_its_width(tmp_path):
+    source = image_file(tmp_path / "wide.png", (2000, 1000))
+    filenames = render_renditions(source, str(tmp_path), "abc", quality=80)
+
+    assert filenames == {name: f"abc-{width}w.webp" for name, width in RENDITION_WIDTHS}
+    assert widths(tmp_path, filenames) == {"thumb": (160, 80), "card": (480, 240), "large": (960, 480)}
+    assert not list(tmp_path.glob("*.part"))
+
+
+def test_small_images_are_never_upscaled(tmp_path):
+    source = image_file(tmp_path / "small.png", (300, 200), mode="P")
+    filenames = render_renditions(source, str(tmp_path), "abc", quality=80)
+
+    # card and large both collapse into one file at the image's own width
+    assert filenames == {"thumb": "abc-160w.webp", "card": "abc-300w.webp", "large": "abc-300w.webp"}
+    assert widths(tmp_path, filenames) == {"thumb": (160, 107), "card": (300, 200), "large": (300, 200)}
+    assert sorted(path.name for path in tmp_path.glob("*.webp")) == ["abc-160w.webp", "abc-300w.webp"]
+
+
+def test_animated_images_are_left_alone(tmp_path):
+    frames = [Image.new("RGB", (400, 400), color) for color in ("red", "blue")]
+    source = tmp_path / "moving.gif"
+    frames[0].save(source, "GIF", save_all=True, append_images=frames[1:], duration=100, loop=0)
+
+    assert render_renditions(str(source), str(tmp_path), "abc", quality=80) == {}
+    assert not list(tmp_path.glob("*.webp"))
+
+
+# ---------------------------
+# Backfill (python -m app.renditions)
+# ---------------------------
+def store(client, author_id: int, name: str, content: bytes, hashed: bool = True) -> tuple:
+    """Put content in UPLOAD_DIR as an upload and give it a shoutout; returns (shoutout id, image URL)."""
+    digest = hashlib.sha256(content).hexdigest()
+    filename = f"{digest}{os.path.splitext(name)[1]}" if hashed else name
+    with open(os.path.join(UPLOAD_DIR, filename), "wb") as handle:
+        handle.write(content)
+
+    async def insert():
+        async with database.AsyncSessionLocal() as db:
+            if hashed:
+                db.add(UploadBlob(digest=digest, filename=filename, size=len(content), ref_count=1))
+            shoutout = ShoutOut(message=name, author_id=author_id, department="IT", image_url=f"/uploads/{filename}")
+            db.add(shoutout)
+            await db.commit()
+            return shoutout.id
+
+    return client.portal.call(insert), f"/uploads/{filename}"
+
+
+def renditions_of(client, shoutout_id: int):
+    async def read():
+        async with database.AsyncSessionLocal() as db:
+            return await db.scalar(select(ShoutOut.image_renditions).where(ShoutOut.id == shoutout_id))
+
+    return client.portal.call(read)
+
+
+def test_backfill_renders_stored_images_once(client, login):
+    author_id = client.get("/auth/me", headers=login("poster@x.com")).json()["id"]
+    buffer = io.BytesIO()
+    Image.new("RGB", (1200, 600), "orange").save(buffer, "PNG")
+    hashed_id, hashed_url = store(client, author_id, "photo.png", buffer.getvalue())
+    legacy_id, _ = store(client, author_id, "legacy.png", buffer.getvalue(), hashed=False)
+    broken_id, broken_url = store(client, author_id, "broken.png", b"\x89PNG\r\n\x1a\n" + b"\0" * 64)
+    failed_before = rendition_pool.failed
+
+    assert client.portal.call(backfill) == 3
+
+    digest = hashed_url.rsplit("/", 1)[1].split(".")[0]
+    expected = {name: f"/uploads/renditions/{digest}-{width}w.webp" for name, width in RENDITION_WIDTHS}
+    assert renditions_of(client, hashed_id) == expected
+    for url in expected.values():
+        assert client.get(url).status_code == 200
+    assert renditions_of(client, legacy_id)["card"] == "/uploads/renditions/legacy-480w.webp"
+    # unreadable files get {} so the backfill doesn't retry them
+    assert renditions_of(client, broken_id) == {}
+    assert rendition_pool.failed == failed_before + 1
+
+    async def blob_renditions():
+        async with database.AsyncSessionLocal() as db:
+            return dict((await db.execute(select(UploadBlob.filename, UploadBlob.renditions))).all())
+
+    blobs = client.portal.call(blob_renditions)
+    assert blobs[hashed_url.rsplit("/", 1)[1]] == expected
+    assert blobs[broken_url.rsplit("/", 1)[1]] == {}
+
+    assert client.portal.call(backfill) == 0
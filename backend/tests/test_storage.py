@@ -0,0 +1,210 @@
+"""
+Object storage and presigned direct uploads, against moto's in-process S3
+(mock_aws). Uploads are PUT with requests, which moto intercepts; the
+ticket and claim steps run on a throwaway SQLite database.
+
+moto stores a presigned PUT's body without checking it against the signed
+x-amz-checksum-sha256 (S3 itself answers BadDigest), so the mismatched
+body test runs with S3_VERIFY_UPLOADS, the claim-time check for stores
+like it.
+"""
+import asyncio
+import base64
+import hashlib
+import io
+import time
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+import requests
+from fastapi import HTTPException
+from moto import mock_aws
+from PIL import Image
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from app import uploads
+from app.config import settings
+from app.database import Base
+from app.models import UploadBlob
+from app.storage import BlobStorage, LocalStorage, S3Storage
+
+BUCKET = "shoutouts-test"
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    with mock_aws():
+        store = S3Storage(BUCKET, region="us-east-1", access_key_id="testing", secret_access_key="testing")
+        store._client.create_bucket(Bucket=BUCKET)
+        monkeypatch.setattr(uploads, "storage", store)
+        yield store
+
+
+def png(color=(200, 100, 0)) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (32, 32), color).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def put(ticket: dict, body: bytes) -> requests.Response:
+    return requests.request(ticket["method"], ticket["url"], data=body, headers=ticket["headers"])
+
+
+def stage(tmp_path, body: bytes) -> str:
+    path = tmp_path / "upload.part"
+    path.write_bytes(body)
+    return str(path)
+
+
+# ---------------------------
+# Interface
+# ---------------------------
+def test_backends_implement_every_abstract_method(tmp_path):
+    class Partial(BlobStorage):
+        def save(self, key, path, content_type):
+            pass
+
+    with pytest.raises(TypeError):
+        Partial()
+    assert not LocalStorage.__abstractmethods__
+    assert not S3Storage.__abstractmethods__
+    LocalStorage(str(tmp_path))
+
+
+# ---------------------------
+# S3Storage
+# ---------------------------
+def test_save_peek_delete(s3, tmp_path):
+    body = b"0123456789abcdef"
+    path = stage(tmp_path, body)
+    s3.save("a.txt", path, "text/plain")
+
+    assert not (tmp_path / "upload.part").exists()
+    assert s3.exists("a.txt")
+    assert s3.peek("a.txt", 4) == (b"0123", len(body))
+    assert s3.sha256("a.txt") == hashlib.sha256(body).hexdigest()
+    head = s3._client.head_object(Bucket=BUCKET, Key="a.txt")
+    assert head["ContentType"] == "text/plain"
+    assert head["CacheControl"] == "public, max-age=31536000, immutable"
+
+    s3.delete("a.txt")
+    assert not s3.exists("a.txt")
+    assert s3.peek("a.txt", 4) is None
+    assert s3.sha256("a.txt") is None
+    s3.delete("a.txt")  # already gone: no error
+
+
+def test_stale_keys_lists_top_level_objects_written_before_cutoff(s3, tmp_path):
+    for key in ("a.png", "b.png", "renditions/a-160w.webp"):
+        s3.save(key, stage(tmp_path, b"x"), "image/png")
+
+    assert sorted(s3.stale_keys(time.time() + 60)) == ["a.png", "b.png"]
+    assert s3.stale_keys(time.time() - 60) == []
+
+
+# ---------------------------
+# Presigned PUT
+# ---------------------------
+def test_presigned_put_signs_size_and_checksum(s3):
+    body = png()
+    sha256 = hashlib.sha256(body).hexdigest()
+    ticket = s3.presign_put(f"{sha256}.png", "image/png", len(body), sha256)
+
+    checksum = base64.b64encode(hashlib.sha256(body).digest()).decode()
+    assert ticket["method"] == "PUT"
+    assert ticket["headers"]["x-amz-checksum-sha256"] == checksum
+    signed = parse_qs(urlsplit(ticket["url"]).query)["X-Amz-SignedHeaders"][0].split(";")
+    assert {"content-length", "content-type", "x-amz-checksum-sha256"} <= set(signed)
+
+    assert put(ticket, body).status_code == 200
+    assert s3.peek(f"{sha256}.png", 8) == (body[:8], len(body))
+
+
+# ---------------------------
+# Ticket and claim
+# ---------------------------
+def run_with_db(steps):
+    """Run `steps(sessionmaker)` against a fresh schema on the test database."""
+
+    async def main():
+        engine = create_async_engine(settings.DATABASE_URL, poolclass=NullPool)
+        try:
+            async with engine.begin() as conn:
+                await conn.run_sync(Base.metadata.drop_all)
+                await conn.run_sync(Base.metadata.create_all)
+            return await steps(async_sessionmaker(engine, expire_on_commit=False))
+        finally:
+            await engine.dispose()
+
+    return asyncio.run(main())
+
+
+async def ticket_for(sessions, body: bytes) -> dict:
+    async with sessions() as db:
+        return await uploads.upload_ticket(db, "image/png", len(body), hashlib.sha256(body).hexdigest())
+
+
+async def claim(sessions, image_key: str) -> str:
+    async with sessions() as db:
+        url = await uploads.claim_upload(db, image_key)
+        await db.commit()
+    return url
+
+
+async def ref_count(sessions, digest: str):
+    async with sessions() as db:
+        return await db.scalar(select(UploadBlob.ref_count).where(UploadBlob.digest == digest))
+
+
+def test_ticket_claim_and_reclaim_count_references(s3):
+    body = png()
+    digest = hashlib.sha256(body).hexdigest()
+
+    async def steps(sessions):
+        ticket = await ticket_for(sessions, body)
+        assert ticket["image_key"] == f"{digest}.png"
+        assert put(ticket["upload"], body).status_code == 200
+
+        assert await claim(sessions, ticket["image_key"]) == f"/uploads/{digest}.png"
+        assert await ref_count(sessions, digest) == 1
+
+        # stored and referenced: the same bytes need no second upload
+        again = await ticket_for(sessions, body)
+        assert again == {"image_key": f"{digest}.png", "upload": None}
+        await claim(sessions, again["image_key"])
+        assert await ref_count(sessions, digest) == 2
+
+    run_with_db(steps)
+
+
+def test_claim_without_upload_is_refused(s3):
+    body = png()
+
+    async def steps(sessions):
+        ticket = await ticket_for(sessions, body)
+        with pytest.raises(HTTPException) as refused:
+            await claim(sessions, ticket["image_key"])
+        assert refused.value.status_code == 400
+        assert await ref_count(sessions, hashlib.sha256(body).hexdigest()) is None
+
+    run_with_db(steps)
+
+
+def test_claim_rejects_body_that_does_not_match_its_sha256(s3, monkeypatch):
+    monkeypatch.setattr(settings, "S3_VERIFY_UPLOADS", True)
+    body, other = png((200, 100, 0)), png((0, 100, 200))
+    assert len(body) == len(other)
+    digest = hashlib.sha256(body).hexdigest()
+
+    async def steps(sessions):
+        ticket = await ticket_for(sessions, body)
+        put(ticket["upload"], other)  # S3 itself would refuse this PUT
+        with pytest.raises(HTTPException) as refused:
+            await claim(sessions, ticket["image_key"])
+        assert refused.value.status_code == 400
+        assert not s3.exists(ticket["image_key"])
+        assert await ref_count(sessions, digest) is None
+
+    run_with_db(steps)
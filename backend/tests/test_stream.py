@@ -0,0 +1,112 @@
+"""
+The live feed broker and the WebSocket stream on the SQLite app.
+"""
+import asyncio
+import json
+
+from app.broker import RESYNC, FeedBroker, broker
+from app.config import settings
+
+
+# ---------------------------
+# Broker
+# ---------------------------
+def test_full_queue_is_replaced_by_one_resync():
+    async def main():
+        feed_broker = FeedBroker(queue_size=3)
+        slow = feed_broker.subscribe("IT")
+        for n in range(3):
+            feed_broker.publish("IT", {"type": "created", "id": n})
+        assert slow.queue.qsize() == 3
+
+        feed_broker.publish("IT", {"type": "created", "id": 3})
+        feed_broker.publish("IT", {"type": "created", "id": 4})
+
+        # the backlog is gone and resync was queued once; the next event fits behind it
+        assert await slow.next(0.1) == RESYNC
+        assert json.loads(await slow.next(0.1)) == {"type": "created", "id": 4}
+        assert await slow.next(0.01) is None
+        assert slow.overflows == 1
+        assert feed_broker.stats()["overflows"] == 1
+        assert feed_broker.stats()["delivered"] == 4
+
+    asyncio.run(main())
+
+
+def test_publish_only_reaches_the_department():
+    async def main():
+        feed_broker = FeedBroker(queue_size=3)
+        it, hr = feed_broker.subscribe("IT"), feed_broker.subscribe("HR")
+        feed_broker.publish("IT", {"type": "created", "id": 1})
+        feed_broker.publish(None, {"type": "resync"})
+        assert [await it.next(0.1), await it.next(0.1)] == ['{"type": "created", "id": 1}', RESYNC]
+        assert await hr.next(0.1) == RESYNC
+        feed_broker.unsubscribe(it)
+        feed_broker.unsubscribe(hr)
+        assert feed_broker.stats()["subscribers"] == 0
+
+    asyncio.run(main())
+
+
+# ---------------------------
+# WebSocket
+# ---------------------------
+def test_websocket_delivers_events(client, login):
+    headers = login("ws@x.com")
+    token = headers["Authorization"].split()[1]
+
+    with client.websocket_connect(f"/auth/shoutouts/stream?token={token}") as websocket:
+        assert broker.stats()["subscribers"] == 1
+        created = client.post("/auth/shoutouts", data={"message": "hello", "tagged_user_ids": ""}, headers=headers)
+        assert created.status_code == 200, created.text
+        assert websocket.receive_json()["type"] == "created"
+
+
+def test_websocket_unsubscribes_as_soon_as_the_client_closes(client, login, monkeypatch):
+    # no event or heartbeat is due, so only noticing the close can end the handler
+    monkeypatch.setattr(settings, "STREAM_HEARTBEAT_SECONDS", 60.0)
+    token = login("ws@x.com")["Authorization"].split()[1]
+    scope = {
+        "type": "websocket",
+        "asgi": {"version": "3.0"},
+        "scheme": "ws",
+        "path": "/auth/shoutouts/stream",
+        "raw_path": b"/auth/shoutouts/stream",
+        "root_path": "",
+        "query_string": f"token={token}".encode(),
+        "headers": [],
+        "client": ("testclient", 50000),
+        "server": ("testserver", 80),
+        "subprotocols": [],
+    }
+
+    async def connect_then_close():
+        inbox: asyncio.Queue = asyncio.Queue()
+        inbox.put_nowait({"type": "websocket.connect"})
+        sent = []
+
+        async def send(message):
+            sent.append(message["type"])
+
+        handler = asyncio.create_task(client.app(scope, inbox.get, send))
+        await asyncio.wait_for(subscribed(), timeout=5)
+        inbox.put_nowait({"type": "websocket.disconnect", "code": 1000})
+        await asyncio.wait_for(handler, timeout=5)
+        return sent
+
+    async def subscribed():
+        while not broker.stats()["subscribers"]:
+            await asyncio.sleep(0.01)
+
+    assert client.portal.call(connect_then_close) == ["websocket.accept"]
+    assert broker.stats()["subscribers"] == 0
+
+
+def test_websocket_without_token_is_refused(client):
+    from starlette.websockets import WebSocketDisconnect
+
+    try:
+        with client.websocket_connect("/auth/shoutouts/stream"):
+            raise AssertionError("connected without a token")
+    except WebSocketDisconnect as refused:
+        assert refused.code == 1008
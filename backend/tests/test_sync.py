@@ -0,0 +1,193 @@
+"""
+Delta sync (/auth/shoutouts/feed/changes): the diff on the SQLite app,
+token edge cases, and commit-order tailing on Postgres.
+
+The commit-order test needs concurrent transactions, so it runs on a
+Postgres TEST_DATABASE_URL (in a throwaway schema) and is skipped without
+one.
+"""
+import asyncio
+import base64
+import os
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from app import changes, database, feed
+from app.database import Base
+from app.models import ShoutOut, User
+from app.pagination import decode_sync_token, encode_sync_token
+
+TEST_DATABASE_URL = os.environ.get("TEST_DATABASE_URL", "")
+
+
+def post(client, headers, message: str) -> int:
+    response = client.post("/auth/shoutouts", data={"message": message, "tagged_user_ids": ""}, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()["id"]
+
+
+def delta(client, headers, since: str) -> dict:
+    response = client.get("/auth/shoutouts/feed/changes", params={"since": since}, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def sync_token(client, headers) -> str:
+    return client.get("/auth/shoutouts/feed", headers=headers).json()["sync_token"]
+
+
+# ---------------------------
+# Diff
+# ---------------------------
+def test_delta_reports_created_updated_edited_and_deleted(client, login):
+    headers = login("sync@x.com")
+    kept, dropped = post(client, headers, "kept"), post(client, headers, "dropped")
+    token = sync_token(client, headers)
+
+    created = post(client, headers, "new")
+    client.post(f"/auth/shoutouts/{kept}/react", json={"emoji": "👍"}, headers=headers)
+    client.put(f"/auth/{dropped}", json={"message": "edited"}, headers=headers)
+    changed = delta(client, headers, token)
+    assert [item["id"] for item in changed["created"]] == [created]
+    assert [(item["id"], item["message"]) for item in changed["edited"]] == [(dropped, "edited")]
+    assert [(item["id"], item["reactions"]) for item in changed["updated"]] == [(kept, {"👍": 1})]
+    assert changed["reset"] is False
+
+    client.delete(f"/auth/{dropped}", headers=headers)
+    changed = delta(client, headers, changed["sync_token"])
+    assert changed["deleted"] == [dropped]
+    assert changed["created"] == changed["edited"] == changed["updated"] == []
+
+    # nothing since: the same token comes back
+    assert delta(client, headers, changed["sync_token"])["sync_token"] == changed["sync_token"]
+
+
+def test_created_and_deleted_in_one_window_is_only_deleted(client, login):
+    headers = login("sync@x.com")
+    post(client, headers, "first")
+    token = sync_token(client, headers)
+    shoutout_id = post(client, headers, "brief")
+    client.delete(f"/auth/{shoutout_id}", headers=headers)
+
+    changed = delta(client, headers, token)
+    assert changed["deleted"] == [shoutout_id]
+    assert changed["created"] == []
+
+
+# ---------------------------
+# Tokens
+# ---------------------------
+def test_v1_tokens_ask_for_a_reset(client, login):
+    headers = login("sync@x.com")
+    post(client, headers, "first")
+    v1 = base64.urlsafe_b64encode(b"v1|3").decode().rstrip("=")
+    assert decode_sync_token(v1) is None
+    changed = delta(client, headers, v1)
+    assert changed["reset"] is True
+    assert delta(client, headers, changed["sync_token"])["reset"] is False
+
+
+def test_future_token_asks_for_a_reset(client, login):
+    headers = login("sync@x.com")
+    post(client, headers, "first")
+    assert delta(client, headers, encode_sync_token(10**9))["reset"] is True
+
+
+def test_pruned_token_asks_for_a_reset(client, login):
+    headers = login("sync@x.com")
+    post(client, headers, "first")
+    token = sync_token(client, headers)
+    post(client, headers, "second")
+    post(client, headers, "third")
+
+    async def prune_all_but_newest():
+        async with database.AsyncSessionLocal() as db:
+            return await changes.prune_changes(db, older_than=datetime.utcnow() + timedelta(days=1))
+
+    assert client.portal.call(prune_all_but_newest) == 2
+    changed = delta(client, headers, token)
+    assert changed["reset"] is True
+    assert delta(client, headers, changed["sync_token"])["reset"] is False
+
+
+def test_malformed_token_is_a_400(client, login):
+    headers = login("sync@x.com")
+    response = client.get("/auth/shoutouts/feed/changes", params={"since": "v3-garbage"}, headers=headers)
+    assert response.status_code == 400
+
+
+# ---------------------------
+# Commit order (Postgres)
+# ---------------------------
+@pytest.mark.skipif(
+    not TEST_DATABASE_URL.startswith("postgresql"),
+    reason="set TEST_DATABASE_URL to a Postgres database to check commit-order tailing",
+)
+def test_open_transaction_holds_back_later_changes_until_it_commits():
+    schema = f"sync_test_{uuid.uuid4().hex[:8]}"
+
+    async def main():
+        admin = create_async_engine(TEST_DATABASE_URL, poolclass=NullPool)
+        engine = create_async_engine(
+            TEST_DATABASE_URL, poolclass=NullPool, connect_args={"server_settings": {"search_path": schema}}
+        )
+        try:
+            async with admin.begin() as conn:
+                await conn.execute(text(f'CREATE SCHEMA "{schema}"'))
+            async with engine.begin() as conn:
+                await conn.run_sync(Base.metadata.create_all)
+            sessions = async_sessionmaker(engine, expire_on_commit=False)
+            await tail_across_an_open_transaction(sessions)
+        finally:
+            await engine.dispose()
+            async with admin.begin() as conn:
+                await conn.execute(text(f'DROP SCHEMA "{schema}" CASCADE'))
+            await admin.dispose()
+
+    asyncio.run(main())
+
+
+async def tail_across_an_open_transaction(sessions):
+    async def write(db, message: str) -> int:
+        shoutout = ShoutOut(message=message, author_id=author_id, department="IT")
+        db.add(shoutout)
+        await db.flush()
+        changes.record_change(db, "IT", shoutout.id, changes.CREATED)
+        await db.flush()
+        return shoutout.id
+
+    async def read(since: int):
+        async with sessions() as db:
+            return await feed.load_feed_changes(db, "IT", since)
+
+    async with sessions() as db:
+        author = User(username="w", email="w@x.com", password="x", role="employee", name="W", department="IT")
+        db.add(author)
+        await db.flush()
+        author_id = author.id
+        await write(db, "before")
+        await db.commit()
+    async with sessions() as db:
+        token = await changes.current_sync_position(db, "IT")
+
+    slow = sessions()
+    slow_id = await write(slow, "slow")  # takes its transaction id first...
+    async with sessions() as fast:
+        fast_id = await write(fast, "fast")  # ...but commits second
+        await fast.commit()
+
+    # fast is committed, but it sits above the slow transaction's position
+    held = await read(token)
+    assert held.created == [] and held.reset is False
+    token = decode_sync_token(held.sync_token)
+
+    await slow.commit()
+    await slow.close()
+    released = await read(token)
+    assert sorted(item.id for item in released.created) == sorted([slow_id, fast_id])
+    assert released.reset is False
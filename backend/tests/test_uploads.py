@@ -0,0 +1,226 @@
+"""
+Image uploads on the SQLite app with local storage: early rejection,
+content-addressed storage with reference counts and the sweep, and how
+/uploads is served.
+"""
+import io
+import os
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from moto import mock_aws
+from PIL import Image
+from sqlalchemy import func, select
+
+from app import database, uploads
+from app.config import settings
+from app.models import ShoutOut, UploadBlob
+from app.storage import UPLOAD_CACHE_CONTROL, UPLOAD_DIR, S3Storage
+
+
+def png(size=(16, 16), color="red") -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", size, color).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def post_image(client, headers, content: bytes, content_type: str = "image/png", name: str = "pic.png"):
+    return client.post(
+        "/auth/shoutouts",
+        data={"message": "look", "tagged_user_ids": ""},
+        files={"image": (name, content, content_type)},
+        headers=headers,
+    )
+
+
+def stored_rows(client) -> tuple:
+    """(shoutouts, upload_blobs) row counts."""
+
+    async def count():
+        async with database.AsyncSessionLocal() as db:
+            return (
+                await db.scalar(select(func.count()).select_from(ShoutOut)),
+                await db.scalar(select(func.count()).select_from(UploadBlob)),
+            )
+
+    return client.portal.call(count)
+
+
+def upload_dir_files() -> list:
+    return sorted(entry.name for entry in os.scandir(UPLOAD_DIR) if entry.is_file())
+
+
+@pytest.fixture
+def empty_upload_dir(client):
+    for name in upload_dir_files():
+        os.remove(os.path.join(UPLOAD_DIR, name))
+    yield
+
+
+# ---------------------------
+# Rejection
+# ---------------------------
+def test_unsupported_content_type_is_refused_before_reading(client, login, empty_upload_dir):
+    headers = login("poster@x.com")
+    response = post_image(client, headers, png(), content_type="image/svg+xml", name="pic.svg")
+    assert response.status_code == 415
+    assert stored_rows(client) == (0, 0)
+    assert upload_dir_files() == []
+
+
+def test_bytes_that_are_not_an_image_are_refused(client, login, empty_upload_dir):
+    headers = login("poster@x.com")
+    response = post_image(client, headers, b"<html>not a png</html>" * 100)
+    assert response.status_code == 415
+    assert response.json()["detail"] == "Images must be JPEG, PNG, GIF or WebP"
+    assert stored_rows(client) == (0, 0)
+    assert upload_dir_files() == []
+
+
+def test_upload_over_the_limit_is_refused_mid_copy(client, login, empty_upload_dir, monkeypatch):
+    headers = login("poster@x.com")
+    image = png((64, 64), "blue") + os.urandom(4096)  # trailing bytes are still part of the upload
+    monkeypatch.setattr(settings, "UPLOAD_CHUNK_BYTES", 1024)
+    monkeypatch.setattr(settings, "UPLOAD_MAX_BYTES", len(image) - 1)
+
+    response = post_image(client, headers, image)
+    assert response.status_code == 413
+    # the temporary copy had been started; nothing of it survives
+    assert upload_dir_files() == []
+    assert stored_rows(client) == (0, 0)
+
+    monkeypatch.setattr(settings, "UPLOAD_MAX_BYTES", len(image))
+    assert post_image(client, headers, image).status_code == 200
+    assert not [name for name in upload_dir_files() if name.endswith(".part")]
+
+
+# ---------------------------
+# Content addressing and the sweep
+# ---------------------------
+def blobs(client) -> dict:
+    """filename -> (ref_count, renditions) for every upload_blobs row."""
+
+    async def read():
+        async with database.AsyncSessionLocal() as db:
+            rows = await db.execute(select(UploadBlob.filename, UploadBlob.ref_count, UploadBlob.renditions))
+            return {filename: (refs, renditions) for filename, refs, renditions in rows.all()}
+
+    return client.portal.call(read)
+
+
+def until(condition, timeout: float = 30.0) -> None:
+    started = time.monotonic()
+    while not condition():
+        assert time.monotonic() - started < timeout, "timed out"
+        time.sleep(0.05)
+
+
+def test_same_bytes_are_stored_once_and_swept_with_their_renditions(client, login, empty_upload_dir):
+    headers = login("poster@x.com")
+    image = png((640, 320), "purple")
+    first, second = (post_image(client, headers, image).json() for _ in range(2))
+
+    assert first["image_url"] == second["image_url"]
+    filename = first["image_url"].rsplit("/", 1)[1]
+    assert upload_dir_files() == [filename]
+    until(lambda: blobs(client)[filename][1] is not None)
+    refs, renditions = blobs(client)[filename]
+    assert refs == 2
+    rendition_paths = [os.path.join(UPLOAD_DIR, uploads.key_for_url(url)) for url in set(renditions.values())]
+    assert all(os.path.exists(path) for path in rendition_paths)
+
+    for shoutout in (first, second):
+        assert client.delete(f"/auth/{shoutout['id']}", headers=headers).status_code == 200
+    assert blobs(client)[filename][0] == 0
+    # still in its grace period
+    assert client.portal.call(uploads.sweep, 3600) == (0, 0)
+    assert upload_dir_files() == [filename]
+
+    time.sleep(0.01)
+    assert client.portal.call(uploads.sweep, 0) == (1, 0)
+    assert blobs(client) == {}
+    assert upload_dir_files() == []
+    assert not any(os.path.exists(path) for path in rendition_paths)
+
+
+def test_sweep_removes_old_temporaries_only(client, empty_upload_dir):
+    grace = settings.UPLOAD_SWEEP_GRACE_SECONDS
+    old, fresh = (os.path.join(UPLOAD_DIR, f"{name}.part") for name in ("old", "fresh"))
+    for path in (old, fresh):
+        with open(path, "wb") as handle:
+            handle.write(b"partial")
+    stale = time.time() - grace - 60
+    os.utime(old, (stale, stale))
+
+    assert client.portal.call(uploads.sweep, grace) == (0, 1)
+    assert upload_dir_files() == ["fresh.part"]
+
+
+# ---------------------------
+# Serving /uploads
+# ---------------------------
+DIGEST = "ab" * 32
+
+
+def serving(mounted) -> TestClient:
+    app = FastAPI()
+    app.mount("/uploads", mounted, name="uploads")
+    return TestClient(app)
+
+
+@pytest.fixture
+def served_file(tmp_path):
+    content = png((48, 48), "teal")
+    (tmp_path / f"{DIGEST}.png").write_bytes(content)
+    return tmp_path, content
+
+
+def test_upload_files_are_immutable_with_a_name_etag(served_file):
+    directory, content = served_file
+    files = serving(uploads.UploadFiles(directory=str(directory)))
+
+    response = files.get(f"/uploads/{DIGEST}.png")
+    assert response.status_code == 200
+    assert response.content == content
+    assert response.headers["Cache-Control"] == UPLOAD_CACHE_CONTROL == "public, max-age=31536000, immutable"
+    assert response.headers["ETag"] == f'"{DIGEST}"'
+
+    revalidated = files.get(f"/uploads/{DIGEST}.png", headers={"If-None-Match": f'"{DIGEST}"'})
+    assert revalidated.status_code == 304
+    assert revalidated.content == b""
+    assert files.get(f"/uploads/{DIGEST}.png", headers={"If-None-Match": '"other"'}).status_code == 200
+
+    ranged = files.get(f"/uploads/{DIGEST}.png", headers={"Range": "bytes=0-9"})
+    assert ranged.status_code == 206
+    assert ranged.content == content[:10]
+    assert ranged.headers["Content-Range"] == f"bytes 0-9/{len(content)}"
+
+
+def test_accel_redirect_leaves_the_body_to_the_proxy(served_file):
+    directory, _ = served_file
+    files = serving(uploads.UploadFiles(directory=str(directory), accel_redirect_prefix="/_uploads/"))
+
+    response = files.get(f"/uploads/{DIGEST}.png")
+    assert response.status_code == 200
+    assert response.content == b""
+    assert response.headers["X-Accel-Redirect"] == f"/_uploads/{DIGEST}.png"
+    assert response.headers["Content-Type"] == "image/png"
+    assert response.headers["Cache-Control"] == UPLOAD_CACHE_CONTROL
+    assert response.headers["ETag"] == f'"{DIGEST}"'
+    assert files.get(f"/uploads/{DIGEST}.png", headers={"If-None-Match": f'"{DIGEST}"'}).status_code == 304
+    assert files.get("/uploads/missing.png").status_code == 404
+
+
+def test_object_storage_uploads_redirect_permanently(monkeypatch):
+    with mock_aws():
+        store = S3Storage("shoutouts-test", region="us-east-1", public_url="https://cdn.example.com/media/")
+        monkeypatch.setattr(uploads, "storage", store)
+        redirects = serving(uploads.UploadRedirects())
+
+        response = redirects.get(f"/uploads/renditions/{DIGEST}-480w.webp", follow_redirects=False)
+        assert response.status_code == 301
+        assert response.headers["Location"] == f"https://cdn.example.com/media/renditions/{DIGEST}-480w.webp"
+        assert response.headers["Cache-Control"] == UPLOAD_CACHE_CONTROL
+        assert redirects.post(f"/uploads/{DIGEST}.png").status_code == 405
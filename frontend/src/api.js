@@ -20,3 +20,40 @@ api.interceptors.request.use((config) => {
   }
   return config;
 });
+
+// After a write, read from the primary for a few seconds so the change
+// shows up even if the read replica is lagging behind.
+const READ_YOUR_WRITES_MS = 5000;
+let lastWriteAt = 0;
+
+api.interceptors.request.use((config) => {
+  const method = (config.method || "get").toLowerCase();
+  if (method !== "get") {
+    lastWriteAt = Date.now();
+  } else if (Date.now() - lastWriteAt < READ_YOUR_WRITES_MS) {
+    config.headers = config.headers || {};
+    config.headers["X-Read-Your-Writes"] = "1";
+  }
+  return config;
+});
+
+// Send an image straight to object storage (see backend uploads.py). Returns
+// the image_key to post with the shoutout, or null when the server keeps
+// files itself and the image has to go in the multipart form instead.
+export async function uploadImageDirect(file) {
+  if (!window.crypto?.subtle) return null;
+  const digest = await crypto.subtle.digest("SHA-256", await file.arrayBuffer());
+  const sha256 = Array.from(new Uint8Array(digest), (b) => b.toString(16).padStart(2, "0")).join("");
+  try {
+    const { data } = await api.post("/auth/uploads", { content_type: file.type, size: file.size, sha256 });
+    if (data.upload) {
+      // plain fetch: the bucket must not get our Authorization header
+      const res = await fetch(data.upload.url, { method: data.upload.method, headers: data.upload.headers, body: file });
+      if (!res.ok) throw new Error(`Upload to storage failed: ${res.status}`);
+    }
+    return data.image_key;
+  } catch (err) {
+    if (err.response?.status === 501) return null;
+    throw err;
+  }
+}
@@ -1,7 +1,7 @@
 import Navbar from "../components/Navbar";
 import "../styles/Home.scss";
 import { useEffect, useState } from "react";
-import { api } from "../api";
+import { api, uploadImageDirect } from "../api";
 import NotificationSlider from "../components/Stats";
 import { format, render, cancel } from "timeago.js";
 import {
@@ -22,6 +22,23 @@ import {
   FaPrayingHands,
 } from "react-icons/fa";
 
+// Resized WebP copies when the server has rendered them, else the original
+const IMAGE_HOST = "http://127.0.0.1:8000";
+const RENDITION_WIDTHS = { thumb: 160, card: 480, large: 960 };
+
+function imageProps(item) {
+  const renditions = item.image_renditions || {};
+  const srcSet = Object.entries(renditions)
+    // small images share one file between several names; list it once
+    .filter(([name, url], i, all) => RENDITION_WIDTHS[name] && all.findIndex(([, u]) => u === url) === i)
+    .map(([name, url]) => `${IMAGE_HOST}${url} ${RENDITION_WIDTHS[name]}w`)
+    .join(", ");
+  return {
+    src: `${IMAGE_HOST}${renditions.card || item.image_url}`,
+    ...(srcSet && { srcSet, sizes: "(max-width: 600px) 100vw, 480px" }),
+  };
+}
+
 export default function Home() {
   const [user, setUser] = useState({});
   const [appreciationScore, setAppreciationScore] = useState(0);
@@ -37,6 +54,7 @@ export default function Home() {
   const [loading, setLoading] = useState(false);
   const [commentsOpen, setCommentsOpen] = useState({});
   const [commentsMap, setCommentsMap] = useState({});
+  const [commentsCursor, setCommentsCursor] = useState({});
   const [commentInput, setCommentInput] = useState({});
   const [topContributors, setTopContributors] = useState([]);
   const [engagementData, setEngagementData] = useState([]);
@@ -124,12 +142,34 @@ export default function Home() {
   const fetchFeed = async () => {
     try {
       const { data } = await api.get("/auth/shoutouts/feed");
-      setFeed(Array.isArray(data) ? data : []);
+      const items = Array.isArray(data?.items) ? data.items : [];
+      setFeed(items);
+      fetchCommentPreviews(items.filter((s) => s.comments_count > 0).map((s) => s.id));
     } catch (err) {
       console.error("Error fetching feed:", err);
     }
   };
 
+  // ✅ First comments for the whole feed page in one request
+  const fetchCommentPreviews = async (ids) => {
+    if (!ids.length) return;
+    try {
+      const query = ids.map((id) => `ids=${id}`).join("&");
+      const { data } = await api.get(`/auth/shoutouts/comments?${query}`);
+      const items = {};
+      const cursors = {};
+      Object.entries(data || {}).forEach(([id, page]) => {
+        items[id] = page.items;
+        cursors[id] = page.next_cursor;
+      });
+      // comments already loaded (or paged further) win over the preview
+      setCommentsMap((m) => ({ ...items, ...m }));
+      setCommentsCursor((c) => ({ ...cursors, ...c }));
+    } catch (err) {
+      console.error("Error fetching comment previews:", err);
+    }
+  };
+
   // ✅ Fetch Top Contributors (Leaderboard)
   const fetchLeaderboard = async () => {
     try {
@@ -168,7 +208,11 @@ export default function Home() {
       form.append("message", message);
       if (selectedTags.length)
         form.append("tagged_user_ids", selectedTags.join(","));
-      if (imageFile) form.append("image", imageFile);
+      if (imageFile) {
+        const imageKey = await uploadImageDirect(imageFile);
+        if (imageKey) form.append("image_key", imageKey);
+        else form.append("image", imageFile);
+      }
 
       await api.post("/auth/shoutouts", form, {
         headers: { "Content-Type": "multipart/form-data" },
@@ -205,13 +249,28 @@ export default function Home() {
     if (!commentsMap[id]) {
       try {
         const { data } = await api.get(`/auth/shoutouts/${id}/comments`);
-        setCommentsMap((m) => ({ ...m, [id]: data }));
+        setCommentsMap((m) => ({ ...m, [id]: data.items }));
+        setCommentsCursor((c) => ({ ...c, [id]: data.next_cursor }));
       } catch (err) {
         console.error("Error fetching comments:", err);
       }
     }
   };
 
+  const loadMoreComments = async (id) => {
+    const cursor = commentsCursor[id];
+    if (!cursor) return;
+    try {
+      const { data } = await api.get(`/auth/shoutouts/${id}/comments`, {
+        params: { cursor },
+      });
+      setCommentsMap((m) => ({ ...m, [id]: [...(m[id] || []), ...data.items] }));
+      setCommentsCursor((c) => ({ ...c, [id]: data.next_cursor }));
+    } catch (err) {
+      console.error("Error fetching comments:", err);
+    }
+  };
+
   const submitComment = async (id) => {
     const text = (commentInput[id] || "").trim();
     if (!text) return;
@@ -495,7 +554,8 @@ export default function Home() {
 
                   {s.image_url && (
                     <img
-                      src={`http://127.0.0.1:8000${s.image_url}`}
+                      {...imageProps(s)}
+                      loading="lazy"
                       alt="shout"
                       className="image"
                     />
@@ -605,6 +665,15 @@ export default function Home() {
                           </li>
                         ))}
                       </ul>
+                      {commentsCursor[s.id] && (
+                        <button
+                          type="button"
+                          className="comments-more"
+                          onClick={() => loadMoreComments(s.id)}
+                        >
+                          Load more comments
+                        </button>
+                      )}
 
                       <div className="comment-form">
                         <input
@@ -713,7 +782,8 @@ export default function Home() {
                       <div className="message">{p.message}</div>
                       {p.image_url && (
                         <img
-                          src={`http://127.0.0.1:8000${p.image_url}`}
+                          {...imageProps(p)}
+                          loading="lazy"
                           alt="post"
                           className="image"
                         />